@@ -33,13 +33,55 @@ def init_app():
         logger.error(f"初期化中にエラーが発生しました: {e}")
 
 
+# 起動時に存在を確認するテーブルと列（後から追加した列を含む）
+REQUIRED_SCHEMA = {
+    "analysis_history": [
+        "content_hash",
+        "cache_source",
+        "provider",
+        "input_tokens",
+        "output_tokens",
+        "cost",
+        "analyzed_at",
+    ],
+    "analysis_usage": [],
+    "batch_analysis_history": [
+        "input_tokens",
+        "output_tokens",
+        "cost",
+        "budget_exhausted",
+        "status",
+        "processed_count",
+        "error",
+        "updated_at",
+        "completed_at",
+        "options",
+        "owner",
+        "heartbeat_at",
+    ],
+    "batch_analysis_items": [],
+    "batch_analysis_urls": [],
+    "page_snapshots": ["content_text"],
+    "categories": [],
+}
+
+
 def check_tables_exist():
-    """主要テーブルが存在するかチェック"""
+    """主要テーブルと列が存在するかチェック"""
     try:
         from .models.database import engine
 
         inspector = inspect(engine)
-        return "analysis_history" in inspector.get_table_names()
+        table_names = inspector.get_table_names()
+        for table, columns in REQUIRED_SCHEMA.items():
+            if table not in table_names:
+                return False
+
+            column_names = [column["name"] for column in inspector.get_columns(table)]
+            if not all(column in column_names for column in columns):
+                return False
+
+        return True
     except Exception as e:
         logger.error(f"テーブル存在チェック中にエラー: {e}")
         return False
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from .endpoints import analysis, categories, history
+from .endpoints import analysis, categories, history, jobs, usage
 
 # APIルーター
 api_router = APIRouter()
@@ -8,3 +8,5 @@ api_router = APIRouter()
 api_router.include_router(analysis.router, prefix="/analysis", tags=["analysis"])
 api_router.include_router(categories.router, prefix="/reference", tags=["reference"])
 api_router.include_router(history.router, prefix="/analysis/history", tags=["history"])
+api_router.include_router(usage.router, prefix="/analysis/usage", tags=["usage"])
+api_router.include_router(jobs.router, prefix="/analysis/jobs", tags=["jobs"])
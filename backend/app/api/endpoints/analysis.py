@@ -7,9 +7,9 @@ from fastapi import (
     Query,
     BackgroundTasks,
 )
-from typing import List, Optional
-import csv
-import io
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Union
+import json
 import asyncio
 
 from ...models.schema import (
@@ -17,8 +17,12 @@ from ...models.schema import (
     AnalysisResponse,
     BatchAnalysisRequest,
     BatchAnalysisResponse,
+    CacheStatsResponse,
 )
+from ...core.config import settings
 from ...services.analyzer import WebsiteAnalyzer
+from ...services.cache_stats import cache_stats
+from ...utils.csv_reader import CsvFormatError, CsvUrlReader
 
 router = APIRouter()
 analyzer = WebsiteAnalyzer()
@@ -30,12 +34,15 @@ async def analyze_url(
     force_refresh: bool = Query(
         False, description="キャッシュを無視して強制的に再解析する"
     ),
+    timeout: Optional[float] = Query(
+        None, gt=0, description="結果を待つ秒数（超えても解析は継続する）"
+    ),
 ):
     """
     単一のURLを解析する
     """
     url = str(request.url)
-    return await analyzer.analyze_url(url, force_refresh=force_refresh)
+    return await analyzer.analyze_url(url, force_refresh=force_refresh, timeout=timeout)
 
 
 @router.post("/analyze-batch", response_model=BatchAnalysisResponse)
@@ -44,12 +51,22 @@ async def analyze_batch(
     force_refresh: bool = Query(
         False, description="キャッシュを無視して強制的に再解析する"
     ),
+    max_tokens: Optional[int] = Query(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Query(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
 ):
     """
     複数のURLを一括で解析する
     """
     urls = [str(url) for url in request.urls]
-    return await analyzer.analyze_urls_batch(urls, force_refresh=force_refresh)
+    return await analyzer.analyze_urls_batch(
+        urls, force_refresh=force_refresh, max_tokens=max_tokens, max_cost=max_cost
+    )
 
 
 @router.post("/analyze-csv", response_model=BatchAnalysisResponse)
@@ -59,36 +76,218 @@ async def analyze_csv(
     force_refresh: bool = Form(
         False, description="キャッシュを無視して強制的に再解析する"
     ),
+    max_tokens: Optional[int] = Form(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Form(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
 ):
     """
     CSVファイルからURLを読み込んで一括解析する
     """
+    reader = await open_csv_urls(file, column_name)
+
     try:
-        # CSVファイルを読み込む
-        content = await file.read()
-        csv_data = io.StringIO(content.decode('utf-8'))
-        reader = csv.DictReader(csv_data)
-
-        # URL列が存在するか確認
-        if column_name not in reader.fieldnames:
-            raise HTTPException(
-                status_code=400,
-                detail=f"CSV内に'{column_name}'列が見つかりません。列名を確認してください。",
-            )
+        # CSVを読み込みながらURLを一括解析
+        return await analyzer.analyze_urls_batch(
+            reader.urls(),
+            force_refresh=force_refresh,
+            max_tokens=max_tokens,
+            max_cost=max_cost,
+        )
+
+    except CsvFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"CSVファイルの処理中にエラーが発生しました: {str(e)}",
+        )
+
+
+@router.post("/analyze-batch/stream")
+async def analyze_batch_stream(
+    request: BatchAnalysisRequest,
+    format: str = Query(
+        "ndjson", pattern="^(ndjson|sse)$", description="出力形式（ndjson / sse）"
+    ),
+    force_refresh: bool = Query(
+        False, description="キャッシュを無視して強制的に再解析する"
+    ),
+    max_tokens: Optional[int] = Query(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Query(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
+):
+    """
+    複数のURLを一括で解析し、各URLの結果を確定した順に逐次返す
+
+    キャッシュにある結果を先に返し、続いて解析が完了した結果、最後に集計を返す。
+    """
+    urls = [str(url) for url in request.urls]
+    return stream_batch_results(
+        urls,
+        format,
+        force_refresh=force_refresh,
+        max_tokens=max_tokens,
+        max_cost=max_cost,
+    )
 
-        # URLのリストを抽出
-        urls = [row[column_name] for row in reader if row[column_name]]
 
-        if not urls:
-            raise HTTPException(
-                status_code=400, detail="解析対象のURLが見つかりませんでした。"
+@router.post("/analyze-csv/stream")
+async def analyze_csv_stream(
+    file: UploadFile = File(...),
+    column_name: Optional[str] = Form("url"),
+    format: str = Form(
+        "ndjson", pattern="^(ndjson|sse)$", description="出力形式（ndjson / sse）"
+    ),
+    force_refresh: bool = Form(
+        False, description="キャッシュを無視して強制的に再解析する"
+    ),
+    max_tokens: Optional[int] = Form(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Form(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
+):
+    """
+    CSVファイルからURLを読み込んで一括解析し、各URLの結果を確定した順に逐次返す
+    """
+    reader = await open_csv_urls(file, column_name)
+    return stream_batch_results(
+        reader.urls(),
+        format,
+        force_refresh=force_refresh,
+        max_tokens=max_tokens,
+        max_cost=max_cost,
+    )
+
+
+def stream_batch_results(
+    urls: Union[List[str], AsyncIterable[str]], format: str, **options: Any
+) -> StreamingResponse:
+    """
+    一括解析を実行し、結果を NDJSON または Server-Sent Events で逐次返すレスポンスを作成する
+
+    各レコードは {"type": "result", "result": {...}}、最後に {"type": "summary", "summary": {...}}
+    （失敗した場合は {"type": "error", "error": "..."}）。送信待ちの結果は BATCH_STREAM_QUEUE_SIZE 件
+    までとし、クライアントの受信が遅い場合は送信できるまで解析を待たせる（結果をサーバー側に溜めない）。
+
+    Args:
+        urls: 解析対象のURLリスト（または非同期イテレータ）
+        format: 出力形式（ndjson / sse）
+        options: analyze_urls_batch に渡す引数
+
+    Returns:
+        逐次出力するレスポンス
+    """
+    results: asyncio.Queue = asyncio.Queue(
+        maxsize=max(settings.BATCH_STREAM_QUEUE_SIZE, 1)
+    )
+
+    def encode(record_type: str, payload: Any) -> str:
+        data = json.dumps(
+            {"type": record_type, record_type: payload}, ensure_ascii=False
+        )
+        if format == "sse":
+            return f"event: {record_type}\ndata: {data}\n\n"
+        return data + "\n"
+
+    async def run() -> BatchAnalysisResponse:
+        try:
+            # キューに空きができるまで次の結果を確定させない
+            summary = await analyzer.analyze_urls_batch(
+                urls, on_result=results.put, collect_results=False, **options
             )
+        except Exception:
+            await results.put(None)
+            raise
+        # 解析の終了（失敗を含む）をキューで伝える（打ち切られた場合は受信側がいない）
+        await results.put(None)
+        return summary
+
+    async def generate() -> AsyncIterator[str]:
+        task = asyncio.create_task(run())
+
+        try:
+            while True:
+                response = await results.get()
+                if response is None:
+                    break
+                yield encode("result", response.model_dump(mode="json"))
+
+            try:
+                summary: Dict[str, Any] = (await task).model_dump(
+                    mode="json", exclude={"results"}
+                )
+            except Exception as e:
+                yield encode("error", f"一括解析中にエラーが発生しました: {str(e)}")
+            else:
+                yield encode("summary", summary)
+
+        finally:
+            # クライアントが切断した場合は解析を打ち切る
+            if not task.done():
+                task.cancel()
 
-        # URLを一括解析
-        return await analyzer.analyze_urls_batch(urls, force_refresh=force_refresh)
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def open_csv_urls(file: UploadFile, column_name: Optional[str]) -> CsvUrlReader:
+    """
+    アップロードされたCSVファイルからURLの列を読み込む準備をする
+
+    ファイル全体は読み込まず、文字コード（BOM付きUTF-8 / UTF-8 / Shift_JIS）の判定と
+    ヘッダー行の確認、最初のURLの読み込みまでを行う。残りの行は解析しながら読み込む
+    （アップロードされたファイルはレスポンスの送信が終わるまで閉じられない）。
+
+    Args:
+        file: CSVファイル
+        column_name: URLが格納されている列名
+
+    Returns:
+        URLを行の順に返す CsvUrlReader
+    """
+    reader = CsvUrlReader(file.file, column_name, settings.BATCH_INPUT_CHUNK_SIZE)
+    try:
+        await reader.open()
+        has_urls = await reader.has_urls()
+
+    except CsvFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"CSVファイルの処理中にエラーが発生しました: {str(e)}",
         )
+
+    if not has_urls:
+        raise HTTPException(
+            status_code=400, detail="解析対象のURLが見つかりませんでした。"
+        )
+
+    return reader
+
+
+@router.get("/cache-stats", response_model=CacheStatsResponse)
+async def get_cache_stats():
+    """
+    キャッシュ種別ごとのヒット数・ミス数を取得する（プロセス起動後の累計）
+    """
+    return CacheStatsResponse(caches=cache_stats.snapshot())
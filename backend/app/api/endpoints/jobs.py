@@ -0,0 +1,128 @@
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from ...models.schema import (
+    BatchAnalysisRequest,
+    JobResultsResponse,
+    JobStatusResponse,
+    JobSubmitResponse,
+)
+from ...models.database import get_db
+from ...services.job_manager import BatchJobManager
+from ...utils.csv_reader import CsvFormatError
+from .analysis import analyzer, open_csv_urls
+
+router = APIRouter()
+job_manager = BatchJobManager(analyzer)
+
+
+@router.post("", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(
+    request: BatchAnalysisRequest,
+    force_refresh: bool = Query(
+        False, description="キャッシュを無視して強制的に再解析する"
+    ),
+    max_tokens: Optional[int] = Query(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Query(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
+):
+    """
+    複数URLの一括解析をジョブとして登録する（結果を待たずにジョブIDを返す）
+    """
+    urls = [str(url) for url in request.urls]
+    return await job_manager.submit(
+        urls, force_refresh=force_refresh, max_tokens=max_tokens, max_cost=max_cost
+    )
+
+
+@router.post("/csv", response_model=JobSubmitResponse, status_code=202)
+async def submit_csv_job(
+    file: UploadFile = File(...),
+    column_name: Optional[str] = Form("url"),
+    force_refresh: bool = Form(
+        False, description="キャッシュを無視して強制的に再解析する"
+    ),
+    max_tokens: Optional[int] = Form(
+        None, ge=1, description="AI APIのトークン数の上限（達した時点で解析を打ち切る）"
+    ),
+    max_cost: Optional[float] = Form(
+        None,
+        gt=0,
+        description="AI APIのコスト（USD）の上限（達した時点で解析を打ち切る）",
+    ),
+):
+    """
+    CSVファイルから読み込んだURLの一括解析をジョブとして登録する
+    """
+    reader = await open_csv_urls(file, column_name)
+    try:
+        # 読み込んだURLは順に保存し、ジョブは保存したURLを読み込みながら実行する
+        return await job_manager.submit(
+            reader.urls(),
+            force_refresh=force_refresh,
+            max_tokens=max_tokens,
+            max_cost=max_cost,
+        )
+
+    except CsvFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"CSVファイルの処理中にエラーが発生しました: {str(e)}",
+        )
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str, db: Session = Depends(get_db)):
+    """
+    ジョブの状態と進捗（処理済み件数・成功数・失敗数）を取得する
+    """
+    status = await BatchJobManager.get_job_status(db, job_id)
+    if not status:
+        raise HTTPException(
+            status_code=404, detail=f"ジョブID '{job_id}' が見つかりません"
+        )
+    return status
+
+
+@router.post("/{job_id}/resume", response_model=JobSubmitResponse, status_code=202)
+async def resume_job(job_id: str):
+    """
+    中断・失敗したジョブを再開する（結果が確定していないURLのみを解析する）
+    """
+    try:
+        resumed = job_manager.resume(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if not resumed:
+        raise HTTPException(
+            status_code=404, detail=f"ジョブID '{job_id}' が見つかりません"
+        )
+    return resumed
+
+
+@router.get("/{job_id}/results", response_model=JobResultsResponse)
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="取得開始位置"),
+    limit: int = Query(100, ge=1, le=1000, description="取得件数"),
+    db: Session = Depends(get_db),
+):
+    """
+    ジョブの結果を入力の順に取得する（実行中の場合は保存済みの途中結果）
+    """
+    results = await BatchJobManager.get_job_results(db, job_id, offset, limit)
+    if not results:
+        raise HTTPException(
+            status_code=404, detail=f"ジョブID '{job_id}' が見つかりません"
+        )
+    return results
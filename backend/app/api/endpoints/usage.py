@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Query
+from typing import List
+from sqlalchemy.orm import Session
+
+from ...models.schema import BatchUsage, DailyUsage, ProviderUsage
+from ...models.database import get_db
+from ...services.usage_service import UsageService
+
+router = APIRouter()
+
+
+@router.get("/daily", response_model=List[DailyUsage])
+async def get_daily_usage(
+    days: int = Query(30, ge=1, le=365, description="集計対象の日数"),
+    db: Session = Depends(get_db),
+):
+    """
+    日別・プロバイダ別のAI APIのトークン使用量とコストを取得する
+    """
+    return await UsageService.get_daily_usage(db, days)
+
+
+@router.get("/providers", response_model=List[ProviderUsage])
+async def get_provider_usage(
+    days: int = Query(30, ge=1, le=365, description="集計対象の日数"),
+    db: Session = Depends(get_db),
+):
+    """
+    プロバイダ別のAI APIのトークン使用量とコストを取得する
+    """
+    return await UsageService.get_provider_usage(db, days)
+
+
+@router.get("/batches", response_model=List[BatchUsage])
+async def get_batch_usage(
+    limit: int = Query(20, ge=1, le=100, description="取得する件数"),
+    db: Session = Depends(get_db),
+):
+    """
+    一括解析ごとのAI APIのトークン使用量とコストを取得する
+    """
+    return await UsageService.get_batch_usage(db, limit)
@@ -4,7 +4,10 @@ from sqlalchemy import (
     Float,
     DateTime,
     Boolean,
+    Integer,
     JSON,
+    Text,
+    ForeignKey,
     create_engine,
     func,
 )
@@ -46,6 +49,18 @@ class AnalysisHistory(Base):
     analysis = Column(JSON, nullable=True)
     is_batch = Column(Boolean, default=False)
     batch_id = Column(String, nullable=True, index=True)
+    # 抽出テキストの正規化ハッシュ（同一内容のURL間で解析結果を再利用するため）
+    content_hash = Column(String, nullable=True, index=True)
+    # キャッシュから再利用した場合の取得元（content_hash など）。AIで解析した場合はNone
+    cache_source = Column(String, nullable=True)
+    # 回答に使用したAIのプロバイダと、AI API呼び出しのトークン使用量・コスト（USD）の合計
+    # （プロバイダごとの内訳は analysis_usage）。AIを呼び出していない場合はNone
+    provider = Column(String, nullable=True, index=True)
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    cost = Column(Float, nullable=True)
+    # 解析した日時（timestamp と異なり再検証で更新しない。使用量の集計に使用）
+    analyzed_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         """モデルを辞書に変換"""
@@ -58,6 +73,11 @@ class AnalysisHistory(Base):
             "confidence": self.confidence,
             "is_batch": self.is_batch,
             "batch_id": self.batch_id,
+            "cache_source": self.cache_source,
+            "provider": self.provider,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost,
         }
 
         if self.status == "failed":
@@ -81,3 +101,114 @@ class AnalysisHistory(Base):
 
     def __repr__(self):
         return f"<AnalysisHistory(id={self.id}, url={self.url}, status={self.status})>"
+
+
+# 解析履歴ごとのプロバイダ別のトークン使用量テーブルのORM定義（使用量の集計に使用）
+class AnalysisUsage(Base):
+    __tablename__ = "analysis_usage"
+
+    analysis_id = Column(
+        String,
+        ForeignKey("analysis_history.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    provider = Column(String, primary_key=True, index=True)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return (
+            f"<AnalysisUsage(analysis_id={self.analysis_id}, provider={self.provider})>"
+        )
+
+
+# 一括解析履歴テーブルのORM定義
+class BatchAnalysisHistory(Base):
+    __tablename__ = "batch_analysis_history"
+
+    batch_id = Column(String, primary_key=True, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    total_urls = Column(Integer, nullable=False)
+    success_count = Column(Integer, nullable=False)
+    failed_count = Column(Integer, nullable=False)
+    # 一括解析全体のトークン使用量・コスト（USD）
+    input_tokens = Column(Integer, nullable=True)
+    output_tokens = Column(Integer, nullable=True)
+    cost = Column(Float, nullable=True)
+    # トークン数・コストの上限に達して解析しなかったURLがあるかどうか
+    budget_exhausted = Column(Boolean, default=False)
+    # ジョブとしての状態（queued / running / completed / failed）と進捗
+    status = Column(String, default="completed", index=True)
+    processed_count = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    # 再開時に使用する実行時の指定（force_refresh / max_tokens / max_cost）
+    options = Column(JSON, nullable=True)
+    # 実行中のプロセスと、そのプロセスが最後に実行中であることを記録した日時（リース）
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<BatchAnalysisHistory(batch_id={self.batch_id}, total_urls={self.total_urls})>"
+
+
+# 一括解析と解析履歴の関連付けテーブルのORM定義
+class BatchAnalysisItem(Base):
+    __tablename__ = "batch_analysis_items"
+
+    batch_id = Column(
+        String,
+        ForeignKey("batch_analysis_history.batch_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    analysis_id = Column(
+        String,
+        ForeignKey("analysis_history.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    def __repr__(self):
+        return f"<BatchAnalysisItem(batch_id={self.batch_id}, analysis_id={self.analysis_id})>"
+
+
+# 一括解析の各URLの進捗テーブルのORM定義（再開時は結果が確定していないURLのみ解析する）
+class BatchAnalysisUrl(Base):
+    __tablename__ = "batch_analysis_urls"
+
+    batch_id = Column(
+        String,
+        ForeignKey("batch_analysis_history.batch_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # 入力内での位置
+    position = Column(Integer, primary_key=True)
+    url = Column(String, nullable=False)
+    # pending / success / failed
+    status = Column(String, nullable=False, default="pending")
+    analysis_id = Column(
+        String, ForeignKey("analysis_history.id", ondelete="SET NULL"), nullable=True
+    )
+
+    def __repr__(self):
+        return f"<BatchAnalysisUrl(batch_id={self.batch_id}, position={self.position}, status={self.status})>"
+
+
+# ページの検証子（ETag/Last-Modified）とコンテンツハッシュを保持するテーブルのORM定義
+class PageSnapshot(Base):
+    __tablename__ = "page_snapshots"
+
+    url = Column(String, primary_key=True, index=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    # ローカル分類器の学習用の抽出テキスト（プロンプトと同じ形式、上限付き）
+    content_text = Column(Text, nullable=True)
+    history_id = Column(
+        String, ForeignKey("analysis_history.id", ondelete="SET NULL"), nullable=True
+    )
+    checked_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PageSnapshot(url={self.url}, etag={self.etag}, history_id={self.history_id})>"
@@ -31,6 +31,23 @@ class AnalysisResponse(BaseModel):
     analysis: Optional[CategoryAnalysis] = None
     error: Optional[str] = None
     from_cache: Optional[bool] = None
+    # 結果を保存した解析履歴のID（一括解析との関連付けに使用し、レスポンスには含めない）
+    history_id: Optional[str] = Field(default=None, exclude=True)
+
+
+class PipelineStageStats(BaseModel):
+    workers: int
+    processed: int
+    errors: int = 0
+    batches: int = 0
+    # 処理件数/秒
+    throughput: float
+    # 1回（まとめた場合は1バッチ）あたりの平均処理時間（秒）
+    avg_seconds: float
+    # ワーカーが処理中だった時間の割合
+    utilization: float
+    # 入力キューの最大長
+    max_queue: int
 
 
 class BatchAnalysisResponse(BaseModel):
@@ -38,6 +55,21 @@ class BatchAnalysisResponse(BaseModel):
     total: int
     success: int
     failed: int
+    batch_id: Optional[str] = None
+    # 正規化後のURLで重複を除いた件数と、重複していたため結果を共有した件数・その割合
+    # （CSVなどを読み込みながら解析する場合は、結果が確定する前に現れた重複のみ数える）
+    unique_urls: int = 0
+    duplicate_urls: int = 0
+    dedup_ratio: float = 0.0
+    # AI API呼び出しのトークン使用量とコスト（USD）
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    # トークン数・コストの上限に達して解析しなかったURLの数
+    skipped: int = 0
+    budget_exhausted: bool = False
+    # 一括解析のパイプライン（取得・抽出・判定・保存）の段ごとの処理状況
+    stages: Dict[str, PipelineStageStats] = {}
 
 
 class HistoryItem(BaseModel):
@@ -50,6 +82,11 @@ class HistoryItem(BaseModel):
     is_batch: bool = False
     batch_id: Optional[str] = None
     error: Optional[str] = None
+    cache_source: Optional[str] = None
+    provider: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cost: Optional[float] = None
 
 
 class HistoryListResponse(BaseModel):
@@ -62,3 +99,85 @@ class HistoryListResponse(BaseModel):
 
 class HistoryDetailResponse(HistoryItem):
     analysis: Optional[CategoryAnalysis] = None
+
+
+class JobResultItem(HistoryDetailResponse):
+    # 入力内での位置（url は解析履歴の正規化URLではなく、入力されたURL）
+    position: int
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    total_urls: int
+    # 再開時に解析する、結果が確定していないURLの数
+    pending_urls: Optional[int] = None
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    # queued / running / completed / failed
+    status: str
+    total_urls: int
+    processed: int
+    success: int
+    failed: int
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    budget_exhausted: bool = False
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+
+class JobResultsResponse(BaseModel):
+    job_id: str
+    status: str
+    # 結果が確定したURLの件数（入力の行ごと。同じ解析結果を共有したURLもそれぞれ数える）
+    total: int
+    offset: int
+    limit: int
+    results: List[JobResultItem]
+
+
+class CacheCounter(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    # プロンプトキャッシュなど、トークン単位で集計するキャッシュの読み書き量
+    read_tokens: int = 0
+    write_tokens: int = 0
+
+
+class CacheStatsResponse(BaseModel):
+    caches: Dict[str, CacheCounter]
+
+
+class UsageSummary(BaseModel):
+    calls: int
+    input_tokens: int
+    output_tokens: int
+    cost: float
+
+
+class DailyUsage(UsageSummary):
+    date: str
+    provider: Optional[str] = None
+
+
+class ProviderUsage(UsageSummary):
+    provider: str
+
+
+class BatchUsage(BaseModel):
+    batch_id: str
+    timestamp: datetime
+    total_urls: int
+    success_count: int
+    failed_count: int
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    budget_exhausted: bool = False
@@ -4,6 +4,8 @@ from typing import Any
 from app.core.config import settings
 from app.services.gemini_client import GeminiClient
 from app.services.claude_client import ClaudeClient
+from app.services.fake_client import FakeAIClient
+from app.services.routing_client import RoutingAIClient
 
 logger = logging.getLogger(__name__)
 
@@ -17,16 +19,55 @@ class AIClientFactory:
         環境変数 AI_MODEL_PROVIDER に基づいて適切なAIクライアントを返す
 
         Returns:
-            GeminiClient または ClaudeClient のインスタンス
+            GeminiClient, ClaudeClient, RoutingAIClient または FakeAIClient のインスタンス
         """
         provider = settings.AI_MODEL_PROVIDER.lower()
 
         logger.info(f"AIクライアント作成: プロバイダー「{provider}」を使用します")
 
-        if provider == "claude":
+        if provider == "fake":
+            # APIキー不要の擬似クライアント（負荷試験用）
+            logger.info("擬似AIクライアントを初期化します")
+            return FakeAIClient()
+        elif provider in ("routing", "auto"):
+            return AIClientFactory._get_routing_client()
+        elif provider == "claude":
             logger.info("Claude APIクライアントを初期化します")
             return ClaudeClient()
         else:
             # デフォルトはGemini
             logger.info("Gemini APIクライアントを初期化します")
             return GeminiClient()
+
+    @staticmethod
+    def _get_routing_client() -> Any:
+        """
+        GeminiとClaudeを振り分けるクライアントを返す
+
+        APIキーが片方しか設定されていない場合は、そのプロバイダのクライアントを返す。
+        """
+        clients = []
+        if settings.GEMINI_API_KEY:
+            clients.append(("gemini", GeminiClient()))
+        if settings.CLAUDE_API_KEY:
+            clients.append(("claude", ClaudeClient()))
+
+        if not clients:
+            raise ValueError(
+                "GEMINI_API_KEYとCLAUDE_API_KEYのいずれも設定されていません。環境変数を確認してください。"
+            )
+        if len(clients) == 1:
+            logger.warning(
+                f"APIキーが1つしか設定されていないため、{clients[0][0]} のみを使用します"
+            )
+            return clients[0][1]
+
+        # 優先プロバイダを先頭に並べる
+        primary = settings.ROUTING_PRIMARY_PROVIDER.lower()
+        clients.sort(key=lambda client: client[0] != primary)
+
+        logger.info(
+            "プロバイダ振り分けクライアントを初期化します: "
+            + " > ".join(name for name, _ in clients)
+        )
+        return RoutingAIClient(clients)
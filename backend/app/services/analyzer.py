@@ -1,6 +1,19 @@
-from typing import Dict, Any, List, Optional, Tuple
+from typing import (
+    Dict,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 import asyncio
 import json
+import os
 import uuid
 import logging
 from datetime import datetime, timedelta
@@ -11,155 +24,1266 @@ from ..models.schema import (
     AnalysisResponse,
     BatchAnalysisResponse,
 )
-from ..models.database import AnalysisHistory, SessionLocal
-from ..utils.url_normalizer import normalize_url
-from .crawler import WebCrawler
+from ..core.config import settings
+from ..models.database import (
+    AnalysisHistory,
+    AnalysisUsage,
+    BatchAnalysisHistory,
+    BatchAnalysisUrl,
+    PageSnapshot,
+    SessionLocal,
+)
+from ..utils.content_hash import compute_content_hash
+from ..utils.url_normalizer import get_registrable_domain, normalize_url
+from .batch_writer import BATCH_STATUS_FAILED, URL_STATUS_PENDING, BatchResultWriter
+from .cache_stats import cache_stats
+from .result_cache import ResultCache
+from .single_flight import SingleFlight
+from .crawler import FetchResult, WebCrawler
+from .html_extractor import extract_text_async
+from .pipeline import PipelineStage, iter_chunks, run_pipeline
+from .prompt_builder import build_page_content
 from .ai_client_factory import AIClientFactory
+from .local_classifier import (
+    LOCAL_CLASSIFIER_SOURCE,
+    classify_locally,
+    get_local_classifier,
+)
+from .usage_tracker import (
+    BudgetExhaustedError,
+    UsageBudget,
+    UsageTotals,
+    estimate_call_usage,
+    track_usage,
+)
 
 logger = logging.getLogger(__name__)
 
 
+class PreparedPage:
+    """取得済みで、AIでの判定を待っているページ"""
+
+    def __init__(
+        self,
+        url: str,
+        normalized_url: str,
+        page: FetchResult,
+        content_hash: Optional[str],
+    ):
+        self.url = url
+        self.normalized_url = normalized_url
+        self.page = page
+        self.content_hash = content_hash
+        # 判定結果と、既存の結果の再利用・ローカル分類器で判定した場合はその判定元
+        self.result: Optional[Dict[str, Any]] = None
+        self.cache_source: Optional[str] = None
+        # 既存の結果を再利用した場合の元の解析日時（有効期限を延長しないため引き継ぐ）
+        self.analyzed_at: Optional[datetime] = None
+
+
+class BatchItem:
+    """一括解析のパイプラインを流れる1件分の処理状態"""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.url = url
+        self.normalized_url = normalize_url(url)
+        self.snapshot: Optional[PageSnapshot] = None
+        self.page: Optional[FetchResult] = None
+        self.prepared: Optional[PreparedPage] = None
+        self.usage: Optional[UsageTotals] = None
+        self.error: Optional[Exception] = None
+        # トークン数・コストの上限に達したため解析しなかったかどうか
+        self.skipped = False
+        # 既存の結果を再利用して保存まで済んだ解析結果
+        self.response: Optional[AnalysisResponse] = None
+
+    def is_settled(self) -> bool:
+        """これ以上の取得・判定が不要かどうか（保存の段にそのまま渡す）"""
+        return (
+            self.response is not None
+            or self.error is not None
+            or self.skipped
+            or (self.prepared is not None and self.prepared.result is not None)
+        )
+
+
 class WebsiteAnalyzer:
     def __init__(self):
         self.crawler = WebCrawler()
         self.ai_client = AIClientFactory.get_client()
         # キャッシュの有効期限（日数）
         self.cache_expiry_days = 7  # 設定ファイルから読み込むようにも可能
+        # 同じURLの同時解析をまとめる
+        self._single_flight = SingleFlight("single_flight")
+        # 最近の解析結果（データベースを参照せずに返す）
+        self._result_cache = ResultCache(
+            "memory",
+            settings.RESULT_CACHE_MAX_ENTRIES,
+            int(settings.RESULT_CACHE_MAX_MB * 1024 * 1024),
+            timedelta(days=self.cache_expiry_days),
+        )
 
     async def analyze_url(
-        self, url: str, force_refresh: bool = False
+        self, url: str, force_refresh: bool = False, timeout: Optional[float] = None
     ) -> AnalysisResponse:
         """
         単一のURLを解析して結果を返す
 
+        同じURL（正規化後）の解析が実行中の場合は、新たに解析せずその結果を共有する。
+
         Args:
             url: 解析対象のURL
             force_refresh: キャッシュを無視して強制的に再解析するかどうか
+            timeout: 結果を待つ秒数（省略時は ANALYSIS_TIMEOUT、0は無制限）。
+                タイムアウトしても実行中の解析は継続し、結果は保存される
 
         Returns:
             解析結果
         """
+        # URLを正規化
+        normalized_url = normalize_url(url)
+
+        # キャッシュチェック（force_refreshがFalseの場合のみ）
+        if force_refresh:
+            self._result_cache.invalidate(normalized_url)
+        else:
+            cached_result = self._result_cache.get(normalized_url)
+            if cached_result:
+                return self._for_caller(cached_result, url)
+
+            cached_result = await self._check_cache(normalized_url)
+            if cached_result:
+                logger.info(f"キャッシュから結果を返却: {url}")
+                return cached_result
+
+        if timeout is None:
+            timeout = settings.ANALYSIS_TIMEOUT
+        if timeout <= 0:
+            timeout = None
+
+        # キャッシュミスまたは強制更新の場合は通常通り解析（実行中の同じ解析があれば共有）
         try:
-            # URLを正規化
-            normalized_url = normalize_url(url)
+            response = await self._single_flight.run(
+                self._flight_key(normalized_url, force_refresh),
+                lambda: self._analyze_uncached(url, normalized_url, force_refresh),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"解析が{timeout}秒以内に完了しませんでした: {url}")
+            return AnalysisResponse(
+                url=url,
+                status="failed",
+                error=f"解析が{timeout}秒以内に完了しませんでした（解析は継続しています）",
+            )
+
+        return self._for_caller(response, url)
+
+    def _flight_key(self, normalized_url: str, force_refresh: bool) -> str:
+        """同時解析をまとめるキー（強制更新の要求は通常の要求とまとめない）"""
+        return f"{normalized_url}#refresh" if force_refresh else normalized_url
+
+    def _for_caller(self, response: AnalysisResponse, url: str) -> AnalysisResponse:
+        """共有した解析結果を、呼び出し元が指定したURLのレスポンスにする"""
+        if response.url == url:
+            return response
+        return response.model_copy(update={"url": url})
 
-            # キャッシュチェック（force_refreshがFalseの場合のみ）
-            if not force_refresh:
-                cached_result = await self._check_cache(normalized_url)
-                if cached_result:
-                    logger.info(f"キャッシュから結果を返却: {url}")
-                    return cached_result
+    async def _analyze_uncached(
+        self, url: str, normalized_url: str, force_refresh: bool = False
+    ) -> AnalysisResponse:
+        """
+        キャッシュにないURLを解析して結果を返す
 
-            # キャッシュミスまたは強制更新の場合は通常通り解析
-            # Webページの内容を取得
-            content = await self.crawler.fetch_url_content(url)
+        有効期限切れの解析結果がある場合は条件付きGETでページを再検証し、
+        ページが変更されていなければAIを呼び出さずに既存の結果を更新する。
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+
+        Returns:
+            解析結果
+        """
+        usage = UsageTotals()
+        try:
+            response, prepared = await self._prepare_page(
+                url, normalized_url, force_refresh
+            )
+            if response:
+                return response
 
             # AIモデルを使ってカテゴリを判定
-            result = await self.ai_client.analyze_website(url, content)
+            with track_usage(usage):
+                result = await self.ai_client.analyze_website(
+                    url, prepared.page.content
+                )
+
+            return await self._complete_analysis(prepared, result, usage=usage)
+
+        except Exception as e:
+            return await self._fail_analysis(url, normalized_url, e, usage=usage)
+
+    async def _prepare_page(
+        self, url: str, normalized_url: str, force_refresh: bool = False
+    ) -> Tuple[Optional[AnalysisResponse], Optional[PreparedPage]]:
+        """
+        ページを取得し、AIを呼び出さずに済むかどうかを判定する
+
+        ページが変更されていない場合や、同一内容のページに有効な解析結果がある場合は
+        既存の結果を再利用した解析結果を返す。ローカル分類器が高い確信度で判定できた場合は
+        その結果を返し、それ以外はAIでの判定が必要なページを返す。
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+
+        Returns:
+            (再利用した解析結果, AIでの判定が必要なページ)のタプル。いずれか一方はNone
+        """
+        response, snapshot, page = await self._fetch_for_analysis(
+            url, normalized_url, force_refresh
+        )
+        if response:
+            return response, None
+
+        response, prepared = await self._resolve_page(
+            url, normalized_url, snapshot, page, force_refresh
+        )
+        if response:
+            return response, None
+
+        if prepared.result is not None:
+            response = await self._complete_analysis(
+                prepared, prepared.result, cache_source=prepared.cache_source
+            )
+            return response, None
+
+        return None, prepared
+
+    async def _fetch_for_analysis(
+        self,
+        url: str,
+        normalized_url: str,
+        force_refresh: bool = False,
+        extract: bool = True,
+    ) -> Tuple[
+        Optional[AnalysisResponse], Optional[PageSnapshot], Optional[FetchResult]
+    ]:
+        """
+        前回取得時の検証子を使ってページを取得する
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+            extract: テキストを抽出するかどうか（Falseの場合はデコードしたHTMLのまま）
+
+        Returns:
+            (304応答で再利用した解析結果, 前回取得時のスナップショット, 取得結果)のタプル。
+            解析結果を再利用した場合、取得結果はNone
+
+        Raises:
+            Exception: ページを取得できなかった場合
+        """
+        # 前回取得時の検証子を取得（強制更新時は再検証しない）
+        snapshot = None
+        if not force_refresh:
+            snapshot = await self._get_page_snapshot(normalized_url)
+
+        # Webページの内容を取得（検証子があれば条件付きGET）
+        page = await self.crawler.fetch_page(
+            url,
+            etag=snapshot.etag if snapshot else None,
+            last_modified=snapshot.last_modified if snapshot else None,
+            extract=extract,
+        )
+        if page.error:
+            raise Exception(page.error)
+
+        if not page.not_modified:
+            return None, snapshot, page
+
+        # ページが変更されていなければ既存の解析結果を再利用
+        if snapshot:
+            revalidated = await self._refresh_from_snapshot(
+                url, normalized_url, snapshot, page
+            )
+            if revalidated:
+                logger.info(f"ページ未変更のため解析結果を再利用: {url}")
+                cache_stats.record_hit("revalidation")
+                return revalidated, snapshot, None
+
+        # 再利用できる結果がないのに304が返された場合は通常のGETで取り直す
+        page = await self.crawler.fetch_page(url, extract=extract)
+        if page.error:
+            raise Exception(page.error)
+        return None, snapshot, page
+
+    async def _resolve_page(
+        self,
+        url: str,
+        normalized_url: str,
+        snapshot: Optional[PageSnapshot],
+        page: FetchResult,
+        force_refresh: bool = False,
+    ) -> Tuple[Optional[AnalysisResponse], Optional[PreparedPage]]:
+        """
+        テキスト抽出済みのページについて、AIを呼び出さずに判定できるかどうかを調べる
+
+        内容が前回取得時と同じ場合は解析結果を再利用したレスポンスを返す。
+        同一内容のページの解析結果やローカル分類器の判定を使える場合は、
+        その結果を設定したページを返す（保存は呼び出し元で行う）。
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            snapshot: 前回取得時のスナップショット
+            page: テキスト抽出済みの取得結果
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+
+        Returns:
+            (再利用した解析結果, 判定対象のページ)のタプル。いずれか一方はNone
+        """
+        content_hash = compute_content_hash(page.content)
+        if snapshot and content_hash == snapshot.content_hash:
+            revalidated = await self._refresh_from_snapshot(
+                url, normalized_url, snapshot, page
+            )
+            if revalidated:
+                logger.info(f"ページ未変更のため解析結果を再利用: {url}")
+                cache_stats.record_hit("revalidation")
+                return revalidated, None
+        if snapshot:
+            cache_stats.record_miss("revalidation")
+
+        prepared = PreparedPage(url, normalized_url, page, content_hash)
 
-            # 成功レスポンスの作成
-            response = AnalysisResponse(url=url, status="success", analysis=result)
+        # 同一内容のページに有効な解析結果があれば再利用
+        duplicate = await self._find_by_content_hash(content_hash)
+        if duplicate:
+            logger.info(f"同一内容のページの解析結果を再利用: {url}")
+            cache_stats.record_hit("content_hash")
+            prepared.result = duplicate.analysis
+            prepared.cache_source = "content_hash"
+            prepared.analyzed_at = duplicate.analyzed_at or duplicate.timestamp
+            return None, prepared
 
-            # 解析結果をデータベースに保存
-            await self._save_analysis_result(normalized_url, "success", result=result)
+        cache_stats.record_miss("content_hash")
 
+        # ローカル分類器の確信度が高ければAIを呼び出さずに判定（強制更新時は使わない）
+        if not force_refresh and get_local_classifier() is not None:
+            loop = asyncio.get_running_loop()
+            local_result = await loop.run_in_executor(
+                None, classify_locally, page.content
+            )
+            if local_result:
+                logger.info(
+                    f"ローカル分類器で判定: {url} -> {local_result['main_category']}"
+                    f"（確信度={local_result['confidence']}）"
+                )
+                cache_stats.record_hit(LOCAL_CLASSIFIER_SOURCE)
+                prepared.result = local_result
+                prepared.cache_source = LOCAL_CLASSIFIER_SOURCE
+                return None, prepared
+            cache_stats.record_miss(LOCAL_CLASSIFIER_SOURCE)
+
+        return None, prepared
+
+    async def _complete_analysis(
+        self,
+        prepared: PreparedPage,
+        result: Dict[str, Any],
+        cache_source: Optional[str] = None,
+        usage: Optional[UsageTotals] = None,
+        writer: Optional[BatchResultWriter] = None,
+    ) -> AnalysisResponse:
+        """
+        解析結果を保存し、成功レスポンスを作成する
+
+        Args:
+            prepared: 解析したページ
+            result: 解析結果の辞書
+            cache_source: 既存の結果の再利用元、またはローカル分類器で判定した場合はその旨
+            usage: AI API呼び出しのトークン使用量
+            writer: 一括解析の結果の書き込み（指定した場合は解析履歴とスナップショットを
+                溜めておき、一括解析の結果と共にまとめて書き込む）
+
+        Returns:
+            成功レスポンス
+        """
+        # 成功レスポンスの作成
+        response = AnalysisResponse(
+            url=prepared.url,
+            status="success",
+            analysis=result,
+            from_cache=(
+                True
+                if cache_source and cache_source != LOCAL_CLASSIFIER_SOURCE
+                else None
+            ),
+        )
+
+        if writer is not None:
+            # 一括解析の結果として、解析履歴とスナップショットをまとめて書き込む
+            history = self._history_values(
+                prepared.normalized_url,
+                "success",
+                result=result,
+                is_batch=True,
+                batch_id=writer.batch_id,
+                content_hash=prepared.content_hash,
+                cache_source=cache_source,
+                usage=usage,
+                analyzed_at=prepared.analyzed_at,
+            )
+            response.history_id = history["id"]
+            writer.add_analysis(
+                history,
+                self._snapshot_values(
+                    prepared.normalized_url,
+                    prepared.page,
+                    prepared.content_hash,
+                    history["id"],
+                ),
+                self._usage_values(history["id"], usage),
+            )
+            self._result_cache.put(
+                prepared.normalized_url, response, prepared.analyzed_at
+            )
             return response
 
+        # 解析結果をデータベースに保存
+        history_id = await self._save_analysis_result(
+            prepared.normalized_url,
+            "success",
+            result=result,
+            content_hash=prepared.content_hash,
+            cache_source=cache_source,
+            usage=usage,
+            analyzed_at=prepared.analyzed_at,
+        )
+        response.history_id = history_id or None
+        self._result_cache.put(prepared.normalized_url, response, prepared.analyzed_at)
+
+        # 次回の再検証用に検証子とコンテンツハッシュを保存
+        await self._save_page_snapshot(
+            prepared.normalized_url,
+            prepared.page,
+            prepared.content_hash,
+            history_id,
+        )
+
+        return response
+
+    async def _fail_analysis(
+        self,
+        url: str,
+        normalized_url: str,
+        error: Exception,
+        usage: Optional[UsageTotals] = None,
+        writer: Optional[BatchResultWriter] = None,
+    ) -> AnalysisResponse:
+        """
+        解析失敗を保存し、エラーレスポンスを作成する
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            error: 発生した例外
+            usage: 失敗までに使用したAI APIのトークン使用量
+            writer: 一括解析の結果の書き込み（指定した場合は解析履歴をまとめて書き込む）
+
+        Returns:
+            エラーレスポンス
+        """
+        logger.error(f"URL解析中にエラーが発生しました: {str(error)}")
+
+        # エラーレスポンスの作成
+        error_response = AnalysisResponse(
+            url=url,
+            status="failed",
+            error=f"解析中にエラーが発生しました: {str(error)}",
+        )
+
+        # エラー情報をデータベースに保存
+        if writer is not None:
+            history = self._history_values(
+                normalized_url,
+                "failed",
+                error=str(error),
+                is_batch=True,
+                batch_id=writer.batch_id,
+                usage=usage,
+            )
+            writer.add_analysis(
+                history, usage_rows=self._usage_values(history["id"], usage)
+            )
+            error_response.history_id = history["id"]
+            return error_response
+
+        history_id = await self._save_analysis_result(
+            normalized_url, "failed", error=str(error), usage=usage
+        )
+        error_response.history_id = history_id or None
+
+        return error_response
+
+    async def _analyze_uncached_batch(
+        self,
+        entries: AsyncIterable[Tuple[int, str]],
+        on_result: Callable[[int, AnalysisResponse], Awaitable[None]],
+        force_refresh: bool = False,
+        budget: Optional[UsageBudget] = None,
+        stage_stats: Optional[Dict[str, Dict[str, float]]] = None,
+        writer: Optional[BatchResultWriter] = None,
+    ) -> None:
+        """
+        キャッシュにない複数のURLを解析する
+
+        同じURL（正規化後）の解析が他の呼び出しで実行中の場合は、解析せずにその結果を共有する。
+        結果は保持せず、確定した順に on_result に渡す（on_result の完了を待つため、
+        受け取り側が遅い場合は解析も遅くなる）。
+
+        Args:
+            entries: 解析対象の(入力内での位置, URL)
+            on_result: 各URLの結果が確定するたびに(入力内での位置, 解析結果)で呼び出す関数
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+            budget: トークン数・コストの上限（上限に達した後はAIを呼び出さない）
+            stage_stats: 段ごとの処理件数・スループットの格納先
+            writer: 一括解析の結果の書き込み（解析履歴とスナップショットをまとめて書き込む）
+        """
+        # 担当する解析のうち結果が確定していないもの（位置 -> (URL, キー, Future)）
+        owned: Dict[int, Tuple[str, str, asyncio.Future]] = {}
+        # 実行中だった解析の完了を待つタスク
+        waiters: Set[asyncio.Task] = set()
+
+        async def owned_result(position: int, response: AnalysisResponse) -> None:
+            # 待っている呼び出し元にもすぐに結果を共有する
+            _, key, future = owned.pop(position)
+            self._single_flight.resolve(key, future, result=response)
+            await on_result(position, response)
+
+        async def wait_joined(position: int, url: str, future: asyncio.Future) -> None:
+            # 実行中だった解析の完了を待って結果を共有
+            try:
+                response = await self._single_flight.wait(future)
+            except Exception as e:
+                response = AnalysisResponse(
+                    url=url,
+                    status="failed",
+                    error=f"解析中にエラーが発生しました: {str(e)}",
+                )
+            await on_result(position, self._for_caller(response, url))
+
+        async def claimed_entries() -> AsyncIterator[Tuple[int, str]]:
+            async for position, url in entries:
+                key = self._flight_key(normalize_url(url), force_refresh)
+                future = self._single_flight.claim(key)
+                if future is None:
+                    waiter = asyncio.ensure_future(
+                        wait_joined(position, url, self._single_flight.get(key))
+                    )
+                    waiters.add(waiter)
+                    waiter.add_done_callback(waiters.discard)
+                else:
+                    owned[position] = (url, key, future)
+                    yield position, url
+
+        try:
+            await self._analyze_claimed_batch(
+                claimed_entries(),
+                owned_result,
+                force_refresh,
+                budget,
+                stage_stats,
+                writer,
+            )
+        except BaseException as e:
+            for _, key, future in owned.values():
+                self._single_flight.resolve(key, future, error=e)
+            for waiter in list(waiters):
+                waiter.cancel()
+            raise
+
+        # 結果が得られなかったURLは失敗として共有する
+        for position, (url, _, _) in list(owned.items()):
+            await owned_result(
+                position,
+                AnalysisResponse(url=url, status="failed", error="解析に失敗しました"),
+            )
+
+        if waiters:
+            await asyncio.gather(*list(waiters))
+
+    async def _analyze_claimed_batch(
+        self,
+        entries: AsyncIterable[Tuple[int, str]],
+        on_result: Callable[[int, AnalysisResponse], Awaitable[None]],
+        force_refresh: bool = False,
+        budget: Optional[UsageBudget] = None,
+        stage_stats: Optional[Dict[str, Dict[str, float]]] = None,
+        writer: Optional[BatchResultWriter] = None,
+    ) -> None:
+        """
+        担当する複数のURLを解析する
+
+        取得・テキスト抽出・AIでの判定・保存の各段を、段ごとのワーカー数と長さに上限のある
+        キューでつないだパイプラインで処理する。AIでの判定が必要なページは LLM_PACK_SIZE 件
+        ずつ1回のAI呼び出しにまとめ、まとめた回答に含まれなかったURLや回答の形式が
+        不正だった場合は個別に解析し直す。
+
+        Args:
+            entries: 解析対象の(入力内での位置, URL)
+            on_result: 各URLの結果を保存するたびに(入力内での位置, 解析結果)で呼び出す関数
+            force_refresh: 再検証を行わずに強制的に再解析するかどうか
+            budget: トークン数・コストの上限（上限に達した後はAIを呼び出さない）
+            stage_stats: 段ごとの処理件数・スループットの格納先
+            writer: 一括解析の結果の書き込み（解析履歴とスナップショットをまとめて書き込む）
+        """
+
+        async def fetch(item: BatchItem) -> BatchItem:
+            try:
+                item.response, item.snapshot, item.page = (
+                    await self._fetch_for_analysis(
+                        item.url, item.normalized_url, force_refresh, extract=False
+                    )
+                )
+            except Exception as e:
+                item.error = e
+            return item
+
+        async def extract(item: BatchItem) -> BatchItem:
+            try:
+                item.page.content = await extract_text_async(item.page.content)
+                item.response, item.prepared = await self._resolve_page(
+                    item.url,
+                    item.normalized_url,
+                    item.snapshot,
+                    item.page,
+                    force_refresh,
+                )
+            except Exception as e:
+                item.error = e
+            return item
+
+        async def classify(items: List[BatchItem]) -> List[BatchItem]:
+            await self._classify_group(items, budget)
+            return items
+
+        async def persist(item: BatchItem) -> None:
+            await on_result(
+                item.index, await self._persist_batch_item(item, budget, writer)
+            )
+
+        pack_size = settings.LLM_PACK_SIZE
+        packable = pack_size > 1 and hasattr(self.ai_client, "analyze_websites_packed")
+        if not packable:
+            pack_size = 1
+
+        extract_workers = (
+            settings.PIPELINE_EXTRACT_WORKERS
+            or settings.HTML_EXTRACTOR_WORKERS
+            or os.cpu_count()
+            or 1
+        )
+        stages = [
+            # 同時接続数の上限に達したドメインのURLは取り置き、他のドメインのURLを先に取得する
+            self._pipeline_stage(
+                "fetch",
+                fetch,
+                settings.PIPELINE_FETCH_WORKERS,
+                key=lambda item: get_registrable_domain(item.url),
+                per_key=settings.CRAWLER_PER_HOST_CONCURRENCY,
+                lookahead=settings.PIPELINE_FETCH_LOOKAHEAD,
+            ),
+            self._pipeline_stage(
+                "extract", extract, extract_workers, skip=BatchItem.is_settled
+            ),
+            self._pipeline_stage(
+                "classify",
+                classify,
+                settings.PIPELINE_CLASSIFY_WORKERS,
+                batch_size=pack_size,
+                skip=BatchItem.is_settled,
+            ),
+            self._pipeline_stage("persist", persist, settings.PIPELINE_PERSIST_WORKERS),
+        ]
+
+        stats = await run_pipeline(
+            (BatchItem(position, url) async for position, url in entries), stages
+        )
+        for name, stat in stats.items():
+            logger.info(
+                f"一括解析の{name}段: {stat['processed']}件, "
+                f"{stat['throughput']:.1f}件/秒, 稼働率={stat['utilization']:.0%}, "
+                f"キューの最大長={stat['max_queue']}"
+            )
+        if stage_stats is not None:
+            stage_stats.update(stats)
+
+    def _pipeline_stage(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int,
+        batch_size: Optional[int] = None,
+        skip: Optional[Callable[[Any], bool]] = None,
+        key: Optional[Callable[[Any], str]] = None,
+        per_key: int = 1,
+        lookahead: int = 1000,
+    ) -> PipelineStage:
+        """設定に従って一括解析のパイプラインの段を作成する"""
+        workers = max(workers, 1)
+        return PipelineStage(
+            name,
+            handler,
+            workers,
+            settings.PIPELINE_QUEUE_SIZE or workers * 2,
+            batch_size=batch_size,
+            batch_linger=settings.PIPELINE_BATCH_LINGER,
+            skip=skip,
+            key=key,
+            per_key=per_key,
+            lookahead=lookahead,
+        )
+
+    async def _classify_group(
+        self, items: List[BatchItem], budget: Optional[UsageBudget] = None
+    ) -> None:
+        """
+        ページのグループをAIで判定する（2件以上の場合は1回の呼び出しにまとめる）
+
+        判定結果・エラーは各項目に設定する。まとめた呼び出しのトークン使用量は、
+        各ページに均等に按分する（個別に解析し直したページは、個別の呼び出しの使用量に加える）。
+
+        Args:
+            items: AIでの判定が必要な項目のリスト
+            budget: トークン数・コストの上限
+        """
+
+        async def classify_single(item: BatchItem) -> None:
+            item.usage = UsageTotals()
+            prepared = item.prepared
+            try:
+                with track_usage(item.usage):
+                    prepared.result = await self._call_with_budget(
+                        budget,
+                        [prepared.page.content],
+                        lambda: self.ai_client.analyze_website(
+                            prepared.url, prepared.page.content
+                        ),
+                    )
+            except BudgetExhaustedError:
+                item.skipped = True
+            except Exception as e:
+                item.error = e
+
+        if len(items) == 1:
+            await classify_single(items[0])
+            return
+
+        pages = [(item.url, item.prepared.page.content) for item in items]
+        usage = UsageTotals()
+        try:
+            with track_usage(usage):
+                packed_results = await self._call_with_budget(
+                    budget,
+                    [content for _, content in pages],
+                    lambda: self.ai_client.analyze_websites_packed(pages),
+                )
+        except BudgetExhaustedError:
+            for item in items:
+                item.skipped = True
+            return
         except Exception as e:
-            logger.error(f"URL解析中にエラーが発生しました: {str(e)}")
+            logger.warning(
+                f"まとめて解析できなかったため個別に解析します({len(items)}件): {str(e)}"
+            )
+            packed_results = {}
 
-            # エラーレスポンスの作成
-            error_response = AnalysisResponse(
-                url=url,
-                status="failed",
-                error=f"解析中にエラーが発生しました: {str(e)}",
+        # まとめた呼び出しの使用量を各ページに按分（回答を解釈できなかった場合も課金されている）
+        usage_shares = usage.split(len(items)) if usage.calls else None
+
+        missing = []
+        for index, item in enumerate(items):
+            result = packed_results.get(item.url)
+            if result is not None and self._is_valid_result(item.url, result):
+                item.prepared.result = result
+                item.usage = usage_shares[index] if usage_shares else None
+            else:
+                missing.append((index, item))
+
+        # 回答に含まれなかったURLや、回答の形式が不正なURLは個別に解析し直す
+        if missing and len(missing) < len(items):
+            logger.warning(
+                f"まとめた回答に含まれなかったURLを個別に解析します({len(missing)}件)"
             )
+        await asyncio.gather(*[classify_single(item) for _, item in missing])
+        if usage_shares:
+            for index, item in missing:
+                item.usage.merge(usage_shares[index])
 
-            # エラー情報をデータベースに保存
-            await self._save_analysis_result(normalize_url(url), "failed", error=str(e))
+    def _is_valid_result(self, url: str, result: Dict[str, Any]) -> bool:
+        """AIの回答が解析結果の形式に合っているかどうか"""
+        try:
+            AnalysisResponse(url=url, status="success", analysis=result)
+        except Exception:
+            return False
+        return True
 
-            return error_response
+    async def _persist_batch_item(
+        self,
+        item: BatchItem,
+        budget: Optional[UsageBudget] = None,
+        writer: Optional[BatchResultWriter] = None,
+    ) -> AnalysisResponse:
+        """
+        一括解析の1件分の結果を保存し、レスポンスを作成する
+
+        Args:
+            item: 処理を終えた項目
+            budget: トークン数・コストの上限
+            writer: 一括解析の結果の書き込み
+
+        Returns:
+            解析結果
+        """
+        if item.response is not None:
+            return item.response
+        if item.skipped:
+            response = self._budget_skipped(item.url, budget)
+            if item.usage is not None and item.usage.calls:
+                # まとめた呼び出しの按分した使用量は、解析しなかった場合も履歴に記録する
+                history = self._history_values(
+                    item.normalized_url,
+                    "failed",
+                    error=response.error,
+                    is_batch=writer is not None,
+                    batch_id=writer.batch_id if writer is not None else None,
+                    usage=item.usage,
+                )
+                if writer is not None:
+                    writer.add_analysis(
+                        history,
+                        usage_rows=self._usage_values(history["id"], item.usage),
+                    )
+                    response.history_id = history["id"]
+                else:
+                    response.history_id = (
+                        await self._save_analysis_result(
+                            item.normalized_url,
+                            "failed",
+                            error=response.error,
+                            usage=item.usage,
+                        )
+                        or None
+                    )
+            return response
+
+        if item.error is None:
+            try:
+                return await self._complete_analysis(
+                    item.prepared,
+                    item.prepared.result,
+                    cache_source=item.prepared.cache_source,
+                    usage=item.usage,
+                    writer=writer,
+                )
+            except Exception as e:
+                item.error = e
+
+        return await self._fail_analysis(
+            item.url, item.normalized_url, item.error, usage=item.usage, writer=writer
+        )
+
+    async def _call_with_budget(
+        self,
+        budget: Optional[UsageBudget],
+        contents: List[str],
+        operation: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        トークン数・コストの上限内でAI APIを呼び出す
+
+        Args:
+            budget: トークン数・コストの上限（Noneの場合は無制限）
+            contents: プロンプトに含めるページ内容のリスト（見込みの計算に使用）
+            operation: AI APIを呼び出すコルーチンを返す関数
+
+        Returns:
+            AI APIの呼び出し結果
+
+        Raises:
+            BudgetExhaustedError: 上限に達したため呼び出さなかった場合
+        """
+        if budget is None:
+            return await operation()
+
+        tokens, cost = estimate_call_usage(contents)
+        if not await budget.reserve(tokens, cost):
+            raise BudgetExhaustedError()
+
+        try:
+            return await operation()
+        finally:
+            await budget.release(tokens, cost)
+
+    def _budget_skipped(
+        self, url: str, budget: Optional[UsageBudget]
+    ) -> AnalysisResponse:
+        """上限に達したため解析しなかったURLのレスポンスを作成する（履歴には保存しない）"""
+        if budget is not None:
+            budget.skipped += 1
+        return AnalysisResponse(
+            url=url,
+            status="failed",
+            error="トークン数・コストの上限に達したため解析を行いませんでした",
+        )
 
     async def analyze_urls_batch(
-        self, urls: List[str], force_refresh: bool = False
+        self,
+        urls: Union[List[str], AsyncIterable[str]],
+        force_refresh: bool = False,
+        max_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        on_result: Optional[Callable[[AnalysisResponse], Awaitable[None]]] = None,
+        collect_results: bool = True,
     ) -> BatchAnalysisResponse:
         """
         複数のURLを一括で解析して結果を返す
 
+        トークン数・コストの上限を指定した場合は、上限に達した時点で新しいAI API呼び出しを止め、
+        解析済みの結果のみを返す（未解析のURLは失敗として返す）。
+        各URLの結果は完了した順に一括解析の履歴へ関連付け、進捗と共に書き込む。
+        URLを非同期イテレータで渡した場合は、BATCH_INPUT_CHUNK_SIZE 件ずつ読み込みながら解析する
+        （CSVファイルなどを全て読み込む前に解析を始め、読み込み済みのURLを保持しない）。
+
         Args:
-            urls: 解析対象のURLリスト
+            urls: 解析対象のURLリスト（または非同期イテレータ）
             force_refresh: キャッシュを無視して強制的に再解析するかどうか
+            max_tokens: 一括解析全体のトークン数の上限
+            max_cost: 一括解析全体のコスト（USD）の上限
+            on_result: 各URLの結果が確定するたびに呼び出して完了を待つ関数（キャッシュの結果が先。
+                受け取り側が遅い場合は、完了を待つ間、解析も進まない）
+            collect_results: 各URLの結果をレスポンスに含めるかどうか
+                （Falseの場合は結果を保持せず、on_result でのみ受け取る）
 
         Returns:
             一括解析結果
         """
-        # バッチ処理の最適化: 事前にキャッシュ状態を一括チェック
-        normalized_urls = [normalize_url(url) for url in urls]
-        cached_results = {}
+        # 一括解析の履歴を実行中として作成し、結果は完了した順に書き込む
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        budget = UsageBudget(max_tokens, max_cost)
+        writer = BatchResultWriter(batch_id, budget)
+        try:
+            writer.start(
+                {
+                    "force_refresh": force_refresh,
+                    "max_tokens": max_tokens,
+                    "max_cost": max_cost,
+                }
+            )
+        except Exception as e:
+            logger.error(f"一括解析履歴の作成中にエラーが発生しました: {str(e)}")
 
-        if not force_refresh:
-            cached_results = await self._batch_check_cache(normalized_urls)
-
-        # キャッシュされていないURLのみを抽出
-        urls_to_analyze = []
-        for i, url in enumerate(urls):
-            if normalized_urls[i] not in cached_results:
-                urls_to_analyze.append(url)
-
-        # キャッシュされていないURLのみ解析を実行
-        tasks = [self.analyze_url(url, force_refresh=True) for url in urls_to_analyze]
-        fresh_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 結果を統合
-        all_results = []
-
-        # キャッシュ結果を追加
-        for orig_url, norm_url in zip(urls, normalized_urls):
-            if norm_url in cached_results:
-                result = cached_results[norm_url]
-                # オリジナルURLに置き換え
-                result.url = orig_url
-                all_results.append(result)
-
-        # 新規解析の結果を追加
-        for result in fresh_results:
-            if isinstance(result, Exception):
-                # 例外を適切なレスポンスに変換
-                all_results.append(
-                    AnalysisResponse(
-                        url="Unknown URL",
-                        status="failed",
-                        error=f"予期せぬエラー: {str(result)}",
+        # リストの場合は全件のキャッシュを先に確認し、キャッシュの結果を先に確定する
+        chunk_size = (
+            len(urls) if isinstance(urls, list) else settings.BATCH_INPUT_CHUNK_SIZE
+        )
+
+        async def segments() -> AsyncIterator[List[Tuple[int, str]]]:
+            position = 0
+            async for chunk in iter_chunks(urls, chunk_size):
+                entries = list(enumerate(chunk, position))
+                position += len(entries)
+                # 再開できるよう、各URLを未処理として記録
+                try:
+                    writer.add_urls(entries)
+                except Exception as e:
+                    logger.error(
+                        f"一括解析の対象URLの保存中にエラーが発生しました: {str(e)}"
+                    )
+                yield entries
+
+        return await self._run_batch(
+            writer, segments(), force_refresh, on_result, collect_results
+        )
+
+    async def analyze_pending_batch(
+        self,
+        batch_id: str,
+        on_result: Optional[Callable[[AnalysisResponse], Awaitable[None]]] = None,
+    ) -> BatchAnalysisResponse:
+        """
+        登録済みの一括解析のうち、結果が確定していないURLを解析する
+
+        ジョブの実行と、中断・失敗した一括解析の再開に使用する。結果が確定したURLは解析し直さず、
+        件数・トークン使用量・関連付けを引き継ぐ。実行時の指定は登録時のものを使用する。
+
+        Args:
+            batch_id: 一括解析のID
+            on_result: 各URLの結果が確定するたびに呼び出して完了を待つ関数
+
+        Returns:
+            一括解析結果（各URLの結果は含めない）
+
+        Raises:
+            ValueError: 一括解析が存在しない場合
+        """
+        db = SessionLocal()
+        try:
+            batch = db.get(BatchAnalysisHistory, batch_id)
+            if batch is None:
+                raise ValueError(f"一括解析 '{batch_id}' が見つかりません")
+            options = batch.options or {}
+        finally:
+            db.close()
+
+        budget = UsageBudget(options.get("max_tokens"), options.get("max_cost"))
+        writer = BatchResultWriter(batch_id, budget)
+        writer.start(options)
+
+        return await self._run_batch(
+            writer,
+            self._pending_segments(batch_id),
+            bool(options.get("force_refresh")),
+            on_result,
+            collect_results=False,
+        )
+
+    async def _pending_segments(
+        self, batch_id: str
+    ) -> AsyncIterator[List[Tuple[int, str]]]:
+        """結果が確定していないURLを、位置の順に BATCH_INPUT_CHUNK_SIZE 件ずつ読み込む"""
+        last_position = -1
+        while True:
+            db = SessionLocal()
+            try:
+                rows = (
+                    db.query(BatchAnalysisUrl.position, BatchAnalysisUrl.url)
+                    .filter(
+                        BatchAnalysisUrl.batch_id == batch_id,
+                        BatchAnalysisUrl.status == URL_STATUS_PENDING,
+                        BatchAnalysisUrl.position > last_position,
                     )
+                    .order_by(BatchAnalysisUrl.position)
+                    .limit(max(settings.BATCH_INPUT_CHUNK_SIZE, 1))
+                    .all()
                 )
-            else:
-                all_results.append(result)
+            finally:
+                db.close()
 
-        # URLの順序を元に戻す
-        result_dict = {r.url: r for r in all_results}
-        ordered_results = [
-            result_dict.get(
-                url,
-                AnalysisResponse(url=url, status="failed", error="解析に失敗しました"),
+            if not rows:
+                return
+            last_position = rows[-1][0]
+            yield [(position, url) for position, url in rows]
+
+    async def _run_batch(
+        self,
+        writer: BatchResultWriter,
+        segments: AsyncIterable[List[Tuple[int, str]]],
+        force_refresh: bool,
+        on_result: Optional[Callable[[AnalysisResponse], Awaitable[None]]],
+        collect_results: bool,
+    ) -> BatchAnalysisResponse:
+        """
+        一括解析を実行する
+
+        入力を(位置, URL)のリストごとに受け取り、キャッシュにある結果を確定してから
+        残りのURLを解析のパイプラインに渡す。同時に保持するのは結果が確定していないURLのみ。
+        正規化後のURLが同じ行はまとめて1回だけ確認・解析し、その結果を入力の順に全ての行へ反映する。
+
+        Args:
+            writer: 開始済みの一括解析の結果の書き込み
+            segments: 解析対象の(入力内での位置, URL)のリスト
+            force_refresh: キャッシュを無視して強制的に再解析するかどうか
+            on_result: 各URLの結果が確定するたびに呼び出して完了を待つ関数
+            collect_results: 各URLの結果をレスポンスに含めるかどうか
+
+        Returns:
+            一括解析結果
+        """
+        budget = writer.budget
+        # 結果が確定していないURLを正規化URLごとにまとめたもの（入力の順の(位置, URL)。先頭のみ解析する）
+        groups: Dict[str, List[Tuple[int, str]]] = {}
+        # 解析するURL（各グループの先頭）の位置 -> 正規化URL
+        pending: Dict[int, str] = {}
+        counts = {"unique": 0, "duplicates": 0}
+        collected: Optional[Dict[int, AnalysisResponse]] = (
+            {} if collect_results else None
+        )
+
+        async def settle(position: int, response: AnalysisResponse) -> None:
+            if collected is not None:
+                collected[position] = response
+            writer.add(response, position)
+            if on_result is not None:
+                await on_result(response)
+
+        async def report(position: int, response: AnalysisResponse) -> None:
+            # 同じURL（正規化後）の全ての行に、入力の順で結果を反映する
+            for member_position, member_url in groups.pop(pending.pop(position)):
+                if member_position == position:
+                    await settle(position, response)
+                else:
+                    await settle(
+                        member_position, self._for_caller(response, member_url)
+                    )
+
+        async def uncached_entries() -> AsyncIterator[Tuple[int, str]]:
+            async for segment in segments:
+                # 結果が確定していないURLと重複する行は、解析せずにそのグループに加える
+                unique_entries = []
+                for position, url in segment:
+                    normalized_url = normalize_url(url)
+                    group = groups.get(normalized_url)
+                    if group is not None:
+                        group.append((position, url))
+                        counts["duplicates"] += 1
+                    else:
+                        groups[normalized_url] = [(position, url)]
+                        pending[position] = normalized_url
+                        unique_entries.append((position, url))
+                        counts["unique"] += 1
+
+                await self._report_cached(unique_entries, force_refresh, report)
+                # キャッシュされていないURLのみ解析を実行（AI呼び出しは複数サイトをまとめる）
+                for position, url in unique_entries:
+                    if position in pending:
+                        yield position, url
+
+        stage_stats: Dict[str, Dict[str, float]] = {}
+        try:
+            with track_usage(budget.totals):
+                await self._analyze_uncached_batch(
+                    uncached_entries(),
+                    report,
+                    force_refresh,
+                    budget,
+                    stage_stats,
+                    writer,
+                )
+        except asyncio.CancelledError:
+            # 呼び出し元の切断などで打ち切られた場合は、それまでの結果と中断を記録する
+            try:
+                writer.flush(
+                    {"status": BATCH_STATUS_FAILED, "error": "一括解析が中断されました"}
+                )
+            except Exception as e:
+                logger.error(f"一括解析履歴の保存中にエラーが発生しました: {str(e)}")
+            raise
+        except Exception as e:
+            # 入力の読み込みに失敗した場合なども、それまでの結果と失敗を記録する
+            try:
+                writer.flush(
+                    {
+                        "status": BATCH_STATUS_FAILED,
+                        "error": f"一括解析中にエラーが発生しました: {str(e)}",
+                    }
+                )
+            except Exception as flush_error:
+                logger.error(
+                    f"一括解析履歴の保存中にエラーが発生しました: {str(flush_error)}"
+                )
+            raise
+
+        # 解析できなかったURLを失敗として補う
+        for position, normalized_url in list(pending.items()):
+            await report(
+                position,
+                AnalysisResponse(
+                    url=groups[normalized_url][0][1],
+                    status="failed",
+                    error="解析に失敗しました",
+                ),
             )
-            for url in urls
-        ]
 
-        # 一括解析の結果をデータベースに保存
-        batch_id = f"batch_{uuid.uuid4().hex}"
-        await self._save_batch_analysis(batch_id, ordered_results)
+        processed_count = counts["unique"] + counts["duplicates"]
+        if counts["duplicates"]:
+            logger.info(
+                f"一括解析内の重複するURLの解析を共有しました: {writer.batch_id}, "
+                f"重複={counts['duplicates']}件 / {processed_count}件"
+            )
 
-        # 成功数と失敗数をカウント
-        success_count = sum(1 for r in ordered_results if r.status == "success")
-        failed_count = len(ordered_results) - success_count
+        if budget.exhausted:
+            logger.warning(
+                f"トークン数・コストの上限に達したため{budget.skipped}件を解析しませんでした: {writer.batch_id}"
+            )
+
+        # 残りの結果と、一括解析全体のトークン使用量を保存
+        try:
+            writer.finish()
+        except Exception as e:
+            logger.error(f"一括解析履歴の保存中にエラーが発生しました: {str(e)}")
 
         return BatchAnalysisResponse(
-            results=ordered_results,
-            total=len(ordered_results),
-            success=success_count,
-            failed=failed_count,
+            results=(
+                [collected[position] for position in sorted(collected)]
+                if collected
+                else []
+            ),
+            total=writer.total_urls,
+            success=writer.success_count,
+            failed=writer.failed_count,
+            unique_urls=counts["unique"],
+            duplicate_urls=counts["duplicates"],
+            dedup_ratio=(
+                counts["duplicates"] / processed_count if processed_count else 0.0
+            ),
+            batch_id=writer.batch_id,
+            input_tokens=budget.totals.input_tokens,
+            output_tokens=budget.totals.output_tokens,
+            cost=budget.totals.cost,
+            skipped=budget.skipped,
+            budget_exhausted=budget.exhausted,
+            stages=stage_stats,
         )
 
+    async def _report_cached(
+        self,
+        segment: List[Tuple[int, str]],
+        force_refresh: bool,
+        report: Callable[[int, AnalysisResponse], Awaitable[None]],
+    ) -> None:
+        """
+        キャッシュにある解析結果を確定する（プロセス内のキャッシュ、データベースの順に確認）
+
+        Args:
+            segment: (入力内での位置, URL)のリスト
+            force_refresh: キャッシュを無視するかどうか（プロセス内のキャッシュを削除する）
+            report: キャッシュにあった結果を(入力内での位置, 解析結果)で渡す関数
+        """
+        if force_refresh:
+            for _, url in segment:
+                self._result_cache.invalidate(normalize_url(url))
+            return
+
+        remaining = []
+        for position, url in segment:
+            normalized_url = normalize_url(url)
+            cached_result = self._result_cache.get(normalized_url)
+            if cached_result:
+                # オリジナルURLに置き換え（キャッシュ内の結果は書き換えない）
+                await report(position, self._for_caller(cached_result, url))
+            else:
+                remaining.append((position, url, normalized_url))
+
+        if not remaining:
+            return
+
+        # バッチ処理の最適化: 残りのURLのキャッシュ状態を一括チェック
+        cached_results = await self._batch_check_cache(
+            list({normalized_url for _, _, normalized_url in remaining})
+        )
+        for position, url, normalized_url in remaining:
+            if normalized_url in cached_results:
+                await report(
+                    position, self._for_caller(cached_results[normalized_url], url)
+                )
+
     async def _check_cache(self, normalized_url: str) -> Optional[AnalysisResponse]:
         """
         指定URLのキャッシュをチェックする
@@ -202,7 +1326,9 @@ class WebsiteAnalyzer:
                     status="success",
                     analysis=category_analysis,
                     from_cache=True,  # キャッシュから取得したことを示す
+                    history_id=history.id,
                 )
+                self._result_cache.put(normalized_url, response, history.timestamp)
                 return response
 
             # キャッシュミス
@@ -259,13 +1385,213 @@ class WebsiteAnalyzer:
                     status="success",
                     analysis=category_analysis,
                     from_cache=True,  # キャッシュから取得したことを示す
+                    history_id=history.id,
                 )
+                self._result_cache.put(url, result[url], history.timestamp)
 
             return result
 
         finally:
             db.close()
 
+    async def _find_by_content_hash(
+        self, content_hash: Optional[str]
+    ) -> Optional[AnalysisHistory]:
+        """
+        同一内容（正規化ハッシュが一致）のページの有効な解析結果を検索する
+
+        AIで解析した解析履歴のみを対象とし、有効期限は解析日時（analyzed_at）で判定する。
+        再利用した結果や再検証で日時を更新した結果から再利用を繰り返して、古い解析結果の
+        有効期限が延び続けないようにする。
+
+        Args:
+            content_hash: 抽出テキストの正規化ハッシュ
+
+        Returns:
+            有効期限内の最新の成功した解析履歴、なければNone
+        """
+        if not content_hash:
+            return None
+
+        db = SessionLocal()
+        try:
+            # キャッシュ有効期限の計算
+            cache_date = datetime.now() - timedelta(days=self.cache_expiry_days)
+
+            history = (
+                db.query(AnalysisHistory)
+                .filter(
+                    AnalysisHistory.content_hash == content_hash,
+                    AnalysisHistory.status == "success",
+                    AnalysisHistory.cache_source.is_(None),
+                    AnalysisHistory.analyzed_at >= cache_date,
+                    AnalysisHistory.analysis.isnot(None),
+                )
+                .order_by(AnalysisHistory.analyzed_at.desc())
+                .first()
+            )
+            return history
+
+        except Exception as e:
+            logger.error(f"コンテンツハッシュの検索中にエラーが発生しました: {str(e)}")
+            return None
+
+        finally:
+            db.close()
+
+    async def _get_page_snapshot(self, normalized_url: str) -> Optional[PageSnapshot]:
+        """
+        指定URLの前回取得時の検証子とコンテンツハッシュを取得する
+
+        Args:
+            normalized_url: 正規化されたURL
+
+        Returns:
+            再利用できる解析結果に紐づくスナップショット、なければNone
+        """
+        db = SessionLocal()
+        try:
+            snapshot = (
+                db.query(PageSnapshot)
+                .filter(
+                    PageSnapshot.url == normalized_url,
+                    PageSnapshot.history_id.isnot(None),
+                )
+                .first()
+            )
+            return snapshot
+
+        except Exception as e:
+            logger.error(f"スナップショットの取得中にエラーが発生しました: {str(e)}")
+            return None
+
+        finally:
+            db.close()
+
+    async def _refresh_from_snapshot(
+        self,
+        url: str,
+        normalized_url: str,
+        snapshot: PageSnapshot,
+        page: FetchResult,
+    ) -> Optional[AnalysisResponse]:
+        """
+        ページが変更されていない場合に、既存の解析結果の日時を更新して返す
+
+        Args:
+            url: 解析対象のURL
+            normalized_url: 正規化されたURL
+            snapshot: 前回取得時のスナップショット
+            page: 今回の取得結果
+
+        Returns:
+            更新した解析結果。元の解析結果が見つからない場合はNone
+        """
+        db = SessionLocal()
+        try:
+            history = (
+                db.query(AnalysisHistory)
+                .filter(
+                    AnalysisHistory.id == snapshot.history_id,
+                    AnalysisHistory.status == "success",
+                )
+                .first()
+            )
+            if not history or not history.analysis:
+                return None
+
+            history_id = history.id
+            now = datetime.utcnow()
+
+            # 解析日時を更新してキャッシュの有効期限を延長
+            history.timestamp = now
+
+            # 検証子を最新の値に更新
+            db_snapshot = db.get(PageSnapshot, normalized_url)
+            if db_snapshot:
+                db_snapshot.etag = page.etag or db_snapshot.etag
+                db_snapshot.last_modified = (
+                    page.last_modified or db_snapshot.last_modified
+                )
+                db_snapshot.checked_at = now
+
+            db.commit()
+
+            return AnalysisResponse(
+                url=url,
+                status="success",
+                analysis=self._convert_to_category_analysis(history.analysis),
+                from_cache=True,
+                history_id=history_id,
+            )
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"解析結果の再検証中にエラーが発生しました: {str(e)}")
+            return None
+
+        finally:
+            db.close()
+
+    async def _save_page_snapshot(
+        self,
+        normalized_url: str,
+        page: FetchResult,
+        content_hash: Optional[str],
+        history_id: str,
+    ) -> None:
+        """
+        次回の再検証用に検証子とコンテンツハッシュを保存する（抽出テキストは学習用）
+
+        Args:
+            normalized_url: 正規化されたURL
+            page: 取得結果
+            content_hash: 抽出テキストのハッシュ値
+            history_id: 対応する解析履歴のID
+        """
+        if not history_id:
+            return
+
+        values = self._snapshot_values(normalized_url, page, content_hash, history_id)
+        # 抽出テキストがない場合は保存済みのものを残す
+        if values["content_text"] is None:
+            del values["content_text"]
+
+        db = SessionLocal()
+        try:
+            db.merge(PageSnapshot(**values))
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"スナップショットの保存中にエラーが発生しました: {str(e)}")
+
+        finally:
+            db.close()
+
+    def _snapshot_values(
+        self,
+        normalized_url: str,
+        page: FetchResult,
+        content_hash: Optional[str],
+        history_id: str,
+    ) -> Dict[str, Any]:
+        """スナップショットの行の値を作成する"""
+        return {
+            "url": normalized_url,
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+            "content_hash": content_hash,
+            # ローカル分類器の学習用に、プロンプトと同じ形式で抽出テキストを保存
+            "content_text": (
+                build_page_content(page.content, settings.LOCAL_CLASSIFIER_TEXT_TOKENS)
+                if page.content
+                else None
+            ),
+            "history_id": history_id,
+            "checked_at": datetime.utcnow(),
+        }
+
     async def _save_analysis_result(
         self,
         url: str,
@@ -274,6 +1600,10 @@ class WebsiteAnalyzer:
         error: Optional[str] = None,
         is_batch: bool = False,
         batch_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        cache_source: Optional[str] = None,
+        usage: Optional[UsageTotals] = None,
+        analyzed_at: Optional[datetime] = None,
     ) -> str:
         """
         解析結果をデータベースに保存する
@@ -284,29 +1614,27 @@ class WebsiteAnalyzer:
 
             # 解析履歴の作成
             history = AnalysisHistory(
-                id=AnalysisHistory.generate_id(),
-                url=url,
-                status=status,
-                is_batch=is_batch,
-                batch_id=batch_id,
+                **self._history_values(
+                    url,
+                    status,
+                    result=result,
+                    error=error,
+                    is_batch=is_batch,
+                    batch_id=batch_id,
+                    content_hash=content_hash,
+                    cache_source=cache_source,
+                    usage=usage,
+                    analyzed_at=analyzed_at,
+                )
             )
 
-            # 成功時の情報を設定
-            if status == "success" and result:
-                history.main_category = result.get("main_category")
-                history.confidence = result.get("confidence")
-                history.analysis = result
-
-            # 失敗時のエラー情報を設定
-            if status == "failed" and error:
-                history.error = error
-
-            # データベースに保存
+            # データベースに保存（IDは生成済みのため再読み込みしない）
+            history_id = history.id
             db.add(history)
+            db.add_all(
+                AnalysisUsage(**row) for row in self._usage_values(history_id, usage)
+            )
             db.commit()
-            db.refresh(history)
-
-            history_id = history.id
 
             # セッションを閉じる
             db.close()
@@ -318,29 +1646,86 @@ class WebsiteAnalyzer:
             # エラーが発生しても処理を続行
             return ""
 
-    async def _save_batch_analysis(
-        self, batch_id: str, results: List[AnalysisResponse]
-    ) -> None:
+    def _history_values(
+        self,
+        url: str,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        is_batch: bool = False,
+        batch_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        cache_source: Optional[str] = None,
+        usage: Optional[UsageTotals] = None,
+        analyzed_at: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
         """
-        一括解析の結果をデータベースに保存する
+        解析履歴の行の値を作成する（IDは生成して設定する）
+
+        既存の結果を再利用した場合は、解析日時に元の解析日時を指定する（キャッシュの有効期限も
+        元の解析日時を起点にする）。
         """
-        for result in results:
-            if result.status == "success":
-                await self._save_analysis_result(
-                    url=result.url,
-                    status="success",
-                    result=result.analysis.dict() if result.analysis else None,
-                    is_batch=True,
-                    batch_id=batch_id,
-                )
-            else:
-                await self._save_analysis_result(
-                    url=result.url,
-                    status="failed",
-                    error=result.error,
-                    is_batch=True,
-                    batch_id=batch_id,
-                )
+        analyzed_at = analyzed_at or datetime.utcnow()
+        values = {
+            "id": AnalysisHistory.generate_id(),
+            "url": url,
+            "timestamp": analyzed_at,
+            "analyzed_at": analyzed_at,
+            "status": status,
+            "main_category": None,
+            "confidence": None,
+            "analysis": None,
+            "error": None,
+            "is_batch": is_batch,
+            "batch_id": batch_id,
+            "content_hash": content_hash,
+            "cache_source": cache_source,
+            "provider": None,
+            "input_tokens": None,
+            "output_tokens": None,
+            "cost": None,
+        }
+
+        # AI API呼び出しのトークン使用量を設定
+        if usage is not None and usage.calls:
+            values["provider"] = usage.provider
+            values["input_tokens"] = usage.input_tokens
+            values["output_tokens"] = usage.output_tokens
+            values["cost"] = usage.cost
+
+        # 成功時の情報を設定
+        if status == "success" and result:
+            values["main_category"] = result.get("main_category")
+            values["confidence"] = result.get("confidence")
+            values["analysis"] = result
+
+        # 失敗時のエラー情報を設定
+        if status == "failed" and error:
+            values["error"] = error
+
+        return values
+
+    @staticmethod
+    def _usage_values(
+        history_id: str, usage: Optional[UsageTotals]
+    ) -> List[Dict[str, Any]]:
+        """
+        解析履歴のプロバイダ別のトークン使用量の行の値を作成する
+
+        複数のプロバイダを呼び出した場合は、プロバイダごとに1行作成する（使用量の集計に使用）。
+        """
+        if usage is None or not usage.calls:
+            return []
+        return [
+            {
+                "analysis_id": history_id,
+                "provider": provider,
+                "input_tokens": totals.input_tokens,
+                "output_tokens": totals.output_tokens,
+                "cost": totals.cost,
+            }
+            for provider, totals in usage.by_provider.items()
+        ]
 
     def _convert_to_category_analysis(
         self, analysis_result: Dict[str, Any]
@@ -0,0 +1,440 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.database import (
+    AnalysisHistory,
+    AnalysisUsage,
+    BatchAnalysisHistory,
+    BatchAnalysisItem,
+    BatchAnalysisUrl,
+    PageSnapshot,
+    SessionLocal,
+)
+from app.models.schema import AnalysisResponse
+from app.services.usage_tracker import UsageBudget
+from app.utils.url_normalizer import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# 一括解析の状態
+BATCH_STATUS_QUEUED = "queued"
+BATCH_STATUS_RUNNING = "running"
+BATCH_STATUS_COMPLETED = "completed"
+BATCH_STATUS_FAILED = "failed"
+
+# 一括解析の各URLの状態（pending 以外は結果が確定している）
+URL_STATUS_PENDING = "pending"
+
+# 一括解析を実行するプロセスの識別子（プロセスIDごとに作成する）
+_process_owner: Optional[Tuple[int, str]] = None
+
+
+def process_owner() -> str:
+    """
+    このプロセスの識別子を取得する（一括解析のリースの所有者として記録する）
+
+    Returns:
+        ホスト名・プロセスID・乱数からなる識別子
+    """
+    global _process_owner
+    pid = os.getpid()
+    if _process_owner is None or _process_owner[0] != pid:
+        _process_owner = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}")
+    return _process_owner[1]
+
+
+class BatchResultWriter:
+    """
+    一括解析の結果をまとめてデータベースに書き込むクラス
+
+    この一括解析で解析した結果は、解析履歴（is_batch / batch_id を設定済み）とスナップショットを
+    add_analysis で受け取る。キャッシュなどの既存の解析履歴は関連付けだけを書き込み、
+    保存されていない結果（予算超過で解析しなかったURLなど）は解析履歴を新たに作成する。
+    結果は溜めておき、BATCH_WRITE_CHUNK_SIZE 件または BATCH_PROGRESS_INTERVAL 秒ごとに、
+    進捗と共に1つのトランザクションで複数行のINSERT/UPDATEで書き込む。
+    各URLの状態（batch_analysis_urls）とトークン使用量も同じトランザクションで書き込むため、
+    プロセスが停止しても書き込み済みのURLは再開時に解析し直さない。
+    """
+
+    def __init__(self, batch_id: str, budget: UsageBudget):
+        self.batch_id = batch_id
+        self.budget = budget
+        self.chunk_size = max(settings.BATCH_WRITE_CHUNK_SIZE, 1)
+        self.total_urls = 0
+        self.processed = 0
+        self.success_count = 0
+        self.failed_count = 0
+        # 未書き込みの新しい解析履歴の行・スナップショット（正規化URLごと）・
+        # プロバイダ別のトークン使用量・関連付け
+        self._new_rows: List[Dict[str, Any]] = []
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._usage_rows: List[Dict[str, Any]] = []
+        self._links: List[Dict[str, str]] = []
+        # 未書き込みの各URLの状態
+        self._url_states: List[Dict[str, Any]] = []
+        # 関連付け済み（書き込み待ちを含む）の解析履歴のID
+        self._linked_ids: Set[str] = set()
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def register(
+        batch_id: str, options: Dict[str, Any], status: str = BATCH_STATUS_QUEUED
+    ) -> None:
+        """
+        一括解析の履歴を作成する（URLは register_urls で追加する）
+
+        このプロセスをリースの所有者として記録する。
+
+        Args:
+            batch_id: 一括解析のID
+            options: 再開時に使用する実行時の指定
+            status: 一括解析の状態
+        """
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.add(
+                BatchAnalysisHistory(
+                    batch_id=batch_id,
+                    total_urls=0,
+                    success_count=0,
+                    failed_count=0,
+                    processed_count=0,
+                    status=status,
+                    options=options,
+                    updated_at=now,
+                    owner=process_owner(),
+                    heartbeat_at=now,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def register_urls(batch_id: str, entries: List[Tuple[int, str]]) -> None:
+        """
+        一括解析の対象URLを未処理として追加する
+
+        Args:
+            batch_id: 一括解析のID
+            entries: (入力内での位置, URL)のリスト
+        """
+        chunk_size = max(settings.BATCH_WRITE_CHUNK_SIZE, 1)
+        db = SessionLocal()
+        try:
+            for start in range(0, len(entries), chunk_size):
+                db.execute(
+                    insert(BatchAnalysisUrl),
+                    [
+                        {
+                            "batch_id": batch_id,
+                            "position": position,
+                            "url": url,
+                            "status": URL_STATUS_PENDING,
+                        }
+                        for position, url in entries[start : start + chunk_size]
+                    ],
+                )
+
+            db.execute(
+                update(BatchAnalysisHistory)
+                .where(BatchAnalysisHistory.batch_id == batch_id)
+                .values(total_urls=BatchAnalysisHistory.total_urls + len(entries))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+
+        except Exception:
+            db.rollback()
+            raise
+
+        finally:
+            db.close()
+
+    def start(self, options: Dict[str, Any]) -> None:
+        """
+        一括解析の履歴を実行中にする（登録されていない場合は作成する）
+
+        登録済みの場合は、保存済みの件数・トークン使用量・関連付けを引き継ぐ（ジョブの実行・再開）。
+        いずれの場合もこのプロセスをリースの所有者として記録する。
+
+        Args:
+            options: 再開時に使用する実行時の指定
+        """
+        db = SessionLocal()
+        try:
+            batch = db.get(BatchAnalysisHistory, self.batch_id)
+        finally:
+            db.close()
+
+        if batch is None:
+            self.register(self.batch_id, options, BATCH_STATUS_RUNNING)
+            return
+
+        self.total_urls = batch.total_urls
+        self.processed = batch.processed_count or 0
+        self.success_count = batch.success_count or 0
+        self.failed_count = batch.failed_count or 0
+        self.budget.totals.input_tokens = batch.input_tokens or 0
+        self.budget.totals.output_tokens = batch.output_tokens or 0
+        self.budget.totals.cost = batch.cost or 0.0
+        self.budget.exhausted = bool(batch.budget_exhausted)
+        self._linked_ids = self._load_linked_ids()
+        self.flush(
+            {
+                "status": BATCH_STATUS_RUNNING,
+                "error": None,
+                "completed_at": None,
+                "owner": process_owner(),
+            }
+        )
+
+    def add_urls(self, entries: List[Tuple[int, str]]) -> None:
+        """
+        一括解析の対象URLを未処理として追加する（入力を読み込みながら解析する場合）
+
+        Args:
+            entries: (入力内での位置, URL)のリスト
+        """
+        self.register_urls(self.batch_id, entries)
+        self.total_urls += len(entries)
+
+    def add_analysis(
+        self,
+        row: Dict[str, Any],
+        snapshot: Optional[Dict[str, Any]] = None,
+        usage_rows: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        この一括解析で解析した結果の解析履歴とスナップショットを書き込み対象に加える
+
+        結果は add で各URLの結果として加えた時点で書き込む。
+
+        Args:
+            row: 解析履歴の行
+            snapshot: スナップショットの行
+            usage_rows: プロバイダ別のトークン使用量の行
+        """
+        self._new_rows.append(row)
+        if snapshot is not None:
+            self._snapshots[snapshot["url"]] = snapshot
+        if usage_rows:
+            self._usage_rows.extend(usage_rows)
+
+    def add(self, response: AnalysisResponse, position: int) -> None:
+        """
+        一括解析の1件分の結果を書き込み対象に加える（溜まった場合は書き込む）
+
+        Args:
+            response: 解析結果
+            position: 入力内での位置
+        """
+        self.processed += 1
+        if response.status == "success":
+            self.success_count += 1
+        else:
+            self.failed_count += 1
+
+        history_id = response.history_id
+        if history_id is None:
+            history_id = AnalysisHistory.generate_id()
+            self._new_rows.append(self._history_row(history_id, response))
+
+        if history_id not in self._linked_ids:
+            self._linked_ids.add(history_id)
+            self._links.append({"batch_id": self.batch_id, "analysis_id": history_id})
+
+        self._url_states.append(
+            {
+                "batch_id": self.batch_id,
+                "position": position,
+                "status": "success" if response.status == "success" else "failed",
+                "analysis_id": history_id,
+            }
+        )
+
+        if (
+            len(self._url_states) >= self.chunk_size
+            or time.monotonic() - self._last_flush >= settings.BATCH_PROGRESS_INTERVAL
+        ):
+            try:
+                self.flush()
+            except Exception as e:
+                # 書き込めなかった結果は次回にまとめて書き込む
+                logger.error(
+                    f"一括解析の途中結果の保存中にエラーが発生しました: {str(e)}"
+                )
+
+    def flush(self, values: Optional[Dict[str, Any]] = None) -> None:
+        """
+        溜まっている結果と進捗を書き込む（リースも更新する）
+
+        Args:
+            values: 一括解析の履歴に合わせて設定する値
+        """
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            for rows in self._chunks(self._new_rows):
+                db.execute(insert(AnalysisHistory), rows)
+
+            for rows in self._chunks(self._usage_rows):
+                db.execute(insert(AnalysisUsage), rows)
+
+            for rows in self._chunks(list(self._snapshots.values())):
+                self._upsert_snapshots(db, rows)
+
+            for rows in self._chunks(self._links):
+                db.execute(insert(BatchAnalysisItem), rows)
+
+            # 各URLの状態を主キーごとにまとめて更新
+            for rows in self._chunks(self._url_states):
+                db.execute(update(BatchAnalysisUrl), rows)
+
+            db.execute(
+                update(BatchAnalysisHistory)
+                .where(BatchAnalysisHistory.batch_id == self.batch_id)
+                .values(
+                    processed_count=self.processed,
+                    success_count=self.success_count,
+                    failed_count=self.failed_count,
+                    input_tokens=self.budget.totals.input_tokens,
+                    output_tokens=self.budget.totals.output_tokens,
+                    cost=self.budget.totals.cost,
+                    updated_at=now,
+                    heartbeat_at=now,
+                    **(values or {}),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            db.commit()
+
+        except Exception:
+            db.rollback()
+            raise
+
+        finally:
+            db.close()
+
+        self._new_rows = []
+        self._snapshots = {}
+        self._usage_rows = []
+        self._links = []
+        self._url_states = []
+        self._last_flush = time.monotonic()
+
+    def finish(self) -> None:
+        """
+        残りの結果と、一括解析全体のトークン使用量を書き込んで完了にする
+        """
+        self.flush(
+            {
+                "status": BATCH_STATUS_COMPLETED,
+                "budget_exhausted": self.budget.exhausted,
+                "completed_at": datetime.utcnow(),
+            }
+        )
+        logger.info(
+            f"一括解析の結果を保存しました: {self.batch_id}, 件数={self.processed}, "
+            f"関連付け={len(self._linked_ids)}件"
+        )
+
+    def _load_linked_ids(self) -> Set[str]:
+        """関連付け済みの解析履歴のIDを取得する（再開時に重複して関連付けないため）"""
+        db = SessionLocal()
+        try:
+            rows = db.query(BatchAnalysisItem.analysis_id).filter(
+                BatchAnalysisItem.batch_id == self.batch_id
+            )
+            return {analysis_id for (analysis_id,) in rows}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upsert_snapshots(db: Session, rows: List[Dict[str, Any]]) -> None:
+        """
+        スナップショットを正規化URLごとに追加・更新する
+
+        抽出テキストがない行は保存済みの抽出テキストを残す。PostgreSQL/SQLite 以外では
+        1行ずつ merge する。
+        """
+        dialect = db.get_bind().dialect.name
+        if dialect not in ("postgresql", "sqlite"):
+            for row in rows:
+                values = dict(row)
+                if values["content_text"] is None:
+                    del values["content_text"]
+                db.merge(PageSnapshot(**values))
+            return
+
+        module = postgresql if dialect == "postgresql" else sqlite
+        statement = module.insert(PageSnapshot)
+        excluded = statement.excluded
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[PageSnapshot.url],
+                set_={
+                    "etag": excluded.etag,
+                    "last_modified": excluded.last_modified,
+                    "content_hash": excluded.content_hash,
+                    "content_text": func.coalesce(
+                        excluded.content_text, PageSnapshot.content_text
+                    ),
+                    "history_id": excluded.history_id,
+                    "checked_at": excluded.checked_at,
+                },
+            ),
+            rows,
+        )
+
+    def _history_row(
+        self, history_id: str, response: AnalysisResponse
+    ) -> Dict[str, Any]:
+        """保存されていない解析結果の解析履歴の行を作成する"""
+        now = datetime.utcnow()
+        row = {
+            "id": history_id,
+            "url": normalize_url(response.url),
+            "timestamp": now,
+            "analyzed_at": now,
+            "status": response.status,
+            "main_category": None,
+            "confidence": None,
+            "analysis": None,
+            "error": None,
+            "is_batch": True,
+            "batch_id": self.batch_id,
+            "content_hash": None,
+            "cache_source": None,
+            "provider": None,
+            "input_tokens": None,
+            "output_tokens": None,
+            "cost": None,
+        }
+        if response.status == "success" and response.analysis:
+            analysis = response.analysis.model_dump()
+            row["main_category"] = analysis.get("main_category")
+            row["confidence"] = analysis.get("confidence")
+            row["analysis"] = analysis
+        else:
+            row["status"] = "failed"
+            row["error"] = response.error or "解析に失敗しました"
+        return row
+
+    def _chunks(self, items: List[Any]) -> List[List[Any]]:
+        return [
+            items[i : i + self.chunk_size]
+            for i in range(0, len(items), self.chunk_size)
+        ]
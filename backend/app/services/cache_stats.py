@@ -0,0 +1,58 @@
+import threading
+from typing import Dict
+
+
+class CacheStats:
+    """キャッシュ種別ごとのヒット数・ミス数を集計するクラス（プロセス内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def record_hit(self, name: str) -> None:
+        """キャッシュヒットを記録する"""
+        self._increment(name, "hits")
+
+    def record_miss(self, name: str) -> None:
+        """キャッシュミスを記録する"""
+        self._increment(name, "misses")
+
+    def record_tokens(self, name: str, read_tokens: int, write_tokens: int) -> None:
+        """キャッシュから読み込んだトークン数・キャッシュに書き込んだトークン数を記録する"""
+        with self._lock:
+            counter = self._counter(name)
+            counter["read_tokens"] += read_tokens
+            counter["write_tokens"] += write_tokens
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        現在の集計値を取得する
+
+        Returns:
+            キャッシュ種別ごとのヒット数・ミス数・ヒット率・読み書きトークン数の辞書
+        """
+        with self._lock:
+            result = {}
+            for name, counter in self._counters.items():
+                total = counter["hits"] + counter["misses"]
+                result[name] = {
+                    "hits": counter["hits"],
+                    "misses": counter["misses"],
+                    "hit_rate": counter["hits"] / total if total else 0.0,
+                    "read_tokens": counter["read_tokens"],
+                    "write_tokens": counter["write_tokens"],
+                }
+            return result
+
+    def _increment(self, name: str, key: str) -> None:
+        with self._lock:
+            self._counter(name)[key] += 1
+
+    def _counter(self, name: str) -> Dict[str, int]:
+        return self._counters.setdefault(
+            name, {"hits": 0, "misses": 0, "read_tokens": 0, "write_tokens": 0}
+        )
+
+
+# プロセス内で共有する集計インスタンス
+cache_stats = CacheStats()
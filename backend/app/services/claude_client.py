@@ -1,12 +1,17 @@
-import os
 import json
 import logging
-import asyncio
-import base64
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Tuple
 from anthropic import AsyncAnthropic
 
 from app.core.config import settings
+from app.services.prompt_builder import (
+    build_page_content,
+    estimate_tokens,
+    match_packed_results,
+)
+from app.services.cache_stats import cache_stats
+from app.services.rate_limiter import EXPECTED_OUTPUT_TOKENS, get_rate_limiter
+from app.services.usage_tracker import record_llm_usage
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +43,53 @@ MAIN_CATEGORY = [
 ]
 
 
+# 出力トークン数の上限（モデルの最大値）
+MAX_OUTPUT_TOKENS = 8192
+
+# 全リクエストで共通のシステムプロンプト（指示・カテゴリ候補・出力形式）
+# リクエストごとに変わるURLやページ内容はユーザーメッセージに含め、
+# この部分をプロンプトキャッシュの対象にする
+SYSTEM_PROMPT = f"""あなたはウェブサイト分析の専門家です。ユーザーが提示するウェブサイトを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
+
+メインカテゴリ候補: {MAIN_CATEGORY}
+
+サイトごとに以下の形式のJSONで回答してください：
+```json
+{{
+  "main_category": "メインカテゴリ候補の中から最も適切な1つ",
+  "sub_categories": [
+    {{"name": "サブカテゴリ1", "confidence": 確信度(0.0〜1.0)}},
+    {{"name": "サブカテゴリ2", "confidence": 確信度(0.0〜1.0)}}
+    // 最大5つのサブカテゴリ
+  ],
+  "confidence": 確信度(0.0〜1.0),
+  "description": "このウェブサイトが提供する商品やサービスの簡潔な説明（100字以内）",
+  "target_audience": "想定されるターゲットユーザーや顧客層（100字以内）",
+  "value_proposition": "ウェブサイトが提示している主な価値提案（100字以内）"
+}}
+```
+
+考慮すべき点：
+1. ウェブサイトの主要な目的とターゲットオーディエンス
+2. 提供されている商品やサービスの性質
+3. ウェブサイトで使用されている専門用語や業界特有の表現
+4. 競合他社や類似サービスへの言及
+
+JSONフォーマットのみで正確に回答してください。その他の説明は不要です。
+"""
+
+# プロンプトキャッシュの集計名
+PROMPT_CACHE_NAME = "claude_prompt"
+
+# プロンプトキャッシュを適用できるプレフィックスの最小トークン数（モデル名の先頭で判定）
+# これに満たないプレフィックスはキャッシュされず、キャッシュの指定は効果がない
+PROMPT_CACHE_MIN_TOKENS = {
+    "claude-3-5-haiku": 2048,
+    "claude-3-haiku": 2048,
+}
+DEFAULT_PROMPT_CACHE_MIN_TOKENS = 1024
+
+
 class ClaudeClient:
     def __init__(self):
         self._initialize_client()
@@ -49,8 +101,39 @@ class ClaudeClient:
                 "CLAUDE_API_KEYが設定されていません。環境変数を確認してください。"
             )
 
-        self.client = AsyncAnthropic(api_key=settings.CLAUDE_API_KEY)
+        # 再試行はレートリミッター側で行うため、SDKの自動再試行は無効にする
+        self.client = AsyncAnthropic(api_key=settings.CLAUDE_API_KEY, max_retries=0)
         self.model = "claude-3-5-haiku-20241022"
+        # プロセス内で共有するRPM/TPMのレートリミッター
+        self.rate_limiter = get_rate_limiter("claude")
+        self.prompt_caching = self._can_cache_prefix()
+
+    def _can_cache_prefix(self) -> bool:
+        """
+        システムプロンプトをプロンプトキャッシュの対象にするかどうかを判定する
+
+        CLAUDE_PROMPT_CACHING が有効でも、システムプロンプトの推定トークン数がモデルの
+        最小トークン数に満たない場合はキャッシュされないため、キャッシュを指定しない。
+        """
+        if not settings.CLAUDE_PROMPT_CACHING:
+            return False
+
+        min_tokens = next(
+            (
+                tokens
+                for prefix, tokens in PROMPT_CACHE_MIN_TOKENS.items()
+                if self.model.startswith(prefix)
+            ),
+            DEFAULT_PROMPT_CACHE_MIN_TOKENS,
+        )
+        prefix_tokens = estimate_tokens(SYSTEM_PROMPT)
+        if prefix_tokens < min_tokens:
+            logger.info(
+                f"システムプロンプトが{self.model}のプロンプトキャッシュの最小トークン数に"
+                f"満たないため、キャッシュを指定しません（推定={prefix_tokens}、最小={min_tokens}）"
+            )
+            return False
+        return True
 
     async def analyze_website(self, url: str, content: str) -> Dict[str, Any]:
         """
@@ -67,12 +150,7 @@ class ClaudeClient:
 
         try:
             # Claude APIを使用してコンテンツを分析
-            response = await self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                system="あなたはウェブサイト分析の専門家です。JSONフォーマットで正確に回答してください。",
-                messages=[{"role": "user", "content": prompt}],
-            )
+            response = await self._create_message(prompt, url)
 
             # レスポンスからJSON形式の文字列を抽出
             result_text = response.content[0].text
@@ -85,6 +163,40 @@ class ClaudeClient:
             logger.error(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
             raise Exception(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
 
+    async def analyze_websites_packed(
+        self, pages: List[Tuple[str, str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        複数のウェブサイトを1回のAPI呼び出しでまとめて解析する
+
+        指示文・カテゴリ候補・出力形式を1回分にまとめることで、固定部分のトークンを節約する。
+        回答に含まれなかったURLや形式が不正な回答は結果に含めないため、
+        呼び出し側で個別に解析し直すこと。
+
+        Args:
+            pages: (URL, コンテンツ)のタプルのリスト
+
+        Returns:
+            URLをキーとする解析結果の辞書
+        """
+        prompt = self._create_packed_analysis_prompt(pages)
+
+        try:
+            # サイト数に応じて出力トークンの上限を広げる
+            response = await self._create_message(
+                prompt,
+                f"{len(pages)}件まとめて解析",
+                site_count=len(pages),
+                max_tokens=min(1024 * len(pages), MAX_OUTPUT_TOKENS),
+            )
+
+            result_text = response.content[0].text
+            return match_packed_results(result_text, [url for url, _ in pages])
+
+        except Exception as e:
+            logger.error(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
+            raise Exception(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
+
     async def analyze_website_with_url(self, url: str) -> Dict[str, Any]:
         """
         ウェブサイトのURLを解析してカテゴリを判定する
@@ -99,12 +211,7 @@ class ClaudeClient:
 
         try:
             # Claude APIを使用してコンテンツを分析
-            response = await self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                system="あなたはウェブサイト分析の専門家です。JSONフォーマットで正確に回答してください。",
-                messages=[{"role": "user", "content": prompt}],
-            )
+            response = await self._create_message(prompt, url)
 
             # レスポンスからJSON形式の文字列を抽出
             result_text = response.content[0].text
@@ -117,72 +224,130 @@ class ClaudeClient:
             logger.error(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
             raise Exception(f"Claude APIの呼び出し中にエラーが発生しました: {str(e)}")
 
+    async def _create_message(
+        self, prompt: str, label: str, site_count: int = 1, max_tokens: int = 1024
+    ) -> Any:
+        """
+        レート制限と再試行を適用してClaude APIを呼び出す
+
+        固定のシステムプロンプトを送信し（キャッシュできる長さの場合はキャッシュ対象の
+        プレフィックスとして指定する）、キャッシュの読み込み・書き込みトークン数を併せて記録する。
+
+        Args:
+            prompt: ユーザーメッセージ（サイトごとに変わる部分）
+            label: ログに出力する呼び出しの説明（URLなど）
+            site_count: プロンプトに含まれるサイト数（出力トークンの見込みに使用）
+            max_tokens: 出力トークン数の上限
+
+        Returns:
+            Claude APIのレスポンス
+        """
+        estimated_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt)
+
+        # TPMの事前確保には出力トークンの見込みを加える
+        reserved_tokens = estimated_tokens + EXPECTED_OUTPUT_TOKENS * site_count
+
+        response = await self.rate_limiter.call(
+            lambda: self.client.messages.create(
+                model=self.model,
+                max_tokens=max_tokens,
+                system=self._system_blocks(),
+                messages=[{"role": "user", "content": prompt}],
+            ),
+            reserved_tokens,
+        )
+
+        # キャッシュから読み込んだ分・キャッシュに書き込んだ分は input_tokens に含まれない
+        usage = response.usage
+        cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+        input_tokens = usage.input_tokens + cache_read_tokens + cache_write_tokens
+        self.rate_limiter.record_usage(
+            reserved_tokens, input_tokens + usage.output_tokens
+        )
+
+        if self.prompt_caching:
+            if cache_read_tokens:
+                cache_stats.record_hit(PROMPT_CACHE_NAME)
+            else:
+                cache_stats.record_miss(PROMPT_CACHE_NAME)
+            cache_stats.record_tokens(
+                PROMPT_CACHE_NAME, cache_read_tokens, cache_write_tokens
+            )
+
+        cost = record_llm_usage(
+            "claude",
+            input_tokens,
+            usage.output_tokens,
+            cache_read_tokens,
+            cache_write_tokens,
+        )
+
+        # 入力と出力のトークン数を推定値と併せて記録
+        logger.info(
+            f"Claudeトークン使用量: {label}, 入力={input_tokens}（推定={estimated_tokens}、"
+            f"キャッシュ読込={cache_read_tokens}、キャッシュ書込={cache_write_tokens}）, "
+            f"出力={usage.output_tokens}, コスト=${cost:.6f}"
+        )
+        return response
+
+    def _system_blocks(self) -> List[Dict[str, Any]]:
+        """
+        システムプロンプトのブロックを作成する
+
+        CLAUDE_PROMPT_CACHING が有効で、システムプロンプトがモデルの最小トークン数以上の
+        場合のみ、プロンプトキャッシュの対象として指定する。
+        """
+        block: Dict[str, Any] = {"type": "text", "text": SYSTEM_PROMPT}
+        if self.prompt_caching:
+            block["cache_control"] = {"type": "ephemeral"}
+        return [block]
+
     def _create_analysis_prompt(self, url: str, content: str) -> str:
-        """解析用のプロンプトを作成する"""
+        """解析用のプロンプト（ユーザーメッセージ）を作成する"""
+        # トークン予算内に収まるようにページ内容を組み立てる
+        page_content = build_page_content(content, settings.CLAUDE_INPUT_TOKEN_BUDGET)
+
         prompt = f"""
-あなたはウェブサイト分析の専門家です。以下のウェブサイトのコンテンツを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
+以下のウェブサイトのコンテンツを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
 
 ウェブサイトURL: {url}
-ウェブサイトのコンテンツ: {content[:10000]}
-メインカテゴリ候補: {MAIN_CATEGORY}
+ウェブサイトのコンテンツ: {page_content}
+"""
+        return prompt
 
-以下の形式でJSON形式で回答してください：
-```json
-{{
-  "main_category": "メインカテゴリ候補の中から最も適切な1つ",
-  "sub_categories": [
-    {{"name": "サブカテゴリ1", "confidence": 確信度(0.0〜1.0)}},
-    {{"name": "サブカテゴリ2", "confidence": 確信度(0.0〜1.0)}}
-    // 最大5つのサブカテゴリ
-  ],
-  "confidence": 確信度(0.0〜1.0),
-  "description": "このウェブサイトが提供する商品やサービスの簡潔な説明（100字以内）",
-  "target_audience": "想定されるターゲットユーザーや顧客層（100字以内）",
-  "value_proposition": "ウェブサイトが提示している主な価値提案（100字以内）"
-}}
-```
+    def _create_packed_analysis_prompt(self, pages: List[Tuple[str, str]]) -> str:
+        """複数サイトをまとめて解析するプロンプト（ユーザーメッセージ）を作成する"""
+        site_blocks = []
+        for index, (url, content) in enumerate(pages, start=1):
+            # サイトごとのトークン予算内に収まるようにページ内容を組み立てる
+            page_content = build_page_content(
+                content, settings.LLM_PACK_SITE_TOKEN_BUDGET
+            )
+            site_blocks.append(
+                f"### サイト{index}\nウェブサイトURL: {url}\nウェブサイトのコンテンツ: {page_content}"
+            )
+        sites = "\n\n".join(site_blocks)
 
-考慮すべき点：
-1. ウェブサイトの主要な目的とターゲットオーディエンス
-2. 提供されている商品やサービスの性質
-3. ウェブサイトで使用されている専門用語や業界特有の表現
-4. 競合他社や類似サービスへの言及
+        prompt = f"""
+以下の{len(pages)}件のウェブサイトのコンテンツをそれぞれ分析し、各ビジネスまたはサービスが属するカテゴリを特定してください。
+
+{sites}
 
-JSONフォーマットのみで回答してください。その他の説明は不要です。
+全てのサイトについて、指定の形式のJSONに"url"（入力と同じURLをそのまま記載）を加えた要素のJSON配列で回答してください。
+他のサイトの内容と混同せず、サイトごとに独立して判断してください。
 """
         return prompt
 
     def _create_analysis_with_url_prompt(self, url: str) -> str:
-        """URLのみの解析用プロンプトを作成する"""
+        """URLのみの解析用プロンプト（ユーザーメッセージ）を作成する"""
         prompt = f"""
-あなたはウェブサイト分析の専門家です。以下のウェブサイトのURLを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
+以下のウェブサイトのURLを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
 
 ウェブサイトURL: {url}
-メインカテゴリ候補: {MAIN_CATEGORY}
-
-以下の形式でJSON形式で回答してください：
-```json
-{{
-  "main_category": "メインカテゴリ候補の中から最も適切な1つ",
-  "sub_categories": [
-    {{"name": "サブカテゴリ1", "confidence": 確信度(0.0〜1.0)}},
-    {{"name": "サブカテゴリ2", "confidence": 確信度(0.0〜1.0)}}
-    // 最大5つのサブカテゴリ
-  ],
-  "confidence": 確信度(0.0〜1.0),
-  "description": "このウェブサイトが提供する商品やサービスの簡潔な説明（100字以内）",
-  "target_audience": "想定されるターゲットユーザーや顧客層（100字以内）",
-  "value_proposition": "ウェブサイトが提示している主な価値提案（100字以内）"
-}}
-```
-
-考慮すべき点：
-1. ウェブサイトのURLから読み取れるドメイン名や構造
-2. ウェブサイトの主要な目的とターゲットオーディエンス
-3. 提供されている可能性のある商品やサービスの性質
 
+コンテンツは取得できていないため、URLから読み取れるドメイン名や構造をもとに判断してください。
 URLだけからの判断なので、確信度は低く設定してください。
-JSONフォーマットのみで回答してください。その他の説明は不要です。
 """
         return prompt
 
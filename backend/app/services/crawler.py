@@ -1,16 +1,133 @@
+import codecs
 import logging
-import requests
-from bs4 import BeautifulSoup
-from typing import Tuple, Optional
+import re
+import httpx
+from typing import Dict, Tuple, Optional
+
+from app.core.config import settings
+from app.services.host_scheduler import get_host_scheduler
+from app.services.html_extractor import extract_text, extract_text_async
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+
+# ホストからの制限応答とみなすステータスコード
+THROTTLE_STATUS_CODES = {429, 503}
+
+# 解析対象とするContent-Type
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+
+# ヘッダー・metaタグから文字コードを取り出すパターン
+CHARSET_PATTERN = re.compile(rb"charset\s*=\s*[\"']?\s*([a-zA-Z0-9_\-:.]+)", re.I)
+
+# metaタグを探す本文先頭のバイト数
+META_SCAN_BYTES = 4096
+
+# BOMと文字コードの対応
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+# 上位互換の文字コードに読み替える（日本語サイトで多い表記ゆれ）
+ENCODING_ALIASES = {
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "sjis": "cp932",
+    "x-sjis": "cp932",
+    "windows-31j": "cp932",
+    "euc-jp": "euc_jis_2004",
+    "x-euc-jp": "euc_jis_2004",
+}
+
+
+class UnsupportedContentError(Exception):
+    """解析対象外のコンテンツを取得した場合の例外"""
+
+
+# プロセス内で共有するHTTPクライアント（コネクションプール）
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    共有のHTTPクライアントを取得する
+
+    初回呼び出し時にコネクションプール付きのクライアントを作成し、
+    以降は同じクライアントを使い回す（Keep-Alive・HTTP/2による接続再利用）。
+
+    Returns:
+        httpx.AsyncClient のインスタンス
+    """
+    global _http_client
+
+    if _http_client is None or _http_client.is_closed:
+        timeout = httpx.Timeout(
+            connect=settings.CRAWLER_CONNECT_TIMEOUT,
+            read=settings.CRAWLER_READ_TIMEOUT,
+            write=settings.CRAWLER_READ_TIMEOUT,
+            pool=settings.CRAWLER_POOL_TIMEOUT,
+        )
+        limits = httpx.Limits(
+            max_connections=settings.CRAWLER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CRAWLER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.CRAWLER_KEEPALIVE_EXPIRY,
+        )
+        _http_client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=timeout,
+            limits=limits,
+            http2=settings.CRAWLER_HTTP2,
+            follow_redirects=True,
+        )
+        logger.info(
+            f"HTTPクライアントを初期化しました: 最大接続数={settings.CRAWLER_MAX_CONNECTIONS}, "
+            f"HTTP/2={settings.CRAWLER_HTTP2}"
+        )
+
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """共有のHTTPクライアントを閉じる（アプリケーション終了時に呼び出す）"""
+    global _http_client
+
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+class FetchResult:
+    """ページ取得結果"""
+
+    def __init__(
+        self,
+        content: str = "",
+        error: Optional[str] = None,
+        status_code: Optional[int] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        self.content = content
+        self.error = error
+        self.status_code = status_code
+        # 条件付きリクエスト用の検証子
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self) -> bool:
+        """条件付きリクエストに対して304が返されたかどうか"""
+        return self.status_code == 304
+
 
 class WebCrawler:
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        }
+        self.headers = DEFAULT_HEADERS
 
     async def fetch_url_content(self, url: str) -> Tuple[str, Optional[str]]:
         """
@@ -23,60 +140,239 @@ class WebCrawler:
             (テキストコンテンツ, エラーメッセージ)のタプル。
             成功時はエラーメッセージはNone。
         """
+        page = await self.fetch_page(url)
+        return page.content, page.error
+
+    async def fetch_page(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        extract: bool = True,
+    ) -> FetchResult:
+        """
+        URLからHTMLコンテンツを取得し、検証子（ETag/Last-Modified）と共に返す
+
+        検証子を指定した場合は条件付きGETを送り、ページが更新されていなければ
+        本文を取得せずにnot_modifiedの結果を返す。
+
+        Args:
+            url: 取得対象のURL
+            etag: 前回取得時のETag
+            last_modified: 前回取得時のLast-Modified
+            extract: テキストを抽出するかどうか（Falseの場合はデコードしたHTMLを返す）
+
+        Returns:
+            取得結果
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response, body = await self._get_with_politeness(url, headers)
+
+            if response.status_code == 304:
+                return FetchResult(
+                    status_code=304,
+                    etag=response.headers.get("ETag", etag),
+                    last_modified=response.headers.get("Last-Modified", last_modified),
+                )
+
             response.raise_for_status()
 
-            # HTMLコンテンツを解析してテキストを抽出
-            html_content = response.text
-            text_content = self._extract_text_from_html(html_content)
+            # 文字コードを判定してからデコードし、テキストを抽出
+            html_content = self._decode_body(response, body)
+            if extract:
+                html_content = await extract_text_async(html_content)
+
+            return FetchResult(
+                content=html_content,
+                status_code=response.status_code,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
 
-            return text_content, None
+        except UnsupportedContentError as e:
+            return FetchResult(error=str(e))
 
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, httpx.InvalidURL, httpx.StreamError) as e:
+            # InvalidURL（不正なURL）と StreamError（本文の読み込み失敗）は HTTPError を継承しない
             error_message = f"URLからコンテンツを取得できませんでした: {str(e)}"
-            return "", error_message
+            return FetchResult(error=error_message)
 
-    def _extract_text_from_html(self, html_content: str) -> str:
+    async def _get_with_politeness(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[httpx.Response, bytes]:
         """
-        HTMLからテキストを抽出する
+        ドメインごとの同時接続数・リクエスト間隔を守りながらGETリクエストを送る
+
+        429/503応答の場合はRetry-Afterに従ってドメインへのリクエストを遅らせ、
+        設定回数まで再試行する。本文は成功応答の場合のみ読み込む。
 
         Args:
-            html_content: HTMLコンテンツ
+            url: 取得対象のURL
+            headers: 追加のリクエストヘッダー
 
         Returns:
-            抽出されたテキスト
+            (HTTPレスポンス, 本文のバイト列)のタプル
         """
-        try:
-            soup = BeautifulSoup(html_content, 'html.parser')
+        client = get_http_client()
+        scheduler = get_host_scheduler()
 
-            # スクリプトとスタイルシートを削除
-            for script in soup(["script", "style", "noscript", "iframe"]):
-                script.decompose()
+        attempt = 0
+        while True:
+            body = b""
+            async with scheduler.slot(url):
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.is_success:
+                        body = await self._read_body(response)
 
-            # テキストを抽出
-            text = soup.get_text(separator=" ", strip=True)
+            if (
+                response.status_code not in THROTTLE_STATUS_CODES
+                or attempt >= settings.CRAWLER_THROTTLE_RETRIES
+            ):
+                return response, body
 
-            # メタデータを抽出
-            title = soup.title.string if soup.title else ""
-            meta_description = ""
-            meta_keywords = ""
+            attempt += 1
+            delay = self._parse_retry_after(response.headers.get("Retry-After"))
+            logger.warning(
+                f"ホストから制限応答を受信しました({response.status_code}): {url}, "
+                f"{delay:.1f}秒後に再試行します({attempt}/{settings.CRAWLER_THROTTLE_RETRIES})"
+            )
+            scheduler.defer(url, delay)
 
-            if soup.find("meta", attrs={"name": "description"}):
-                meta_description = soup.find("meta", attrs={"name": "description"}).get(
-                    "content", ""
-                )
+    async def _read_body(self, response: httpx.Response) -> bytes:
+        """
+        レスポンス本文を読み込む
+
+        HTML以外のコンテンツは本文を読まずに中断する。ストリーミングモードでは
+        CRAWLER_MAX_BYTESまで読み込んだ時点で打ち切り、1回の取得で使用する
+        メモリ量を一定に抑える。
+
+        Args:
+            response: ストリーミング中のHTTPレスポンス
+
+        Returns:
+            本文のバイト列
+        """
+        content_type = response.headers.get("Content-Type", "")
+        mime_type = content_type.split(";")[0].strip().lower()
+        if mime_type and mime_type not in HTML_CONTENT_TYPES:
+            raise UnsupportedContentError(
+                f"HTML以外のコンテンツのため解析できません: {mime_type}"
+            )
+
+        if not settings.CRAWLER_STREAMING:
+            return await response.aread()
 
-            if soup.find("meta", attrs={"name": "keywords"}):
-                meta_keywords = soup.find("meta", attrs={"name": "keywords"}).get(
-                    "content", ""
+        max_bytes = settings.CRAWLER_MAX_BYTES
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= max_bytes:
+                logger.info(
+                    f"本文が上限({max_bytes}バイト)に達したため読み込みを打ち切ります: {response.url}"
                 )
+                break
+
+        return b"".join(chunks)[:max_bytes]
+
+    def _decode_body(self, response: httpx.Response, body: bytes) -> str:
+        """
+        本文をデコードする
+
+        文字コードはContent-Typeヘッダー、BOM、metaタグの順に判定し、
+        判定できない場合はUTF-8、Shift_JIS(cp932)の順に試す。
+        本文全体に対する文字コード推定は行わない。
 
-            # メタデータとテキストを組み合わせて返す
-            combined_text = f"Title: {title}\nDescription: {meta_description}\nKeywords: {meta_keywords}\n\nContent:\n{text}"
+        Args:
+            response: HTTPレスポンス
+            body: 本文のバイト列
+
+        Returns:
+            デコードされたHTML
+        """
+        encoding = self._detect_encoding(response.headers.get("Content-Type", ""), body)
+
+        if encoding is None:
+            try:
+                return codecs.getincrementaldecoder("utf-8")().decode(body, final=False)
+            except UnicodeDecodeError:
+                encoding = "cp932"
+
+        # 上限で打ち切った本文の末尾にある不完全なマルチバイト文字は捨てる
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        return decoder.decode(body, final=False)
 
-            return combined_text
+    def _detect_encoding(self, content_type: str, body: bytes) -> Optional[str]:
+        """
+        ヘッダー・BOM・metaタグから文字コードを判定する
+
+        Args:
+            content_type: Content-Typeヘッダーの値
+            body: 本文のバイト列
+
+        Returns:
+            Pythonで利用できる文字コード名。判定できない場合はNone
+        """
+        candidates = []
 
-        except Exception as e:
-            # HTMLのパースに失敗した場合は元のHTMLを返す
-            return html_content
+        header_match = CHARSET_PATTERN.search(content_type.encode("latin-1", "ignore"))
+        if header_match:
+            candidates.append(header_match.group(1))
+
+        for bom, bom_encoding in BOM_ENCODINGS:
+            if body.startswith(bom):
+                candidates.append(bom_encoding.encode())
+                break
+
+        meta_match = CHARSET_PATTERN.search(body[:META_SCAN_BYTES])
+        if meta_match:
+            candidates.append(meta_match.group(1))
+
+        for candidate in candidates:
+            name = candidate.decode("ascii", "ignore").strip().lower()
+            name = ENCODING_ALIASES.get(name, name)
+            try:
+                return codecs.lookup(name).name
+            except LookupError:
+                continue
+
+        return None
+
+    def _parse_retry_after(self, value: Optional[str]) -> float:
+        """
+        Retry-Afterヘッダーから待機秒数を求める
+
+        Args:
+            value: Retry-Afterヘッダーの値（秒数のみ対応）
+
+        Returns:
+            待機秒数（上限はCRAWLER_MAX_RETRY_AFTER）
+        """
+        delay = settings.CRAWLER_PER_HOST_DELAY * 2
+        if value:
+            try:
+                delay = float(value)
+            except ValueError:
+                # HTTP日付形式の場合は既定値を使う
+                pass
+
+        return min(max(delay, 0.0), settings.CRAWLER_MAX_RETRY_AFTER)
+
+    def _extract_text_from_html(self, html_content: str) -> str:
+        """
+        HTMLからテキストを抽出する
+
+        Args:
+            html_content: HTMLコンテンツ
+
+        Returns:
+            抽出されたテキスト
+        """
+        return extract_text(html_content)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import math
+import random
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.services.gemini_client import MAIN_CATEGORY
+from app.services.prompt_builder import build_page_content, estimate_tokens
+from app.services.rate_limiter import EXPECTED_OUTPUT_TOKENS, get_rate_limiter
+from app.services.usage_tracker import PROMPT_OVERHEAD_TOKENS, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+# p95 を求めるための標準正規分布の分位点
+Z_95 = 1.645
+
+
+class FakeAPIError(Exception):
+    """擬似的なAPIエラー（ステータスコードでレートリミッターの再試行対象を判定する）"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+
+
+class FakeAIClient:
+    """
+    APIキーやネットワークなしで解析処理を動かすための擬似AIクライアント
+
+    応答時間は中央値とp95を指定した対数正規分布に従い、指定した確率で
+    500エラーや429エラーを返す。判定結果はURLから決まるカテゴリで、
+    CategoryAnalysis の形式に従う。負荷試験やレイテンシ計測に使用する。
+    """
+
+    def __init__(self):
+        self._random = random.Random(settings.FAKE_AI_SEED or None)
+        # 429応答時の再試行やトークン数の精算を本物のクライアントと同じ経路で行う
+        self.rate_limiter = get_rate_limiter("fake")
+
+        median = max(settings.FAKE_AI_LATENCY_MEDIAN, 0.0)
+        p95 = max(settings.FAKE_AI_LATENCY_P95, median)
+        self._latency_mu = math.log(median) if median > 0 else None
+        self._latency_sigma = math.log(p95 / median) / Z_95 if median > 0 else 0.0
+
+        logger.info(
+            f"擬似AIクライアントを初期化しました: 応答時間の中央値={median}秒, p95={p95}秒, "
+            f"エラー率={settings.FAKE_AI_ERROR_RATE}, 429の割合={settings.FAKE_AI_RATE_LIMIT_RATE}"
+        )
+
+    async def analyze_website(self, url: str, content: str) -> Dict[str, Any]:
+        """
+        ウェブサイトの内容を解析したとみなし、擬似的な解析結果を返す
+
+        Args:
+            url: 解析対象のURL
+            content: ウェブサイトのコンテンツ
+
+        Returns:
+            解析結果の辞書
+        """
+        page_content = build_page_content(content, settings.GEMINI_INPUT_TOKEN_BUDGET)
+        input_tokens = PROMPT_OVERHEAD_TOKENS + estimate_tokens(page_content)
+        await self._call(url, input_tokens, 1)
+        return self._create_result(url)
+
+    async def analyze_websites_packed(
+        self, pages: List[Tuple[str, str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        複数のウェブサイトをまとめて解析したとみなし、擬似的な解析結果を返す
+
+        Args:
+            pages: (URL, コンテンツ)のタプルのリスト
+
+        Returns:
+            URLをキーとする解析結果の辞書
+        """
+        input_tokens = PROMPT_OVERHEAD_TOKENS + sum(
+            estimate_tokens(
+                build_page_content(content, settings.LLM_PACK_SITE_TOKEN_BUDGET)
+            )
+            for _, content in pages
+        )
+        await self._call(f"{len(pages)}件まとめて解析", input_tokens, len(pages))
+        return {url: self._create_result(url) for url, _ in pages}
+
+    async def analyze_website_with_url(self, url: str) -> Dict[str, Any]:
+        """URLのみから解析したとみなし、擬似的な解析結果を返す"""
+        await self._call(url, PROMPT_OVERHEAD_TOKENS, 1)
+        result = self._create_result(url)
+        result["confidence"] = round(result["confidence"] / 2, 2)
+        return result
+
+    async def _call(self, label: str, input_tokens: int, site_count: int) -> None:
+        """
+        レート制限を適用して擬似的なAPI呼び出しを行い、トークン使用量を記録する
+
+        Args:
+            label: ログに出力する呼び出しの説明（URLなど）
+            input_tokens: 推定入力トークン数（FAKE_AI_INPUT_TOKENS が指定されていればそちらを使う）
+            site_count: 解析するサイト数
+        """
+        if settings.FAKE_AI_INPUT_TOKENS > 0:
+            input_tokens = settings.FAKE_AI_INPUT_TOKENS * site_count
+        output_tokens = settings.FAKE_AI_OUTPUT_TOKENS * site_count
+        reserved_tokens = input_tokens + EXPECTED_OUTPUT_TOKENS * site_count
+
+        await self.rate_limiter.call(self._respond, reserved_tokens)
+
+        self.rate_limiter.record_usage(reserved_tokens, input_tokens + output_tokens)
+        record_llm_usage("fake", input_tokens, output_tokens)
+        logger.debug(
+            f"擬似AIトークン使用量: {label}, 入力={input_tokens}, 出力={output_tokens}"
+        )
+
+    async def _respond(self) -> None:
+        """応答時間だけ待機し、指定した確率でエラーを発生させる"""
+        await asyncio.sleep(self._sample_latency())
+
+        roll = self._random.random()
+        if roll < settings.FAKE_AI_RATE_LIMIT_RATE:
+            raise FakeAPIError(429, "擬似的なレート制限エラー (429)")
+        if roll < settings.FAKE_AI_RATE_LIMIT_RATE + settings.FAKE_AI_ERROR_RATE:
+            raise FakeAPIError(500, "擬似的なサーバーエラー (500)")
+
+    def _sample_latency(self) -> float:
+        """対数正規分布から応答時間（秒）を1つ取り出す"""
+        if self._latency_mu is None:
+            return 0.0
+        return self._random.lognormvariate(self._latency_mu, self._latency_sigma)
+
+    def _create_result(self, url: str) -> Dict[str, Any]:
+        """URLから決まるカテゴリで、CategoryAnalysis の形式の解析結果を作成する"""
+        seed = zlib.crc32(url.encode("utf-8"))
+        main_category = MAIN_CATEGORY[seed % len(MAIN_CATEGORY)]
+        sub_category = MAIN_CATEGORY[(seed // len(MAIN_CATEGORY)) % len(MAIN_CATEGORY)]
+        confidence = round(self._random.uniform(0.6, 0.95), 2)
+
+        return {
+            "main_category": main_category,
+            "sub_categories": [
+                {"name": f"{main_category}（擬似）", "confidence": confidence},
+                {"name": sub_category, "confidence": round(confidence / 3, 2)},
+            ],
+            "confidence": confidence,
+            "description": f"{url} の擬似的な解析結果です",
+            "target_audience": "負荷試験用の擬似データ",
+            "value_proposition": "負荷試験用の擬似データ",
+        }
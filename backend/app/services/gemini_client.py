@@ -1,9 +1,18 @@
+import asyncio
 import json
 import logging
 import google.generativeai as genai
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 
 from app.core.config import settings
+from app.services.prompt_builder import (
+    build_page_content,
+    estimate_tokens,
+    match_packed_results,
+)
+from app.services.rate_limiter import EXPECTED_OUTPUT_TOKENS, get_rate_limiter
+from app.services.usage_tracker import record_llm_usage
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +46,11 @@ MAIN_CATEGORY = [
 class GeminiClient:
     def __init__(self):
         self._initialize_client()
+        # 同時に実行するGemini API呼び出し数の上限
+        self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # プロセス内で共有するRPM/TPMのレートリミッター
+        self.rate_limiter = get_rate_limiter("gemini")
 
     def _initialize_client(self):
         """Gemini APIクライアントを初期化する"""
@@ -62,22 +76,8 @@ class GeminiClient:
         prompt = self._create_analysis_prompt(url, content)
 
         try:
-            response = self.model.generate_content(prompt)
-
-            # レスポンスからトークン使用量を取得
-            usage_metadata = response.usage_metadata
-
-            # 入力と出力のトークン数を表示
-            input_tokens = usage_metadata.prompt_token_count
-            output_tokens = usage_metadata.candidates_token_count
-            total_tokens = input_tokens + output_tokens
-
-            print(f"入力トークン数: {input_tokens}")
-            print(f"出力トークン数: {output_tokens}")
-            print(f"合計トークン数: {total_tokens}")
-
             # レスポンスからJSON形式の文字列を抽出
-            result_text = response.text
+            result_text = await self._generate_text(prompt, url, 1)
 
             # JSON文字列をパースして返す
             parsed_result = self._parse_response(result_text)
@@ -86,13 +86,109 @@ class GeminiClient:
         except Exception as e:
             raise Exception(f"Gemini APIの呼び出し中にエラーが発生しました: {str(e)}")
 
+    async def analyze_websites_packed(
+        self, pages: List[Tuple[str, str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        複数のウェブサイトを1回のAPI呼び出しでまとめて解析する
+
+        指示文・カテゴリ候補・出力形式を1回分にまとめることで、固定部分のトークンを節約する。
+        回答に含まれなかったURLや形式が不正な回答は結果に含めないため、
+        呼び出し側で個別に解析し直すこと。
+
+        Args:
+            pages: (URL, コンテンツ)のタプルのリスト
+
+        Returns:
+            URLをキーとする解析結果の辞書
+        """
+        prompt = self._create_packed_analysis_prompt(pages)
+
+        try:
+            result_text = await self._generate_text(
+                prompt, f"{len(pages)}件まとめて解析", len(pages)
+            )
+            return self._parse_packed_response(result_text, [url for url, _ in pages])
+
+        except Exception as e:
+            raise Exception(f"Gemini APIの呼び出し中にエラーが発生しました: {str(e)}")
+
+    async def _generate_text(self, prompt: str, label: str, site_count: int) -> str:
+        """
+        同時実行数・レート制限を適用してGemini APIを呼び出し、応答テキストを返す
+
+        Args:
+            prompt: プロンプト
+            label: ログに出力する呼び出しの説明（URLなど）
+            site_count: プロンプトに含まれるサイト数（出力トークンの見込みに使用）
+
+        Returns:
+            応答テキスト
+        """
+        estimated_tokens = estimate_tokens(prompt)
+
+        # TPMの事前確保には出力トークンの見込みを加える
+        reserved_tokens = estimated_tokens + EXPECTED_OUTPUT_TOKENS * site_count
+
+        async with self._semaphore:
+            response = await self.rate_limiter.call(
+                lambda: self._generate_content(prompt), reserved_tokens
+            )
+
+        # レスポンスからトークン使用量を取得
+        usage_metadata = response.usage_metadata
+
+        # 入力と出力のトークン数を推定値と併せて記録
+        input_tokens = usage_metadata.prompt_token_count
+        output_tokens = usage_metadata.candidates_token_count
+        total_tokens = input_tokens + output_tokens
+        self.rate_limiter.record_usage(reserved_tokens, total_tokens)
+        cost = record_llm_usage("gemini", input_tokens, output_tokens)
+
+        logger.info(
+            f"Geminiトークン使用量: {label}, 入力={input_tokens}"
+            f"（推定={estimated_tokens}）, 出力={output_tokens}, 合計={total_tokens}, "
+            f"コスト=${cost:.6f}"
+        )
+
+        return response.text
+
+    async def _generate_content(self, prompt: str) -> Any:
+        """
+        イベントループを止めずにGemini APIでコンテンツを生成する
+
+        GEMINI_ASYNC_MODE が "executor" の場合は同期APIを専用のスレッドプールで実行し、
+        それ以外はSDKの非同期APIを使用する。
+
+        Args:
+            prompt: プロンプト
+
+        Returns:
+            Gemini APIのレスポンス
+        """
+        if settings.GEMINI_ASYNC_MODE.lower() == "executor":
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.GEMINI_MAX_CONCURRENCY,
+                    thread_name_prefix="gemini",
+                )
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, self.model.generate_content, prompt
+            )
+
+        return await self.model.generate_content_async(prompt)
+
     def _create_analysis_prompt(self, url: str, content: str) -> str:
         """解析用のプロンプトを作成する"""
+        # トークン予算内に収まるようにページ内容を組み立てる
+        page_content = build_page_content(content, settings.GEMINI_INPUT_TOKEN_BUDGET)
+
         prompt = f"""
 あなたはウェブサイト分析の専門家です。以下のウェブサイトのコンテンツを分析し、そのビジネスまたはサービスが属するカテゴリを特定してください。
 
 ウェブサイトURL: {url}
-ウェブサイトのコンテンツ: {content[:10000]}
+ウェブサイトのコンテンツ: {page_content}
 メインカテゴリ候補: {MAIN_CATEGORY}
 
 以下の形式でJSON形式で回答してください：
@@ -121,6 +217,70 @@ JSONフォーマットのみで回答してください。その他の説明は
 """
         return prompt
 
+    def _create_packed_analysis_prompt(self, pages: List[Tuple[str, str]]) -> str:
+        """複数サイトをまとめて解析するプロンプトを作成する"""
+        site_blocks = []
+        for index, (url, content) in enumerate(pages, start=1):
+            # サイトごとのトークン予算内に収まるようにページ内容を組み立てる
+            page_content = build_page_content(
+                content, settings.LLM_PACK_SITE_TOKEN_BUDGET
+            )
+            site_blocks.append(
+                f"### サイト{index}\nウェブサイトURL: {url}\nウェブサイトのコンテンツ: {page_content}"
+            )
+        sites = "\n\n".join(site_blocks)
+
+        prompt = f"""
+あなたはウェブサイト分析の専門家です。以下の{len(pages)}件のウェブサイトのコンテンツをそれぞれ分析し、各ビジネスまたはサービスが属するカテゴリを特定してください。
+
+{sites}
+
+メインカテゴリ候補: {MAIN_CATEGORY}
+
+全てのサイトについて、以下の形式のJSON配列で回答してください（"url"には入力と同じURLをそのまま記載してください）：
+```json
+[
+  {{
+    "url": "ウェブサイトURL",
+    "main_category": "メインカテゴリ候補の中から最も適切な1つ",
+    "sub_categories": [
+      {{"name": "サブカテゴリ1", "confidence": 確信度(0.0〜1.0)}},
+      {{"name": "サブカテゴリ2", "confidence": 確信度(0.0〜1.0)}}
+      // 最大5つのサブカテゴリ
+    ],
+    "confidence": 確信度(0.0〜1.0),
+    "description": "このウェブサイトが提供する商品やサービスの簡潔な説明（100字以内）",
+    "target_audience": "想定されるターゲットユーザーや顧客層（100字以内）",
+    "value_proposition": "ウェブサイトが提示している主な価値提案（100字以内）"
+  }}
+]
+```
+
+考慮すべき点：
+1. ウェブサイトの主要な目的とターゲットオーディエンス
+2. 提供されている商品やサービスの性質
+3. ウェブサイトで使用されている専門用語や業界特有の表現
+4. 他のサイトの内容と混同せず、サイトごとに独立して判断すること
+
+JSONフォーマットのみで回答してください。その他の説明は不要です。
+"""
+        return prompt
+
+    def _parse_packed_response(
+        self, response_text: str, urls: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        まとめて解析した際のレスポンスをパースし、URLごとの結果に対応付ける
+
+        Args:
+            response_text: Gemini APIからのレスポンステキスト
+            urls: プロンプトに含めたURLのリスト
+
+        Returns:
+            URLをキーとする解析結果の辞書（対応付けできなかったURLは含まない）
+        """
+        return match_packed_results(response_text, urls)
+
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """
         Gemini APIからのレスポンスをパースする
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from app.core.config import settings
+from app.utils.url_normalizer import get_registrable_domain
+
+logger = logging.getLogger(__name__)
+
+
+class _HostState:
+    """ドメインごとのスケジューリング状態"""
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # 次のリクエストを開始できる時刻（イベントループ時刻）
+        self.next_request_at = 0.0
+        # このドメインの処理待ち・処理中のリクエスト数
+        self.pending = 0
+
+
+class HostScheduler:
+    """
+    ドメイン単位の同時接続数とリクエスト間隔を制御するスケジューラ
+
+    同一ドメインへのリクエストは同時接続数と最小間隔で絞り込み、
+    全体の同時実行数はグローバル上限で制限する。
+    ドメインごとの待機はグローバル枠を確保する前に行うため、
+    あるドメインが待機中でも他ドメインのリクエストは流れ続ける。
+    """
+
+    # 状態の掃除を行うドメイン数の閾値
+    PRUNE_THRESHOLD = 1024
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        per_host_concurrency: int,
+        per_host_delay: float,
+    ):
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_delay = per_host_delay
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, _HostState] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """
+        URLのドメインに対するリクエスト枠を確保する
+
+        Args:
+            url: リクエスト対象のURL
+        """
+        host = get_registrable_domain(url)
+        state = self._hosts.get(host)
+        if state is None:
+            self._prune()
+            state = _HostState(self.per_host_concurrency)
+            self._hosts[host] = state
+
+        state.pending += 1
+        try:
+            async with state.semaphore:
+                await self._wait_for_turn(state)
+                async with self._global:
+                    yield
+        finally:
+            state.pending -= 1
+
+    def defer(self, url: str, delay: float) -> None:
+        """
+        ドメインへの次回リクエストを指定秒数だけ遅らせる（429/503応答時など）
+
+        Args:
+            url: 対象のURL
+            delay: 遅延させる秒数
+        """
+        state = self._hosts.get(get_registrable_domain(url))
+        if state is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        state.next_request_at = max(state.next_request_at, loop.time() + delay)
+        logger.info(
+            f"ドメインへのリクエストを{delay:.1f}秒遅延させます: {get_registrable_domain(url)}"
+        )
+
+    def _prune(self) -> None:
+        """利用されなくなったドメインの状態を破棄する"""
+        if len(self._hosts) < self.PRUNE_THRESHOLD:
+            return
+
+        now = asyncio.get_running_loop().time()
+        idle_hosts = [
+            host
+            for host, state in self._hosts.items()
+            if state.pending == 0 and state.next_request_at <= now
+        ]
+        for host in idle_hosts:
+            del self._hosts[host]
+
+    async def _wait_for_turn(self, state: _HostState) -> None:
+        """ドメインの最小リクエスト間隔が経過するまで待機する"""
+        # 開始時刻の予約はawaitを挟まずに行うため、ロックは不要
+        now = asyncio.get_running_loop().time()
+        start_at = max(now, state.next_request_at)
+        state.next_request_at = start_at + self.per_host_delay
+
+        wait = start_at - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# プロセス内で共有するスケジューラ
+_host_scheduler: Optional[HostScheduler] = None
+
+
+def get_host_scheduler() -> HostScheduler:
+    """共有のホストスケジューラを取得する"""
+    global _host_scheduler
+
+    if _host_scheduler is None:
+        _host_scheduler = HostScheduler(
+            max_concurrency=settings.CRAWLER_GLOBAL_CONCURRENCY,
+            per_host_concurrency=settings.CRAWLER_PER_HOST_CONCURRENCY,
+            per_host_delay=settings.CRAWLER_PER_HOST_DELAY,
+        )
+
+    return _host_scheduler
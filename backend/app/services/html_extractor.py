@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# テキスト抽出の対象外とするタグ
+REMOVED_TAGS = ("script", "style", "noscript", "iframe")
+
+# 本文選択時に除去するナビゲーション・フッターなどの定型要素
+CHROME_TAGS = ("nav", "header", "footer", "aside", "form", "button", "select", "svg")
+
+# 定型要素とみなすid/class名のパターン（メニュー・Cookieバナー・SNS共有など）
+CHROME_PATTERN = re.compile(
+    r"(^|[-_\s])(nav|navi|navigation|menu|gnav|globalnav|breadcrumbs?|pankuzu|"
+    r"header|footer|sidebar|side|sns|share|social|cookie|consent|gdpr|banner|"
+    r"modal|popup|pagetop|to-top)([-_\s]|$)",
+    re.I,
+)
+
+# テキストブロックの区切りとなるブロック要素
+BLOCK_TAGS = {
+    "address",
+    "article",
+    "blockquote",
+    "body",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "figcaption",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "li",
+    "main",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+}
+
+# 見出しとして先頭に配置するタグ
+HEADING_TAGS = ("h1", "h2", "h3")
+
+# 先頭に配置するOGPメタデータ
+OG_PROPERTIES = ("og:title", "og:description", "og:site_name", "og:type")
+
+# 本文として採用するブロックの条件
+MAX_LINK_DENSITY = 0.5
+MIN_BLOCK_CHARS = 10
+MAX_HEADINGS = 20
+
+# 本文選択の結果がこの文字数未満の場合はページ全体のテキストを使う
+MIN_SELECTED_CHARS = 50
+
+# UTF-8に変換したHTMLを読み込むパーサー
+_HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+
+
+def extract_text(html_content: str) -> str:
+    """
+    HTMLからテキストを抽出する
+
+    lxmlで解析し、タイトル・meta description・meta keywords・OGPを1回の走査で取得する。
+    CONTENT_SELECTION_ENABLED が有効な場合は、ナビゲーションなどの定型要素を除き、
+    テキスト密度・リンク密度の高いブロックだけを本文として残す。
+    別プロセスから呼び出せるようにモジュールレベルの関数として定義している。
+
+    Args:
+        html_content: HTMLコンテンツ
+
+    Returns:
+        抽出されたテキスト（Title/Description/Keywords/Contentの形式。
+        本文選択時はOG/Headingsの行を含む）
+    """
+    try:
+        root = lxml_html.document_fromstring(
+            html_content.encode("utf-8"), parser=_HTML_PARSER
+        )
+        select_content = settings.CONTENT_SELECTION_ENABLED
+
+        # メタデータを抽出し、不要なタグを収集
+        title = ""
+        meta_description = ""
+        meta_keywords = ""
+        og_metadata = {}
+        removed_elements = []
+        chrome_elements = []
+
+        for element in root.iter():
+            tag = element.tag
+            if not isinstance(tag, str):
+                # コメントや処理命令は対象外
+                continue
+
+            if tag in REMOVED_TAGS:
+                removed_elements.append(element)
+            elif tag == "title" and not title:
+                title = element.text or ""
+            elif tag == "meta":
+                name = (element.get("name") or "").lower()
+                prop = (element.get("property") or "").lower()
+                if name == "description" and not meta_description:
+                    meta_description = element.get("content", "")
+                elif name == "keywords" and not meta_keywords:
+                    meta_keywords = element.get("content", "")
+                elif prop in OG_PROPERTIES and prop not in og_metadata:
+                    og_metadata[prop] = element.get("content", "").strip()
+            elif select_content and _is_chrome(element):
+                chrome_elements.append(element)
+
+        # スクリプトとスタイルシートを削除（後続のテキストは残す）
+        for element in removed_elements:
+            parent = element.getparent()
+            if parent is not None:
+                element.drop_tree()
+
+        # テキストを抽出
+        text = " ".join(
+            fragment.strip() for fragment in root.itertext() if fragment.strip()
+        )
+
+        if not select_content:
+            # メタデータとテキストを組み合わせて返す
+            combined_text = f"Title: {title}\nDescription: {meta_description}\nKeywords: {meta_keywords}\n\nContent:\n{text}"
+
+            return combined_text
+
+        # 定型要素を除去し、本文ブロックを選択
+        for element in chrome_elements:
+            parent = element.getparent()
+            if parent is not None:
+                element.drop_tree()
+
+        headings, main_text = _select_main_content(root)
+        if len(main_text) < MIN_SELECTED_CHARS:
+            main_text = text
+
+        og_line = ", ".join(
+            f"{key}={value}" for key, value in og_metadata.items() if value
+        )
+        headings_line = " / ".join(headings)
+
+        # 見出し・OGP・本文の順に組み合わせて返す
+        combined_text = (
+            f"Title: {title}\nDescription: {meta_description}\nKeywords: {meta_keywords}\n"
+            f"OG: {og_line}\nHeadings: {headings_line}\n\nContent:\n{main_text}"
+        )
+
+        return combined_text
+
+    except (etree.ParserError, ValueError) as e:
+        # HTMLのパースに失敗した場合は元のHTMLを返す
+        return html_content
+
+
+def _is_chrome(element) -> bool:
+    """
+    ナビゲーション・フッター・Cookieバナーなどの定型要素かどうかを判定する
+
+    本文（main/article/h1）を含む要素は、定型要素らしい名前でも除去しない。
+    """
+    tag = element.tag
+    if tag in ("html", "body", "main", "article"):
+        return False
+
+    if tag not in CHROME_TAGS:
+        names = f"{element.get('id', '')} {element.get('class', '')}"
+        if not CHROME_PATTERN.search(names):
+            return False
+
+    return not element.xpath(".//main|.//article|.//h1")
+
+
+def _select_main_content(root) -> Tuple[List[str], str]:
+    """
+    テキストブロックをテキスト量・リンク密度で評価し、本文を選択する
+
+    ブロック要素ごとにテキストを区切り、リンク密度が高いブロック（メニュー等）や
+    短すぎるブロック、ページ内で繰り返し出現するブロックを除外する。
+
+    Args:
+        root: 解析済みのHTML文書
+
+    Returns:
+        (見出しのリスト, 本文テキスト)のタプル
+    """
+    body = root.find("body")
+    if body is None:
+        body = root
+
+    blocks = []
+    fragments = []
+    link_chars = 0
+    link_depth = 0
+    block_tags = []
+
+    def flush():
+        nonlocal fragments, link_chars
+        block_text = " ".join(fragments)
+        if block_text:
+            block_tag = block_tags[-1] if block_tags else ""
+            blocks.append((block_tag, block_text, link_chars))
+        fragments = []
+        link_chars = 0
+
+    def add_text(value: Optional[str]):
+        nonlocal link_chars
+        if value and value.strip():
+            fragment = value.strip()
+            fragments.append(fragment)
+            if link_depth > 0:
+                link_chars += len(fragment)
+
+    for event, element in etree.iterwalk(body, events=("start", "end")):
+        tag = element.tag
+        if not isinstance(tag, str):
+            # コメントは本文に含めず、後続テキストのみ扱う
+            if event == "end":
+                add_text(element.tail)
+            continue
+
+        if event == "start":
+            if tag in BLOCK_TAGS:
+                flush()
+                block_tags.append(tag)
+            elif tag == "a":
+                link_depth += 1
+            add_text(element.text)
+        else:
+            if tag in BLOCK_TAGS:
+                flush()
+                block_tags.pop()
+            elif tag == "a":
+                link_depth -= 1
+            if element is not body:
+                add_text(element.tail)
+
+    flush()
+
+    # 繰り返し出現するブロック（ヘッダー・フッターの定型文など）を数える
+    occurrences = {}
+    for _, block_text, _ in blocks:
+        occurrences[block_text] = occurrences.get(block_text, 0) + 1
+
+    headings = []
+    selected = []
+    for block_tag, block_text, block_link_chars in blocks:
+        if block_tag in HEADING_TAGS:
+            if block_text not in headings and len(headings) < MAX_HEADINGS:
+                headings.append(block_text)
+            continue
+
+        if occurrences[block_text] > 1:
+            continue
+        if len(block_text) < MIN_BLOCK_CHARS:
+            continue
+        if block_link_chars / len(block_text) > MAX_LINK_DENSITY:
+            continue
+
+        selected.append(block_text)
+
+    return headings, " ".join(selected)
+
+
+# プロセス内で共有するテキスト抽出用のExecutor
+_executor: Optional[Executor] = None
+
+
+def get_extraction_executor() -> Executor:
+    """
+    テキスト抽出用のExecutorを取得する
+
+    HTML_EXTRACTOR_EXECUTOR が "process"（既定）の場合はプロセスプール、
+    それ以外はスレッドプールを使用する（lxmlは解析中にのみGILを解放するため、
+    本文選択などPythonで行う処理はスレッドプールでは並列にならない）。
+    ワーカー数の既定値はCPUコア数。
+
+    Returns:
+        Executor のインスタンス
+    """
+    global _executor
+
+    if _executor is None:
+        workers = settings.HTML_EXTRACTOR_WORKERS or os.cpu_count() or 1
+        if settings.HTML_EXTRACTOR_EXECUTOR.lower() == "process":
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="html-extractor"
+            )
+        logger.info(
+            f"テキスト抽出用のExecutorを初期化しました: "
+            f"種類={settings.HTML_EXTRACTOR_EXECUTOR}, ワーカー数={workers}"
+        )
+
+    return _executor
+
+
+def shutdown_extraction_executor() -> None:
+    """テキスト抽出用のExecutorを停止する（アプリケーション終了時に呼び出す）"""
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+async def extract_text_async(html_content: str) -> str:
+    """
+    イベントループを止めないように、Executor上でHTMLからテキストを抽出する
+
+    Args:
+        html_content: HTMLコンテンツ
+
+    Returns:
+        抽出されたテキスト
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_extraction_executor(), extract_text, html_content
+    )
@@ -0,0 +1,482 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterable, Dict, List, Optional, Union
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.database import (
+    AnalysisHistory,
+    BatchAnalysisHistory,
+    BatchAnalysisUrl,
+    SessionLocal,
+)
+from app.models.schema import (
+    JobResultItem,
+    JobResultsResponse,
+    JobStatusResponse,
+    JobSubmitResponse,
+)
+from app.services.analyzer import WebsiteAnalyzer
+from app.services.pipeline import iter_chunks
+from app.services.batch_writer import (
+    BATCH_STATUS_FAILED,
+    BATCH_STATUS_QUEUED,
+    BATCH_STATUS_RUNNING,
+    URL_STATUS_PENDING,
+    BatchResultWriter,
+    process_owner,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJobManager:
+    """
+    一括解析をバックグラウンドのジョブとして実行するクラス
+
+    ジョブはこのプロセス内のタスクとして実行し、状態・進捗・途中結果は一括解析の履歴
+    （batch_analysis_history / batch_analysis_items）に保存する。同時に実行するジョブの数は
+    JOB_MAX_CONCURRENT までで、超えた分は待機状態になる。
+    各URLの進捗（batch_analysis_urls）も保存するため、中断・失敗したジョブは結果が確定していない
+    URLのみを対象に再開できる。
+
+    複数のワーカープロセスで実行するため、実行中・待機中の一括解析には実行するプロセスと
+    リース（heartbeat_at）を記録し、JOB_HEARTBEAT_INTERVAL 秒ごとに更新する。リースが
+    JOB_LEASE_SECONDS 秒を過ぎても更新されていない一括解析のみを、停止したプロセスで
+    中断されたものとして扱う。失敗したジョブの再開は状態を条件にした UPDATE で行い、
+    同じジョブを複数のプロセスで同時に再開しない。
+    """
+
+    def __init__(self, analyzer: WebsiteAnalyzer):
+        self.analyzer = analyzer
+        self._semaphore = asyncio.Semaphore(max(settings.JOB_MAX_CONCURRENT, 1))
+        # 実行中・待機中のジョブのタスク（完了まで参照を保持する）
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # リースの更新と中断されたジョブの確認を行うタスク
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def submit(
+        self,
+        urls: Union[List[str], AsyncIterable[str]],
+        force_refresh: bool = False,
+        max_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+    ) -> JobSubmitResponse:
+        """
+        一括解析のジョブを登録し、バックグラウンドで実行を開始する
+
+        URLは BATCH_INPUT_CHUNK_SIZE 件ずつスレッドで未処理として保存し、ジョブは保存したURLを
+        読み込みながら実行する。リストで渡した場合はジョブのタスク内で保存し、ジョブIDをすぐに返す。
+        非同期イテレータ（アップロードされたCSVなど）はリクエスト中にしか読み込めないため、
+        全て保存してから返す（全件をメモリに保持しない）。
+
+        Args:
+            urls: 解析対象のURLリスト（または非同期イテレータ）
+            force_refresh: キャッシュを無視して強制的に再解析するかどうか
+            max_tokens: ジョブ全体のトークン数の上限
+            max_cost: ジョブ全体のコスト（USD）の上限
+
+        Returns:
+            登録したジョブの情報
+        """
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        await asyncio.to_thread(
+            BatchResultWriter.register,
+            batch_id,
+            {
+                "force_refresh": force_refresh,
+                "max_tokens": max_tokens,
+                "max_cost": max_cost,
+            },
+        )
+
+        if isinstance(urls, list):
+            total_urls = len(urls)
+            self._start(batch_id, urls)
+        else:
+            total_urls = await self._register_urls(batch_id, urls)
+            self._start(batch_id)
+
+        logger.info(f"一括解析ジョブを登録しました: {batch_id}, URL数={total_urls}")
+        return JobSubmitResponse(
+            job_id=batch_id, status=BATCH_STATUS_QUEUED, total_urls=total_urls
+        )
+
+    def resume(self, job_id: str) -> Optional[JobSubmitResponse]:
+        """
+        中断・失敗したジョブを、結果が確定していないURLのみを対象に再開する
+
+        結果が確定したURLは解析履歴への関連付けと件数・トークン使用量を引き継ぎ、解析し直さない。
+
+        Args:
+            job_id: ジョブID（一括解析のID）
+
+        Returns:
+            再開したジョブの情報（ジョブが存在しない場合はNone）
+
+        Raises:
+            ValueError: 再開できない状態のジョブの場合
+        """
+        if job_id in self._tasks:
+            raise ValueError("ジョブは実行中です")
+
+        db = SessionLocal()
+        try:
+            batch = db.get(BatchAnalysisHistory, job_id)
+            if not batch:
+                return None
+            if batch.status != BATCH_STATUS_FAILED:
+                raise ValueError(
+                    f"再開できるのは中断・失敗したジョブのみです（現在の状態: {batch.status}）"
+                )
+            total_urls = batch.total_urls
+
+            pending_urls = (
+                db.query(BatchAnalysisUrl)
+                .filter(
+                    BatchAnalysisUrl.batch_id == job_id,
+                    BatchAnalysisUrl.status == URL_STATUS_PENDING,
+                )
+                .count()
+            )
+            if not pending_urls:
+                raise ValueError("再開する未処理のURLがありません")
+
+            # 失敗したままの場合のみ待機中にする（他のプロセスが先に再開した場合は更新されない）
+            now = datetime.utcnow()
+            result = db.execute(
+                update(BatchAnalysisHistory)
+                .where(
+                    BatchAnalysisHistory.batch_id == job_id,
+                    BatchAnalysisHistory.status == BATCH_STATUS_FAILED,
+                )
+                .values(
+                    status=BATCH_STATUS_QUEUED,
+                    error=None,
+                    completed_at=None,
+                    updated_at=now,
+                    owner=process_owner(),
+                    heartbeat_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            if result.rowcount != 1:
+                raise ValueError("ジョブは他のプロセスで再開されました")
+        finally:
+            db.close()
+
+        self._start(job_id)
+
+        logger.info(
+            f"一括解析ジョブを再開しました: {job_id}, 未処理のURL数={pending_urls}"
+        )
+        return JobSubmitResponse(
+            job_id=job_id,
+            status=BATCH_STATUS_QUEUED,
+            total_urls=total_urls,
+            pending_urls=pending_urls,
+        )
+
+    async def _register_urls(
+        self, batch_id: str, urls: Union[List[str], AsyncIterable[str]]
+    ) -> int:
+        """
+        ジョブの対象URLを BATCH_INPUT_CHUNK_SIZE 件ずつスレッドで未処理として保存する
+
+        失敗した場合はジョブを失敗として記録する。
+
+        Args:
+            batch_id: ジョブID
+            urls: 解析対象のURLリスト（または非同期イテレータ）
+
+        Returns:
+            保存したURLの数
+        """
+        total_urls = 0
+        try:
+            async for chunk in iter_chunks(urls, settings.BATCH_INPUT_CHUNK_SIZE):
+                await asyncio.to_thread(
+                    BatchResultWriter.register_urls,
+                    batch_id,
+                    list(enumerate(chunk, total_urls)),
+                )
+                total_urls += len(chunk)
+        except Exception as e:
+            self._mark_failed(
+                [batch_id], f"ジョブの登録中にエラーが発生しました: {str(e)}"
+            )
+            raise
+        return total_urls
+
+    def _start(self, batch_id: str, urls: Optional[List[str]] = None) -> None:
+        """ジョブのタスクを作成する（URLを指定した場合は、タスク内で保存してから実行する）"""
+        task = asyncio.create_task(self._run(batch_id, urls))
+        self._tasks[batch_id] = task
+        task.add_done_callback(lambda done: self._on_done(batch_id, done))
+
+    async def _run(self, batch_id: str, urls: Optional[List[str]] = None) -> None:
+        """ジョブを実行する（失敗・中断した場合はその旨を記録する）"""
+        try:
+            if urls is not None:
+                # 待機中の間も進捗（URL数）を確認できるよう、実行枠を待つ前に保存する
+                await self._register_urls(batch_id, urls)
+            async with self._semaphore:
+                logger.info(f"一括解析ジョブを開始します: {batch_id}")
+                # 保存済みの未処理のURLを解析する（結果は一括解析の履歴から取得する）
+                await self.analyzer.analyze_pending_batch(batch_id)
+                logger.info(f"一括解析ジョブが完了しました: {batch_id}")
+
+        except Exception as e:
+            logger.error(f"一括解析ジョブでエラーが発生しました: {batch_id}, {str(e)}")
+            self._mark_failed(
+                [batch_id], f"ジョブの実行中にエラーが発生しました: {str(e)}"
+            )
+
+    def _on_done(self, batch_id: str, task: asyncio.Task) -> None:
+        """ジョブのタスクの終了時に参照を外す（取り消された場合は失敗として記録する）"""
+        self._tasks.pop(batch_id, None)
+        if task.cancelled():
+            try:
+                self._mark_failed([batch_id], "ジョブが中断されました")
+            except Exception as e:
+                logger.error(
+                    f"一括解析ジョブの状態の更新中にエラーが発生しました: {str(e)}"
+                )
+
+    def recover_interrupted(self) -> None:
+        """
+        停止したプロセスで実行中・待機中だった一括解析を失敗として記録する
+
+        リースが JOB_LEASE_SECONDS 秒を過ぎても更新されていない一括解析のみを対象とし、
+        他のワーカープロセスで実行中の一括解析には触れない。起動時と、リースの更新と共に
+        定期的に実行する。JOB_AUTO_RESUME が有効な場合は、記録した一括解析を未処理のURLから再開する。
+        """
+        recovered = []
+        try:
+            expired_before = datetime.utcnow() - timedelta(
+                seconds=settings.JOB_LEASE_SECONDS
+            )
+            db = SessionLocal()
+            try:
+                batch_ids = list(
+                    db.scalars(
+                        self._active_statement(
+                            select(BatchAnalysisHistory.batch_id), expired_before
+                        )
+                    )
+                )
+            finally:
+                db.close()
+
+            # 1件ずつリースを条件に更新し、このプロセスが記録したものだけを再開の対象にする
+            for batch_id in batch_ids:
+                if batch_id in self._tasks:
+                    continue
+                if self._mark_failed(
+                    [batch_id],
+                    "サーバーの停止によりジョブが中断されました（再開できます）",
+                    expired_before,
+                ):
+                    recovered.append(batch_id)
+
+            if recovered:
+                logger.warning(
+                    f"中断された一括解析ジョブを失敗として記録しました: {len(recovered)}件"
+                )
+        except Exception as e:
+            logger.error(
+                f"中断された一括解析ジョブの確認中にエラーが発生しました: {str(e)}"
+            )
+
+        if not settings.JOB_AUTO_RESUME:
+            return
+
+        for batch_id in recovered:
+            try:
+                self.resume(batch_id)
+            except ValueError as e:
+                logger.info(f"一括解析ジョブを再開しませんでした: {batch_id}, {str(e)}")
+            except Exception as e:
+                logger.error(
+                    f"一括解析ジョブの再開中にエラーが発生しました: {batch_id}, {str(e)}"
+                )
+
+    def start_heartbeat(self) -> None:
+        """リースの更新と、中断されたジョブの確認を定期的に行うタスクを開始する"""
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop_heartbeat(self) -> None:
+        """リースの更新を行うタスクを停止する"""
+        task, self._heartbeat_task = self._heartbeat_task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _heartbeat_loop(self) -> None:
+        interval = max(settings.JOB_HEARTBEAT_INTERVAL, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._renew_leases()
+            except Exception as e:
+                logger.error(
+                    f"一括解析ジョブのリースの更新中にエラーが発生しました: {str(e)}"
+                )
+            self.recover_interrupted()
+
+    def _renew_leases(self) -> None:
+        """このプロセスで実行中・待機中の一括解析のリースを更新する"""
+        db = SessionLocal()
+        try:
+            db.execute(
+                self._active_statement(update(BatchAnalysisHistory))
+                .where(BatchAnalysisHistory.owner == process_owner())
+                .values(heartbeat_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _active_statement(statement, expired_before: Optional[datetime] = None):
+        """
+        実行中・待機中の一括解析を対象にする条件を加える
+
+        Args:
+            statement: SELECT/UPDATE 文
+            expired_before: 指定した場合は、リースがこの日時より前に更新されたもののみを対象にする
+
+        Returns:
+            条件を加えた文
+        """
+        statement = statement.where(
+            BatchAnalysisHistory.status.in_([BATCH_STATUS_QUEUED, BATCH_STATUS_RUNNING])
+        )
+        if expired_before is not None:
+            statement = statement.where(
+                or_(
+                    BatchAnalysisHistory.heartbeat_at.is_(None),
+                    BatchAnalysisHistory.heartbeat_at < expired_before,
+                )
+            )
+        return statement
+
+    def _mark_failed(
+        self,
+        batch_ids: Optional[List[str]],
+        error: str,
+        expired_before: Optional[datetime] = None,
+    ) -> int:
+        """
+        実行中・待機中のジョブを失敗として記録する
+
+        Args:
+            batch_ids: 対象のジョブID（Noneの場合は全て）
+            error: エラーメッセージ
+            expired_before: 指定した場合は、リースがこの日時より前に更新されたジョブのみを対象にする
+
+        Returns:
+            更新したジョブの数
+        """
+        db = SessionLocal()
+        try:
+            statement = self._active_statement(
+                update(BatchAnalysisHistory), expired_before
+            )
+            if batch_ids is not None:
+                statement = statement.where(
+                    BatchAnalysisHistory.batch_id.in_(batch_ids)
+                )
+
+            now = datetime.utcnow()
+            result = db.execute(
+                statement.values(
+                    status=BATCH_STATUS_FAILED,
+                    error=error,
+                    updated_at=now,
+                    completed_at=now,
+                ).execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+    @staticmethod
+    async def get_job_status(db: Session, job_id: str) -> Optional[JobStatusResponse]:
+        """
+        ジョブの状態と進捗を取得する
+        """
+        batch = db.get(BatchAnalysisHistory, job_id)
+        if not batch:
+            return None
+
+        return JobStatusResponse(
+            job_id=batch.batch_id,
+            status=batch.status,
+            total_urls=batch.total_urls,
+            processed=batch.processed_count or 0,
+            success=batch.success_count,
+            failed=batch.failed_count,
+            input_tokens=batch.input_tokens or 0,
+            output_tokens=batch.output_tokens or 0,
+            cost=batch.cost or 0.0,
+            budget_exhausted=bool(batch.budget_exhausted),
+            error=batch.error,
+            created_at=batch.timestamp,
+            updated_at=batch.updated_at,
+            completed_at=batch.completed_at,
+        )
+
+    @staticmethod
+    async def get_job_results(
+        db: Session, job_id: str, offset: int = 0, limit: int = 100
+    ) -> Optional[JobResultsResponse]:
+        """
+        ジョブの保存済みの結果を取得する（実行中は途中までの結果）
+
+        結果が確定したURLを入力の順（batch_analysis_urls の位置）に、解析履歴と結合して返す。
+        各結果のURLは入力されたURLとし、入力内での位置を併せて返す（重複をまとめて解析した
+        行も、それぞれの行の結果として対応付けられる）。
+        """
+        batch = db.get(BatchAnalysisHistory, job_id)
+        if not batch:
+            return None
+
+        query = (
+            db.query(AnalysisHistory, BatchAnalysisUrl.position, BatchAnalysisUrl.url)
+            .join(BatchAnalysisUrl, BatchAnalysisUrl.analysis_id == AnalysisHistory.id)
+            .filter(
+                BatchAnalysisUrl.batch_id == job_id,
+                BatchAnalysisUrl.status != URL_STATUS_PENDING,
+            )
+        )
+        total = query.count()
+        rows = (
+            query.order_by(BatchAnalysisUrl.position).offset(offset).limit(limit).all()
+        )
+
+        return JobResultsResponse(
+            job_id=job_id,
+            status=batch.status,
+            total=total,
+            offset=offset,
+            limit=limit,
+            results=[
+                JobResultItem(
+                    **{**history.to_detail_dict(), "url": url, "position": position}
+                )
+                for history, position, url in rows
+            ],
+        )
@@ -0,0 +1,474 @@
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.gemini_client import MAIN_CATEGORY
+from app.services.prompt_builder import split_sections
+from app.utils.content_hash import normalize_content
+
+logger = logging.getLogger(__name__)
+
+# ローカル分類器で判定した解析履歴の cache_source
+LOCAL_CLASSIFIER_SOURCE = "local_classifier"
+
+# モデルファイルの形式のバージョン
+MODEL_VERSION = 1
+
+# 特徴量をハッシュするバケット数
+N_BUCKETS = 1 << 18
+
+# 加法平滑化の係数
+ALPHA = 0.1
+
+# モデルファイルの更新を確認する間隔（秒）
+RELOAD_CHECK_INTERVAL = 10.0
+
+# タイトル・メタ情報・見出しの特徴量の重み（本文は1）
+HEADER_WEIGHT = 3
+
+# 特徴量の抽出に使う本文の最大文字数
+MAX_CONTENT_CHARS = 2000
+
+# 確信度の較正で探索する倍率の候補
+SCALE_CANDIDATES = [0.5 * i for i in range(1, 81)]
+
+# 日本語（ひらがな・カタカナ・漢字）の連続
+_CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]+")
+
+# 英数字の単語
+_WORD_PATTERN = re.compile(r"[a-z0-9]{2,}")
+
+
+def extract_features(content: str) -> Dict[int, float]:
+    """
+    抽出テキストからハッシュした特徴量を作成する
+
+    日本語は文字bi-gram、英数字は単語を特徴量とし、タイトル・メタ情報・見出しを重く数える。
+    合計が1になるように正規化する。
+
+    Args:
+        content: クローラーが抽出したテキスト（Title/Description/...形式）
+
+    Returns:
+        バケット番号をキーとする特徴量の辞書
+    """
+    sections = split_sections(content)
+    counts: Counter = Counter()
+
+    for label, text in sections.items():
+        if label == "Content":
+            weight = 1
+            text = text[:MAX_CONTENT_CHARS]
+        else:
+            weight = HEADER_WEIGHT
+
+        for token in _tokenize(normalize_content(text)):
+            counts[zlib.crc32(token.encode("utf-8")) % N_BUCKETS] += weight
+
+    total = sum(counts.values())
+    if not total:
+        return {}
+    return {bucket: count / total for bucket, count in counts.items()}
+
+
+def _tokenize(text: str) -> List[str]:
+    """正規化済みのテキストをトークンに分割する"""
+    tokens = []
+    for run in _CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    tokens.extend(_WORD_PATTERN.findall(text))
+    return tokens
+
+
+class LocalClassifier:
+    """
+    ハッシュしたn-gramによる多項ナイーブベイズ分類器（メインカテゴリのみを判定する）
+
+    特徴量は合計1に正規化し、対数尤度に較正済みの倍率を掛けてから確率に変換するため、
+    ページの長さに関わらず確信度を閾値と比較できる。
+    """
+
+    def __init__(
+        self,
+        classes: List[str],
+        class_counts: List[int],
+        feature_counts: List[Dict[int, float]],
+        scale: float = 1.0,
+    ):
+        self.classes = classes
+        self.class_counts = class_counts
+        self.feature_counts = feature_counts
+        self.scale = scale
+
+        total_docs = sum(class_counts)
+        self._log_priors = [math.log(count / total_docs) for count in class_counts]
+
+        # 特徴量ごとの対数確率を事前に計算しておく（未出現の特徴量は既定値）
+        self._log_probs: List[Dict[int, float]] = []
+        self._default_log_probs: List[float] = []
+        for counts in feature_counts:
+            log_total = math.log(sum(counts.values()) + ALPHA * N_BUCKETS)
+            self._log_probs.append(
+                {
+                    bucket: math.log(count + ALPHA) - log_total
+                    for bucket, count in counts.items()
+                }
+            )
+            self._default_log_probs.append(math.log(ALPHA) - log_total)
+
+    @classmethod
+    def train(cls, samples: List[Tuple[str, str]]) -> "LocalClassifier":
+        """
+        (抽出テキスト, メインカテゴリ)のサンプルから学習する
+
+        Args:
+            samples: 学習用のサンプル
+
+        Returns:
+            学習済みの分類器
+        """
+        classes = sorted({category for _, category in samples})
+        index = {category: i for i, category in enumerate(classes)}
+        class_counts = [0] * len(classes)
+        feature_counts: List[Dict[int, float]] = [{} for _ in classes]
+
+        for content, category in samples:
+            i = index[category]
+            class_counts[i] += 1
+            counts = feature_counts[i]
+            for bucket, value in extract_features(content).items():
+                counts[bucket] = counts.get(bucket, 0.0) + value
+
+        return cls(classes, class_counts, feature_counts)
+
+    def predict_proba(self, content: str) -> List[Tuple[str, float]]:
+        """
+        カテゴリごとの確率を確率の高い順に返す
+
+        Args:
+            content: クローラーが抽出したテキスト
+
+        Returns:
+            (メインカテゴリ, 確率)のタプルのリスト
+        """
+        scores = self._log_likelihoods(extract_features(content))
+        return self._to_proba(scores, self.scale)
+
+    def predict(self, content: str) -> Tuple[str, float]:
+        """最も確率の高いカテゴリとその確率を返す"""
+        return self.predict_proba(content)[0]
+
+    def calibrate(self, samples: List[Tuple[str, str]]) -> None:
+        """
+        検証用サンプルの対数損失が最小になるように、確信度の倍率を決める
+
+        Args:
+            samples: 学習に使っていない(抽出テキスト, メインカテゴリ)のサンプル
+        """
+        scored = [
+            (self._log_likelihoods(extract_features(content)), category)
+            for content, category in samples
+            if category in self.classes
+        ]
+        if not scored:
+            return
+
+        def log_loss(scale: float) -> float:
+            loss = 0.0
+            for scores, category in scored:
+                proba = dict(self._to_proba(scores, scale))
+                loss -= math.log(max(proba[category], 1e-12))
+            return loss / len(scored)
+
+        self.scale = min(SCALE_CANDIDATES, key=log_loss)
+
+    def _log_likelihoods(self, features: Dict[int, float]) -> List[float]:
+        """カテゴリごとの（倍率を掛ける前の）平均対数尤度"""
+        scores = []
+        for log_probs, default in zip(self._log_probs, self._default_log_probs):
+            scores.append(
+                sum(
+                    value * log_probs.get(bucket, default)
+                    for bucket, value in features.items()
+                )
+            )
+        return scores
+
+    def _to_proba(self, scores: List[float], scale: float) -> List[Tuple[str, float]]:
+        """平均対数尤度に倍率を掛け、事前確率と組み合わせて確率に変換する"""
+        logits = [
+            prior + scale * score for prior, score in zip(self._log_priors, scores)
+        ]
+        top = max(logits)
+        exps = [math.exp(logit - top) for logit in logits]
+        total = sum(exps)
+        proba = [(category, e / total) for category, e in zip(self.classes, exps)]
+        return sorted(proba, key=lambda item: item[1], reverse=True)
+
+    def save(self, path: Path) -> None:
+        """
+        モデルをgzip圧縮したJSONとして保存する
+
+        読み込み中のプロセスが書きかけのファイルを読まないよう、一時ファイルに書き込んでから置き換える。
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": MODEL_VERSION,
+            "n_buckets": N_BUCKETS,
+            "classes": self.classes,
+            "class_counts": self.class_counts,
+            "scale": self.scale,
+            "feature_counts": [
+                {str(bucket): round(value, 6) for bucket, value in counts.items()}
+                for counts in self.feature_counts
+            ],
+        }
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalClassifier":
+        """保存したモデルを読み込む"""
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+
+        if data.get("version") != MODEL_VERSION or data.get("n_buckets") != N_BUCKETS:
+            raise ValueError("モデルファイルの形式が現在のバージョンと一致しません")
+
+        return cls(
+            data["classes"],
+            data["class_counts"],
+            [
+                {int(bucket): value for bucket, value in counts.items()}
+                for counts in data["feature_counts"]
+            ],
+            data["scale"],
+        )
+
+
+# プロセス内で共有する分類器（読み込みに失敗した場合はFalse）
+_classifier: Any = None
+# 読み込んだ時点のモデルファイルの更新日時とサイズ（ファイルがない場合はNone）と、最後に確認した時刻
+_model_signature: Optional[Tuple[int, int]] = None
+_checked_at = 0.0
+
+
+def get_local_classifier() -> Optional[LocalClassifier]:
+    """
+    共有の分類器を取得する
+
+    LOCAL_CLASSIFIER_ENABLED が無効な場合や、モデルファイルがない場合はNoneを返す。
+    モデルファイルの更新日時・サイズは RELOAD_CHECK_INTERVAL 秒ごとに確認し、変わっていれば
+    読み込み直す（モデルがなかった場合も、後から作成されたモデルを使用する）。
+
+    Returns:
+        LocalClassifier のインスタンスまたはNone
+    """
+    global _checked_at
+
+    if not settings.LOCAL_CLASSIFIER_ENABLED:
+        return None
+
+    now = time.monotonic()
+    if _classifier is None or now - _checked_at >= RELOAD_CHECK_INTERVAL:
+        _checked_at = now
+        path = Path(settings.LOCAL_CLASSIFIER_MODEL_PATH)
+        if _classifier is None or _read_signature(path) != _model_signature:
+            reload_local_classifier()
+
+    return _classifier or None
+
+
+def reload_local_classifier() -> Optional[LocalClassifier]:
+    """
+    モデルファイルから分類器を読み込み直す
+
+    Returns:
+        読み込んだ LocalClassifier のインスタンス（モデルがない場合や読み込めない場合はNone）
+    """
+    global _classifier, _model_signature, _checked_at
+
+    path = Path(settings.LOCAL_CLASSIFIER_MODEL_PATH)
+    _checked_at = time.monotonic()
+    _model_signature = _read_signature(path)
+    try:
+        _classifier = LocalClassifier.load(path)
+        logger.info(
+            f"ローカル分類器を読み込みました: {path}（カテゴリ数={len(_classifier.classes)}）"
+        )
+    except FileNotFoundError:
+        logger.info(f"ローカル分類器のモデルがないため使用しません: {path}")
+        _classifier = False
+    except Exception as e:
+        logger.error(f"ローカル分類器の読み込み中にエラーが発生しました: {str(e)}")
+        _classifier = False
+
+    return _classifier or None
+
+
+def _read_signature(path: Path) -> Optional[Tuple[int, int]]:
+    """モデルファイルの更新日時とサイズ（ファイルがない場合はNone）"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def classify_locally(content: str) -> Optional[Dict[str, Any]]:
+    """
+    ローカル分類器で確信度が閾値以上の場合に、AIの代わりの解析結果を返す
+
+    Args:
+        content: クローラーが抽出したテキスト
+
+    Returns:
+        解析結果の辞書（分類器がない場合や確信度が閾値未満の場合はNone）
+    """
+    classifier = get_local_classifier()
+    if classifier is None or not content:
+        return None
+
+    category, confidence = classifier.predict(content)
+    if confidence < settings.LOCAL_CLASSIFIER_THRESHOLD:
+        return None
+
+    return {
+        "main_category": category,
+        "sub_categories": [],
+        "confidence": round(confidence, 4),
+        "description": None,
+        "target_audience": None,
+        "value_proposition": None,
+    }
+
+
+def load_training_samples() -> List[Tuple[str, str]]:
+    """
+    AIで解析に成功した履歴と、保存済みの抽出テキストから学習用のサンプルを読み込む
+
+    ローカル分類器自身の判定結果は学習に使わない。
+
+    Returns:
+        (抽出テキスト, メインカテゴリ)のサンプルのリスト
+    """
+    from app.models.database import AnalysisHistory, PageSnapshot, SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(PageSnapshot.content_text, AnalysisHistory.main_category)
+            .join(AnalysisHistory, PageSnapshot.history_id == AnalysisHistory.id)
+            .filter(AnalysisHistory.status == "success")
+            .filter(PageSnapshot.content_text.isnot(None))
+            .filter(
+                (AnalysisHistory.cache_source.is_(None))
+                | (AnalysisHistory.cache_source != LOCAL_CLASSIFIER_SOURCE)
+            )
+            .all()
+        )
+    finally:
+        db.close()
+
+    return [
+        (content, category)
+        for content, category in rows
+        if content and category in MAIN_CATEGORY
+    ]
+
+
+def evaluate(
+    classifier: LocalClassifier, samples: List[Tuple[str, str]], threshold: float
+) -> Dict[str, float]:
+    """
+    検証用サンプルでの正解率と、閾値以上で答えた割合・その正解率を求める
+
+    Returns:
+        accuracy, coverage, precision の辞書
+    """
+    correct = answered = answered_correct = 0
+    for content, category in samples:
+        predicted, confidence = classifier.predict(content)
+        correct += predicted == category
+        if confidence >= threshold:
+            answered += 1
+            answered_correct += predicted == category
+
+    total = len(samples) or 1
+    return {
+        "accuracy": correct / total,
+        "coverage": answered / total,
+        "precision": answered_correct / answered if answered else 0.0,
+    }
+
+
+def main() -> None:
+    """解析履歴からローカル分類器を学習し、モデルファイルを保存する"""
+    parser = argparse.ArgumentParser(description="解析履歴からローカル分類器を学習する")
+    parser.add_argument(
+        "--output",
+        default=settings.LOCAL_CLASSIFIER_MODEL_PATH,
+        help="モデルファイルの保存先",
+    )
+    parser.add_argument(
+        "--holdout",
+        type=float,
+        default=0.1,
+        help="確信度の較正と評価に使うサンプルの割合",
+    )
+    parser.add_argument(
+        "--min-samples",
+        type=int,
+        default=100,
+        help="学習に必要な最小サンプル数",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="サンプル分割の乱数シード")
+    args = parser.parse_args()
+
+    samples = load_training_samples()
+    if len(samples) < args.min_samples:
+        logger.error(
+            f"学習用のサンプルが不足しています: {len(samples)}件（必要数={args.min_samples}件）"
+        )
+        raise SystemExit(1)
+
+    random.Random(args.seed).shuffle(samples)
+    holdout_size = max(1, int(len(samples) * args.holdout))
+    holdout, training = samples[:holdout_size], samples[holdout_size:]
+
+    classifier = LocalClassifier.train(training)
+    classifier.calibrate(holdout)
+    metrics = evaluate(classifier, holdout, settings.LOCAL_CLASSIFIER_THRESHOLD)
+
+    classifier.save(Path(args.output))
+    logger.info(
+        f"ローカル分類器を保存しました: {args.output}（学習={len(training)}件、"
+        f"検証={len(holdout)}件、倍率={classifier.scale}）"
+    )
+    logger.info(
+        f"検証結果: 正解率={metrics['accuracy']:.1%}, "
+        f"閾値{settings.LOCAL_CLASSIFIER_THRESHOLD}以上の割合={metrics['coverage']:.1%}, "
+        f"その正解率={metrics['precision']:.1%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
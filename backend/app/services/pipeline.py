@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+logger = logging.getLogger(__name__)
+
+# ワーカーに終了を伝える目印
+_STOP = object()
+
+T = TypeVar("T")
+
+
+async def iter_chunks(
+    items: Union[Iterable[T], AsyncIterable[T]], size: int
+) -> AsyncIterator[List[T]]:
+    """
+    項目を最大 size 件ずつのリストにして返す（非同期イテレータにも対応）
+
+    Args:
+        items: 項目
+        size: 1つのリストの最大件数
+
+    Returns:
+        項目のリストを返す非同期イテレータ
+    """
+    size = max(size, 1)
+    chunk: List[T] = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class StageStats:
+    """パイプラインの1段の処理件数・処理時間"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.max_queue = 0
+        self._started = time.monotonic()
+        self._finished: Optional[float] = None
+
+    def finish(self) -> None:
+        """段の全ワーカーが終了した時刻を記録する"""
+        self._finished = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return (self._finished or time.monotonic()) - self._started
+
+    def to_dict(self) -> Dict[str, float]:
+        """
+        集計値を辞書にする
+
+        Returns:
+            処理件数、エラー件数、スループット（件/秒）、1回（まとめた場合は1バッチ）あたりの平均処理時間、
+            ワーカーの稼働率、入力キューの最大長の辞書
+        """
+        elapsed = self.elapsed
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "errors": self.errors,
+            "batches": self.batches,
+            "throughput": self.processed / elapsed if elapsed > 0 else 0.0,
+            "avg_seconds": (self.busy_seconds / self.batches if self.batches else 0.0),
+            "utilization": (
+                self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+            ),
+            "max_queue": self.max_queue,
+        }
+
+
+class PipelineStage:
+    """
+    パイプラインの1段
+
+    handler は1件を受け取り、次の段に渡す1件（渡さない場合はNone）を返す。
+    batch_size を指定した場合は最大 batch_size 件のリストを受け取り、次の段に渡すリストを返す。
+    skip が真を返す項目は handler を呼ばずにそのまま次の段に渡す。
+    key を指定した場合は、同じキーの項目を同時に per_key 件までしか処理しない。上限に達したキーの
+    項目は最大 lookahead 件まで取り置き、空きのある別のキーの項目を先に処理する
+    （1つのドメインへのURLが続いても、他のドメインのURLを待たせないため）。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int,
+        queue_size: int,
+        batch_size: Optional[int] = None,
+        batch_linger: float = 0.0,
+        skip: Optional[Callable[[Any], bool]] = None,
+        key: Optional[Callable[[Any], str]] = None,
+        per_key: int = 1,
+        lookahead: int = 1000,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 1)
+        self.batch_size = max(batch_size, 1) if batch_size is not None else None
+        self.batch_linger = batch_linger
+        self.skip = skip
+        self.key = key
+        self.per_key = max(per_key, 1)
+        self.lookahead = max(lookahead, 1)
+
+
+class _KeyedAdmission:
+    """
+    キーごとの処理中の件数を制限して、空きのあるキーの項目をワーカーに渡すクラス
+
+    取り置いた項目はキーごとに到着順で保持し、キーの間は順番に回して公平に取り出す。
+    """
+
+    def __init__(self, stage: PipelineStage, stat: "StageStats"):
+        self.stage = stage
+        self.stat = stat
+        self.buffered = 0
+        self.closed = False
+        self._waiting: "OrderedDict[str, deque]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._condition = asyncio.Condition()
+
+    async def put(self, item: Any) -> None:
+        """項目を取り置く（取り置きが上限に達している場合は空くまで待つ）"""
+        async with self._condition:
+            while self.buffered >= self.stage.lookahead:
+                await self._condition.wait()
+            key = self.stage.key(item)
+            self._waiting.setdefault(key, deque()).append(item)
+            self.buffered += 1
+            self.stat.max_queue = max(self.stat.max_queue, self.buffered)
+            self._condition.notify_all()
+
+    async def close(self) -> None:
+        """これ以上項目が来ないことを伝える"""
+        async with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    async def take(self) -> Any:
+        """
+        処理中の件数に空きのあるキーの項目を取り出す
+
+        Returns:
+            項目（全ての項目を渡し終えた場合は終了の目印）
+        """
+        async with self._condition:
+            while True:
+                for key, items in self._waiting.items():
+                    if self._active.get(key, 0) < self.stage.per_key:
+                        item = items.popleft()
+                        if items:
+                            # 次は別のキーから取り出す
+                            self._waiting.move_to_end(key)
+                        else:
+                            del self._waiting[key]
+                        self._active[key] = self._active.get(key, 0) + 1
+                        self.buffered -= 1
+                        self._condition.notify_all()
+                        return item
+
+                if self.closed and not self.buffered:
+                    return _STOP
+                await self._condition.wait()
+
+    async def release(self, item: Any) -> None:
+        """項目の処理が終わったことを伝える"""
+        async with self._condition:
+            key = self.stage.key(item)
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+            self._condition.notify_all()
+
+
+async def run_pipeline(
+    items: Union[Iterable[Any], AsyncIterable[Any]], stages: List[PipelineStage]
+) -> Dict[str, Dict[str, float]]:
+    """
+    項目を段ごとのワーカーで順に処理する
+
+    段の間は長さに上限のあるキューでつなぎ、後ろの段が詰まった場合は前の段の投入を待たせる。
+    そのため項目数が多くても、同時に保持する項目数は各段のワーカー数とキューの長さまでに収まる。
+    items に非同期イテレータを渡した場合は、最初の段に空きができるたびに次の項目を取り出す。
+    handler で発生した例外はログに出力し、その項目は以降の段に渡さない。
+
+    Args:
+        items: 処理する項目（イテレータまたは非同期イテレータ）
+        stages: 処理順の段のリスト
+
+    Returns:
+        段の名前をキーとする処理件数・スループットなどの辞書
+    """
+    queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in stages]
+    stats = {stage.name: StageStats(stage.workers) for stage in stages}
+
+    async def forward(position: int, item: Any) -> None:
+        if position < len(queues):
+            await queues[position].put(item)
+            stat = stats[stages[position].name]
+            stat.max_queue = max(stat.max_queue, queues[position].qsize())
+
+    async def take_batch(stage: PipelineStage, queue: asyncio.Queue) -> List[Any]:
+        """キューから最大 batch_size 件を取り出す（終了の目印は末尾に置く）"""
+        batch = [await queue.get()]
+        deadline = time.monotonic() + stage.batch_linger
+        while len(batch) < (stage.batch_size or 1) and batch[-1] is not _STOP:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def process(position: int, batch: List[Any]) -> None:
+        """取り出した項目を handler で処理して次の段に渡す"""
+        stage = stages[position]
+        stat = stats[stage.name]
+
+        work = []
+        for item in batch:
+            if stage.skip is not None and stage.skip(item):
+                await forward(position + 1, item)
+            else:
+                work.append(item)
+
+        if not work:
+            return
+
+        started = time.monotonic()
+        try:
+            if stage.batch_size is not None:
+                outputs = await stage.handler(work) or []
+            else:
+                output = await stage.handler(work[0])
+                outputs = [] if output is None else [output]
+        except Exception as e:
+            logger.error(
+                f"パイプラインの{stage.name}段でエラーが発生しました: {str(e)}"
+            )
+            stat.errors += len(work)
+            outputs = []
+        stat.busy_seconds += time.monotonic() - started
+        stat.processed += len(work)
+        stat.batches += 1
+
+        for output in outputs:
+            await forward(position + 1, output)
+
+    async def worker(position: int) -> None:
+        stage = stages[position]
+        queue = queues[position]
+
+        while True:
+            batch = await take_batch(stage, queue)
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+
+            await process(position, batch)
+
+            if stopping:
+                return
+
+    async def keyed_worker(position: int, admission: _KeyedAdmission) -> None:
+        while True:
+            item = await admission.take()
+            if item is _STOP:
+                return
+            try:
+                await process(position, [item])
+            finally:
+                await admission.release(item)
+
+    async def dispatch(position: int, admission: _KeyedAdmission) -> None:
+        """入力キューの項目をキーごとに取り置く（前の段の全ワーカーの終了まで）"""
+        queue = queues[position]
+        stops = 0
+        while stops < stages[position].workers:
+            item = await queue.get()
+            if item is _STOP:
+                stops += 1
+            else:
+                await admission.put(item)
+        await admission.close()
+
+    async def run_stage(position: int) -> None:
+        stage = stages[position]
+        if stage.key is not None:
+            admission = _KeyedAdmission(stage, stats[stage.name])
+            await asyncio.gather(
+                dispatch(position, admission),
+                *[keyed_worker(position, admission) for _ in range(stage.workers)],
+            )
+        else:
+            await asyncio.gather(*[worker(position) for _ in range(stage.workers)])
+        stats[stages[position].name].finish()
+        # 前の段が全て終わってから次の段のワーカーを止める
+        if position + 1 < len(stages):
+            for _ in range(stages[position + 1].workers):
+                await queues[position + 1].put(_STOP)
+
+    async def feed() -> None:
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                await forward(0, item)
+        else:
+            for item in items:
+                await forward(0, item)
+        for _ in range(stages[0].workers):
+            await queues[0].put(_STOP)
+
+    tasks = [asyncio.ensure_future(run_stage(i)) for i in range(len(stages))]
+    try:
+        await feed()
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return {name: stat.to_dict() for name, stat in stats.items()}
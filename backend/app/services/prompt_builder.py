@@ -0,0 +1,202 @@
+import json
+import re
+from typing import Any, Dict, List
+
+from app.utils.url_normalizer import normalize_url
+
+# 抽出テキストのヘッダー行のラベル（優先度の高い順）
+SECTION_LABELS = ("Title", "Description", "Keywords", "OG", "Headings")
+
+# 日本語（ひらがな・カタカナ・漢字・全角記号）とみなす文字
+_CJK_PATTERN = re.compile(
+    r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]"
+)
+
+# 切り詰め時に区切りとして優先する文字
+_SENTENCE_ENDINGS = "。！？!?.\n "
+
+# 日本語1文字あたり、それ以外の文字1文字あたりの推定トークン数
+CJK_TOKENS_PER_CHAR = 1.0
+OTHER_TOKENS_PER_CHAR = 0.25
+
+# 区切り文字を探す範囲（切り詰め後の末尾からの割合）
+_BOUNDARY_SEARCH_RATIO = 0.2
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数をローカルで推定する
+
+    日本語は1文字あたり約1トークン、英数字などは4文字あたり約1トークンとして数える。
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        推定トークン数
+    """
+    if not text:
+        return 0
+
+    cjk_chars = len(_CJK_PATTERN.findall(text))
+    other_chars = len(text) - cjk_chars
+    return int(
+        cjk_chars * CJK_TOKENS_PER_CHAR + other_chars * OTHER_TOKENS_PER_CHAR + 0.5
+    )
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    推定トークン数が上限に収まるようにテキストを切り詰める
+
+    可能な限り文末や空白の位置で切り、文の途中で途切れないようにする。
+
+    Args:
+        text: 対象のテキスト
+        max_tokens: 推定トークン数の上限
+
+    Returns:
+        切り詰めたテキスト
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    used = 0.0
+    end = 0
+    for index, char in enumerate(text):
+        cost = (
+            CJK_TOKENS_PER_CHAR if _CJK_PATTERN.match(char) else OTHER_TOKENS_PER_CHAR
+        )
+        if used + cost > max_tokens:
+            break
+        used += cost
+        end = index + 1
+
+    # 末尾付近の文末・空白で区切る
+    search_start = int(end * (1 - _BOUNDARY_SEARCH_RATIO))
+    for index in range(end - 1, search_start - 1, -1):
+        if text[index] in _SENTENCE_ENDINGS:
+            return text[: index + 1].rstrip()
+
+    return text[:end]
+
+
+def split_sections(content: str) -> Dict[str, str]:
+    """
+    抽出テキスト（Title/Description/Keywords/OG/Headings/Content形式）をセクションに分割する
+
+    形式に合わない場合は全体を本文（Content）として扱う。
+
+    Args:
+        content: クローラーが抽出したテキスト
+
+    Returns:
+        ラベルをキーとするセクションの辞書
+    """
+    header, separator, body = content.partition("\n\nContent:\n")
+    if not separator or not header.startswith("Title:"):
+        return {"Content": content}
+
+    sections = {}
+    for line in header.split("\n"):
+        label, _, value = line.partition(":")
+        if label in SECTION_LABELS:
+            sections[label] = value.strip()
+
+    sections["Content"] = body
+    return sections
+
+
+def build_page_content(content: str, token_budget: int) -> str:
+    """
+    トークン予算内に収まるように、プロンプトに含めるページ内容を組み立てる
+
+    タイトル、メタ情報（description・keywords・OGP）、見出し、本文の優先順で
+    予算を使い切るまで詰め込み、予算を超える部分は切り詰める。
+
+    Args:
+        content: クローラーが抽出したテキスト
+        token_budget: ページ内容に使う推定トークン数の上限
+
+    Returns:
+        プロンプトに埋め込むページ内容
+    """
+    sections = split_sections(content)
+    remaining = token_budget
+    lines = []
+
+    for label in SECTION_LABELS:
+        value = sections.get(label)
+        if not value:
+            continue
+
+        line = truncate_to_tokens(f"{label}: {value}", remaining)
+        if not line:
+            break
+
+        lines.append(line)
+        remaining -= estimate_tokens(line)
+
+    body = truncate_to_tokens(sections.get("Content", ""), remaining)
+    if body:
+        if lines:
+            lines.append("")
+            lines.append("Content:")
+        lines.append(body)
+
+    return "\n".join(lines)
+
+
+def match_packed_results(
+    response_text: str, urls: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    複数サイトをまとめて解析した際のJSON配列の回答を、入力したURLに対応付ける
+
+    "url"が入力と一致しない要素や、main_categoryを含まない要素は無視する。
+    対応付けできなかったURLは呼び出し側で個別に解析し直す。
+
+    Args:
+        response_text: AI APIからのレスポンステキスト
+        urls: プロンプトに含めたURLのリスト
+
+    Returns:
+        URLをキーとする解析結果の辞書
+    """
+    # JSON配列部分を抽出
+    json_start = response_text.find('[')
+    json_end = response_text.rfind(']') + 1
+
+    if json_start == -1 or json_end == 0:
+        raise ValueError("レスポンスからJSON配列を抽出できませんでした")
+
+    try:
+        items = json.loads(response_text[json_start:json_end])
+    except json.JSONDecodeError:
+        raise ValueError("JSON配列の解析に失敗しました")
+
+    if not isinstance(items, list):
+        raise ValueError("レスポンスがJSON配列ではありません")
+
+    # 正規化したURLで表記ゆれを吸収する
+    urls_by_normalized = {normalize_url(url): url for url in urls}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict) or "main_category" not in item:
+            continue
+
+        answered_url = item.pop("url", None)
+        if not isinstance(answered_url, str) or not answered_url:
+            continue
+
+        url = answered_url if answered_url in urls else None
+        if url is None:
+            url = urls_by_normalized.get(normalize_url(answered_url))
+
+        if url and url not in results:
+            results[url] = item
+
+    return results
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 再試行の対象とするHTTPステータスコード
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# レート制限に達したとみなすステータスコード
+RATE_LIMIT_STATUS_CODES = {429, 529}
+
+# 出力トークン数の見込み（TPMの事前確保に使用）
+EXPECTED_OUTPUT_TOKENS = 400
+
+# レート調整の係数（制限時に半減し、成功するたびに少しずつ戻す）
+MIN_RATE_SCALE = 0.1
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.02
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """
+    AI APIの例外からHTTPステータスコードを取得する
+
+    Claude（anthropic.APIStatusError.status_code）と
+    Gemini（google.api_core.exceptions の code）の両方に対応する。
+    """
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code
+
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+
+    return None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """例外に含まれるレスポンスのRetry-Afterヘッダーから待機秒数を取得する"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """再試行すべき例外（レート制限・サーバーエラー・接続エラー）かどうかを判定する"""
+    status_code = get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+
+    # SDK固有の接続エラー・タイムアウト（APIConnectionError, APITimeoutError など）
+    name = type(error).__name__
+    return name.endswith("ConnectionError") or name.endswith("TimeoutError")
+
+
+class TokenBucket:
+    """1分あたりの上限をもとに補充されるトークンバケット"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, rate_scale: float) -> None:
+        """経過時間に応じてトークンを補充する"""
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate * rate_scale)
+
+    def wait_time(self, amount: float, rate_scale: float) -> float:
+        """指定量を消費できるまでの待機秒数を求める"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate * rate_scale)
+
+    def consume(self, amount: float) -> None:
+        """トークンを消費する（実績との差分の精算では負の値も許容する）"""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimiter:
+    """
+    AIプロバイダごとのリクエスト数(RPM)・トークン数(TPM)を制御するレートリミッター
+
+    呼び出し前にRPM/TPMのバケットから枠を確保し、429や5xxが返された場合は
+    ジッター付きの指数バックオフで再試行する。レート制限に達した場合は
+    補充速度を半減させ、成功が続くと徐々に元の速度に戻す。
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int):
+        self.name = name
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._rate_scale = 1.0
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        """
+        リクエスト1件分と推定トークン数分の枠を確保するまで待機する
+
+        Args:
+            estimated_tokens: 入力と出力を合わせた推定トークン数
+        """
+        # 待機中の呼び出しは到着順に処理する
+        async with self._lock:
+            while True:
+                self._requests.refill(self._rate_scale)
+                self._tokens.refill(self._rate_scale)
+
+                wait = max(
+                    self._blocked_until - time.monotonic(),
+                    self._requests.wait_time(1, self._rate_scale),
+                    self._tokens.wait_time(estimated_tokens, self._rate_scale),
+                )
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(estimated_tokens)
+                    return
+
+                await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        実際のトークン使用量と事前確保した推定値との差分を精算する
+
+        Args:
+            estimated_tokens: 事前に確保した推定トークン数
+            actual_tokens: プロバイダが返した実際のトークン数
+        """
+        if actual_tokens:
+            self._tokens.consume(actual_tokens - estimated_tokens)
+
+    async def call(
+        self, operation: Callable[[], Awaitable[T]], estimated_tokens: int
+    ) -> T:
+        """
+        レート制限と再試行を適用してAI APIを呼び出す
+
+        Args:
+            operation: API呼び出しを行うコルーチンを返す関数
+            estimated_tokens: 入力と出力を合わせた推定トークン数
+
+        Returns:
+            API呼び出しの結果
+        """
+        attempt = 0
+        while True:
+            await self.acquire(estimated_tokens)
+            try:
+                result = await operation()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+
+                attempt += 1
+                delay = self._backoff_delay(attempt, e)
+                if get_status_code(e) in RATE_LIMIT_STATUS_CODES:
+                    self._on_rate_limited(delay)
+
+                logger.warning(
+                    f"{self.name} APIの呼び出しに失敗したため{delay:.1f}秒後に再試行します"
+                    f"({attempt}/{settings.LLM_MAX_RETRIES}): {str(e)}"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self._rate_scale = min(1.0, self._rate_scale + RATE_INCREASE_STEP)
+            return result
+
+    def _on_rate_limited(self, delay: float) -> None:
+        """レート制限に達した場合に補充速度を下げ、待機が明けるまで新規呼び出しを止める"""
+        self._rate_scale = max(MIN_RATE_SCALE, self._rate_scale * RATE_DECREASE_FACTOR)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.info(
+            f"{self.name} APIのレート制限を検知しました: 補充速度を{self._rate_scale:.2f}倍に調整"
+        )
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """ジッター付きの指数バックオフの待機秒数を求める（Retry-Afterがあれば優先）"""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, settings.LLM_BACKOFF_MAX)
+
+        delay = min(
+            settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * (2 ** (attempt - 1))
+        )
+        return random.uniform(delay / 2, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """現在の状態を取得する"""
+        return {
+            "rate_scale": self._rate_scale,
+            "available_requests": int(self._requests.tokens),
+            "available_tokens": int(self._tokens.tokens),
+        }
+
+
+# プロセス内で共有するプロバイダ別のレートリミッター
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """
+    プロバイダ別の共有レートリミッターを取得する
+
+    Args:
+        provider: プロバイダ名（gemini または claude）
+
+    Returns:
+        RateLimiter のインスタンス
+    """
+    if provider not in _rate_limiters:
+        if provider == "claude":
+            rpm, tpm = settings.CLAUDE_RPM, settings.CLAUDE_TPM
+        elif provider == "fake":
+            rpm, tpm = settings.FAKE_AI_RPM, settings.FAKE_AI_TPM
+        else:
+            rpm, tpm = settings.GEMINI_RPM, settings.GEMINI_TPM
+        _rate_limiters[provider] = RateLimiter(provider, rpm, tpm)
+
+    return _rate_limiters[provider]
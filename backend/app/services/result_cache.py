@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from app.models.schema import AnalysisResponse
+from app.services.cache_stats import cache_stats
+
+
+class ResultCache:
+    """
+    最近の解析結果をプロセス内に保持するキャッシュ
+
+    正規化URLをキーに AnalysisResponse を保持し、解析日時から有効期限が過ぎたものは返さない。
+    件数またはおおよそのメモリ使用量が上限を超えた場合は、最も長く参照されていないものから削除する。
+    """
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, ttl: timedelta):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 正規化URL -> (解析結果, 有効期限, 推定サイズ)
+        self._entries: "OrderedDict[str, Tuple[AnalysisResponse, datetime, int]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, normalized_url: str) -> Optional[AnalysisResponse]:
+        """
+        有効な解析結果を取得する
+
+        Args:
+            normalized_url: 正規化されたURL
+
+        Returns:
+            キャッシュにある場合は AnalysisResponse（URLは正規化URL）、なければNone
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(normalized_url)
+            if entry is not None and entry[1] <= datetime.now():
+                self._remove(normalized_url)
+                entry = None
+
+            if entry is None:
+                cache_stats.record_miss(self.name)
+                return None
+
+            self._entries.move_to_end(normalized_url)
+            cache_stats.record_hit(self.name)
+            return entry[0]
+
+    def put(
+        self,
+        normalized_url: str,
+        response: AnalysisResponse,
+        analyzed_at: Optional[datetime] = None,
+    ) -> None:
+        """
+        成功した解析結果を保存する
+
+        Args:
+            normalized_url: 正規化されたURL
+            response: 解析結果（キャッシュからの結果として保持する）
+            analyzed_at: 解析日時（有効期限の起点。省略時は現在時刻（UTC））
+        """
+        if not self.enabled or response.status != "success":
+            return
+
+        # データベースのキャッシュ判定と同じく、保存される解析日時（UTC）を起点にする
+        expires_at = (analyzed_at or datetime.utcnow()) + self.ttl
+        if expires_at <= datetime.now():
+            return
+
+        response = response.model_copy(
+            update={"url": normalized_url, "from_cache": True}
+        )
+        size = len(response.model_dump_json())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(normalized_url)
+            self._entries[normalized_url] = (response, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_url = next(iter(self._entries))
+                self._remove(oldest_url)
+
+    def invalidate(self, normalized_url: str) -> None:
+        """指定URLの解析結果を削除する（強制再解析時に使用）"""
+        with self._lock:
+            self._remove(normalized_url)
+
+    def _remove(self, normalized_url: str) -> None:
+        entry = self._entries.pop(normalized_url, None)
+        if entry is not None:
+            self._bytes -= entry[2]
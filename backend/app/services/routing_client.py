@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# p95やエラー率を算出するのに必要な最小サンプル数
+MIN_SAMPLES = 10
+
+
+class ProviderHealth:
+    """
+    プロバイダごとの直近の応答時間・エラー率を集計し、サーキットブレーカーを管理するクラス
+
+    直近 ROUTING_WINDOW 件のエラー率が ROUTING_ERROR_THRESHOLD を超えるとブレーカーを開き、
+    ROUTING_BREAKER_COOLDOWN 秒が経過するまでそのプロバイダへの振り分けを止める。
+    経過後は1件だけ試行し、成功すれば閉じ、失敗すれば再び開く。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._latencies: deque = deque(maxlen=settings.ROUTING_WINDOW)
+        self._outcomes: deque = deque(maxlen=settings.ROUTING_WINDOW)
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def record_success(self, latency: float) -> None:
+        """成功した呼び出しの応答時間を記録する"""
+        self._latencies.append(latency)
+        self._outcomes.append(True)
+        if self._opened_at is not None:
+            logger.info(f"{self.name} の呼び出しが回復したためブレーカーを閉じます")
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self, latency: float) -> None:
+        """失敗した呼び出しを記録し、エラー率が閾値を超えたらブレーカーを開く"""
+        self._latencies.append(latency)
+        self._outcomes.append(False)
+        self._trial_in_flight = False
+
+        if self._opened_at is not None:
+            # 試行が失敗した場合は再び待機する
+            self._opened_at = time.monotonic()
+            return
+
+        if (
+            len(self._outcomes) >= MIN_SAMPLES
+            and self.error_rate() >= settings.ROUTING_ERROR_THRESHOLD
+        ):
+            self._opened_at = time.monotonic()
+            logger.warning(
+                f"{self.name} のエラー率が{self.error_rate():.0%}に達したため、"
+                f"{settings.ROUTING_BREAKER_COOLDOWN}秒間振り分けを停止します"
+            )
+
+    def record_cancelled(self, latency: float) -> None:
+        """
+        ヘッジ要求に負けて取り消した呼び出しの経過時間を記録する
+
+        実際の応答時間はこれ以上であるため、p95が過小評価されないように下限値として加える。
+        """
+        self._latencies.append(latency)
+        self._trial_in_flight = False
+
+    def is_available(self) -> bool:
+        """振り分け可能かどうか（ブレーカーが閉じているか、試行できる状態か）を判定する"""
+        if self._opened_at is None:
+            return True
+        if self._trial_in_flight:
+            return False
+        return time.monotonic() - self._opened_at >= settings.ROUTING_BREAKER_COOLDOWN
+
+    def begin_call(self) -> None:
+        """呼び出し開始を記録する（ブレーカーが開いている場合は試行中とする）"""
+        if self._opened_at is not None:
+            self._trial_in_flight = True
+
+    def error_rate(self) -> float:
+        """直近の呼び出しのエラー率"""
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def p95(self) -> Optional[float]:
+        """直近の応答時間の95パーセンタイル（サンプル不足の場合はNone）"""
+        if len(self._latencies) < MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[math.ceil(len(latencies) * 0.95) - 1]
+
+    def stats(self) -> Dict[str, Any]:
+        """現在の状態を取得する"""
+        return {
+            "samples": len(self._outcomes),
+            "error_rate": self.error_rate(),
+            "p95": self.p95(),
+            "breaker_open": self._opened_at is not None,
+        }
+
+
+class RoutingAIClient:
+    """
+    複数のAIクライアントを束ね、応答時間とエラー率に応じて振り分けるクライアント
+
+    通常は優先プロバイダを呼び出し、その応答が直近のp95を超えても返らない場合は
+    次のプロバイダにもヘッジ要求を送り、先に成功した結果を採用する。
+    エラーが続くプロバイダはブレーカーで一時的に振り分け対象から外し、
+    呼び出しが失敗した場合は次のプロバイダで再試行する。
+    """
+
+    def __init__(self, clients: List[Tuple[str, Any]]):
+        """
+        Args:
+            clients: (プロバイダ名, AIクライアント)のタプルのリスト（優先順）
+        """
+        self._clients = clients
+        self._health = {name: ProviderHealth(name) for name, _ in clients}
+        self._requests = 0
+        self._hedged = 0
+
+    async def analyze_website(self, url: str, content: str) -> Dict[str, Any]:
+        """
+        ウェブサイトの内容を解析してカテゴリを判定する
+
+        Args:
+            url: 解析対象のURL
+            content: ウェブサイトのコンテンツ
+
+        Returns:
+            解析結果の辞書
+        """
+        return await self._route("analyze_website", (url, content), hedge=True)
+
+    async def analyze_websites_packed(
+        self, pages: List[Tuple[str, str]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        複数のウェブサイトを1回のAPI呼び出しでまとめて解析する
+
+        まとめた呼び出しは入力が大きく、ヘッジするとコストが倍になるため、
+        失敗時の切り替えのみ行う。
+
+        Args:
+            pages: (URL, コンテンツ)のタプルのリスト
+
+        Returns:
+            URLをキーとする解析結果の辞書
+        """
+        return await self._route("analyze_websites_packed", (pages,), hedge=False)
+
+    async def _route(self, method: str, args: tuple, hedge: bool) -> Any:
+        """
+        振り分け可能なプロバイダを優先順に呼び出す
+
+        Args:
+            method: 呼び出すAIクライアントのメソッド名
+            args: メソッドの引数
+            hedge: 優先プロバイダが遅い場合にヘッジ要求を送るかどうか
+
+        Returns:
+            最初に成功したプロバイダの結果
+        """
+        candidates = self._candidates(method)
+        self._requests += 1
+        errors = []
+
+        while candidates:
+            name, client = candidates.pop(0)
+            primary = self._start(name, client, method, args)
+
+            hedge_delay = self._hedge_delay(name) if hedge and candidates else None
+            if hedge_delay is not None:
+                try:
+                    done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+                except asyncio.CancelledError:
+                    primary.cancel()
+                    raise
+                if not done:
+                    # 優先プロバイダがp95を超えても応答しないため、次のプロバイダにも送る
+                    hedge_name, hedge_client = candidates.pop(0)
+                    self._hedged += 1
+                    logger.info(
+                        f"{name} の応答が{hedge_delay:.1f}秒を超えたため、"
+                        f"{hedge_name} にヘッジ要求を送ります"
+                    )
+                    hedge_task = self._start(hedge_name, hedge_client, method, args)
+                    succeeded, result, hedge_errors = await self._first_success(
+                        {primary: name, hedge_task: hedge_name}
+                    )
+                    errors.extend(hedge_errors)
+                    if succeeded:
+                        return result
+                    continue
+
+            try:
+                return await primary
+            except Exception as e:
+                errors.append(f"{name}: {str(e)}")
+                if candidates:
+                    logger.warning(
+                        f"{name} の呼び出しに失敗したため {candidates[0][0]} に切り替えます: {str(e)}"
+                    )
+
+        raise Exception(
+            "全てのAIプロバイダの呼び出しに失敗しました: " + " / ".join(errors)
+        )
+
+    def _candidates(self, method: str) -> List[Tuple[str, Any]]:
+        """メソッドを持ち、ブレーカーが開いていないプロバイダを優先順に返す"""
+        supported = [
+            (name, client) for name, client in self._clients if hasattr(client, method)
+        ]
+        available = [
+            (name, client)
+            for name, client in supported
+            if self._health[name].is_available()
+        ]
+        # 全てのブレーカーが開いている場合は、優先順に試す
+        return available or supported
+
+    def _start(self, name: str, client: Any, method: str, args: tuple) -> asyncio.Task:
+        """プロバイダの呼び出しを開始し、応答時間と成否を記録するタスクを返す"""
+        health = self._health[name]
+        health.begin_call()
+
+        async def call():
+            started_at = time.monotonic()
+            try:
+                result = await getattr(client, method)(*args)
+            except asyncio.CancelledError:
+                health.record_cancelled(time.monotonic() - started_at)
+                raise
+            except Exception:
+                health.record_failure(time.monotonic() - started_at)
+                raise
+            health.record_success(time.monotonic() - started_at)
+            return result
+
+        return asyncio.create_task(call())
+
+    async def _first_success(
+        self, tasks: Dict[asyncio.Task, str]
+    ) -> Tuple[bool, Any, List[str]]:
+        """
+        並行して実行している呼び出しのうち、最初に成功した結果を返す
+
+        Returns:
+            (成功したかどうか, 結果, 失敗したプロバイダのエラーのリスト)のタプル
+        """
+        pending = set(tasks)
+        errors = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return True, task.result(), errors
+                    errors.append(f"{tasks[task]}: {str(task.exception())}")
+            return False, None, errors
+        finally:
+            # 負けた呼び出しは取り消す
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """
+        ヘッジ要求を送るまでの待機秒数を求める
+
+        優先プロバイダの直近のp95を使い、サンプル不足の場合やヘッジ要求の割合が
+        ROUTING_HEDGE_MAX_RATIO を超えている場合はヘッジしない。
+        """
+        if self._hedged >= self._requests * settings.ROUTING_HEDGE_MAX_RATIO:
+            return None
+
+        p95 = self._health[name].p95()
+        if p95 is None:
+            return None
+        return max(p95, settings.ROUTING_HEDGE_MIN_DELAY)
+
+    def stats(self) -> Dict[str, Any]:
+        """プロバイダごとの状態とヘッジ要求の件数を取得する"""
+        return {
+            "requests": self._requests,
+            "hedged": self._hedged,
+            "providers": {
+                name: health.stats() for name, health in self._health.items()
+            },
+        }
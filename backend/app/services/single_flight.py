@@ -0,0 +1,129 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from app.services.cache_stats import cache_stats
+
+
+class SingleFlight:
+    """
+    同じキーの処理が同時に要求された場合に、実行中の1件の結果を共有するクラス（プロセス内）
+
+    最初の呼び出し元が処理を実行し、後から来た呼び出し元はその完了を待って
+    同じ結果（例外を含む）を受け取る。待機中の呼び出し元がタイムアウトや
+    キャンセルで離脱しても、共有している処理は取り消さない。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 実行中の処理のタスク（呼び出し元が離脱しても完了まで参照を保持する）
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(
+        self,
+        key: str,
+        operation: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        キーごとに処理を1回だけ実行し、その結果を返す
+
+        Args:
+            key: 処理を共有するキー
+            operation: 処理を行うコルーチンを返す関数
+            timeout: 結果を待つ秒数（Noneの場合は無制限）
+
+        Returns:
+            処理の結果
+
+        Raises:
+            asyncio.TimeoutError: 指定した秒数内に処理が完了しなかった場合
+        """
+        future = self.claim(key)
+        if future is None:
+            return await self.wait(self._inflight[key], timeout)
+
+        task = asyncio.ensure_future(operation())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda done: self._settle(key, future, done))
+        return await self.wait(future, timeout)
+
+    def claim(self, key: str) -> Optional[asyncio.Future]:
+        """
+        キーの処理を担当する権利を取得する
+
+        取得できた場合、呼び出し元は処理の完了後に必ず resolve を呼び出すこと。
+
+        Args:
+            key: 処理を共有するキー
+
+        Returns:
+            結果を設定する Future（既に実行中の処理がある場合はNone）
+        """
+        if key in self._inflight:
+            cache_stats.record_hit(self.name)
+            return None
+
+        cache_stats.record_miss(self.name)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def get(self, key: str) -> Optional[asyncio.Future]:
+        """実行中の処理の Future を取得する"""
+        return self._inflight.get(key)
+
+    def resolve(
+        self,
+        key: str,
+        future: asyncio.Future,
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        claim で取得した処理の結果を設定し、待機中の呼び出し元に通知する
+
+        Args:
+            key: 処理を共有するキー
+            future: claim で取得した Future
+            result: 処理の結果
+            error: 処理が失敗した場合の例外
+        """
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            # 待機している呼び出し元がいない場合に警告が出ないよう、取得済みにしておく
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def wait(
+        self, future: asyncio.Future, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        共有している処理を取り消さずに、その完了を待つ
+
+        Args:
+            future: 実行中の処理の Future
+            timeout: 結果を待つ秒数（Noneの場合は無制限）
+
+        Returns:
+            処理の結果
+        """
+        if timeout is None:
+            return await asyncio.shield(future)
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _settle(self, key: str, future: asyncio.Future, task: asyncio.Task) -> None:
+        """実行した処理の結果を Future に反映する"""
+        if task.cancelled():
+            self.resolve(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self.resolve(key, future, error=task.exception())
+        else:
+            self.resolve(key, future, result=task.result())
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import desc, func
+from sqlalchemy.orm import Session
+
+from ..models.database import AnalysisHistory, AnalysisUsage, BatchAnalysisHistory
+from ..models.schema import BatchUsage, DailyUsage, ProviderUsage
+
+
+class UsageService:
+    @staticmethod
+    def _usage_columns():
+        """集計に使う列（AIを呼び出した解析の件数・トークン数・コスト）"""
+        return (
+            func.count(AnalysisUsage.analysis_id),
+            func.coalesce(func.sum(AnalysisUsage.input_tokens), 0),
+            func.coalesce(func.sum(AnalysisUsage.output_tokens), 0),
+            func.coalesce(func.sum(AnalysisUsage.cost), 0.0),
+        )
+
+    @staticmethod
+    async def get_daily_usage(db: Session, days: int = 30) -> List[DailyUsage]:
+        """
+        日別・プロバイダ別のトークン使用量とコストを取得する（解析した日時で集計する）
+
+        複数のプロバイダを呼び出した解析は、プロバイダごとの使用量をそれぞれに集計する。
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        day = func.date(AnalysisHistory.analyzed_at)
+
+        rows = (
+            db.query(day, AnalysisUsage.provider, *UsageService._usage_columns())
+            .join(AnalysisHistory, AnalysisHistory.id == AnalysisUsage.analysis_id)
+            .filter(AnalysisHistory.analyzed_at >= since)
+            .group_by(day, AnalysisUsage.provider)
+            .order_by(desc(day), AnalysisUsage.provider)
+            .all()
+        )
+
+        return [
+            DailyUsage(
+                date=str(date),
+                provider=provider,
+                calls=calls,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cost=cost,
+            )
+            for date, provider, calls, input_tokens, output_tokens, cost in rows
+        ]
+
+    @staticmethod
+    async def get_provider_usage(db: Session, days: int = 30) -> List[ProviderUsage]:
+        """
+        プロバイダ別のトークン使用量とコストを取得する
+
+        複数のプロバイダを呼び出した解析は、プロバイダごとの使用量をそれぞれに集計する。
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+
+        rows = (
+            db.query(AnalysisUsage.provider, *UsageService._usage_columns())
+            .join(AnalysisHistory, AnalysisHistory.id == AnalysisUsage.analysis_id)
+            .filter(AnalysisHistory.analyzed_at >= since)
+            .group_by(AnalysisUsage.provider)
+            .order_by(AnalysisUsage.provider)
+            .all()
+        )
+
+        return [
+            ProviderUsage(
+                provider=provider,
+                calls=calls,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cost=cost,
+            )
+            for provider, calls, input_tokens, output_tokens, cost in rows
+        ]
+
+    @staticmethod
+    async def get_batch_usage(db: Session, limit: int = 20) -> List[BatchUsage]:
+        """
+        一括解析ごとのトークン使用量とコストを新しい順に取得する
+        """
+        batches = (
+            db.query(BatchAnalysisHistory)
+            .order_by(desc(BatchAnalysisHistory.timestamp))
+            .limit(limit)
+            .all()
+        )
+
+        return [
+            BatchUsage(
+                batch_id=batch.batch_id,
+                timestamp=batch.timestamp,
+                total_urls=batch.total_urls,
+                success_count=batch.success_count,
+                failed_count=batch.failed_count,
+                input_tokens=batch.input_tokens or 0,
+                output_tokens=batch.output_tokens or 0,
+                cost=batch.cost or 0.0,
+                budget_exhausted=bool(batch.budget_exhausted),
+            )
+            for batch in batches
+        ]
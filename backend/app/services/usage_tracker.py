@@ -0,0 +1,323 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.prompt_builder import estimate_tokens
+from app.services.rate_limiter import EXPECTED_OUTPUT_TOKENS
+
+# キャッシュ書き込み・読み込みトークンの単価（通常の入力単価に対する倍率）
+CACHE_WRITE_PRICE_RATIO = 1.25
+CACHE_READ_PRICE_RATIO = 0.1
+
+# ページ内容以外のプロンプト（指示・カテゴリ候補・出力形式）の推定トークン数
+PROMPT_OVERHEAD_TOKENS = 800
+
+
+class BudgetExhaustedError(Exception):
+    """トークン数・コストの上限に達したためAI APIを呼び出さなかったことを表す例外"""
+
+
+class UsageTotals:
+    """
+    AI API呼び出しのトークン使用量とコスト（USD）の合計
+
+    振り分けや個別解析への切り替えで複数のプロバイダを呼び出した場合に備え、
+    プロバイダごとの内訳（by_provider）も集計する。
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.by_provider: Dict[str, "UsageTotals"] = {}
+        self._answered_by: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def provider(self) -> Optional[str]:
+        """
+        回答に使用したプロバイダ名（最後に使用量を記録したプロバイダ）
+
+        失敗した呼び出しや、ヘッジ要求で負けて取り消した呼び出しは回答より先に終わるため、
+        最後に記録したプロバイダを回答したプロバイダとする。
+        """
+        return self._answered_by
+
+    def add(
+        self, provider: str, input_tokens: int, output_tokens: int, cost: float
+    ) -> None:
+        """1回の呼び出しの使用量を加算する"""
+        call = UsageTotals()
+        call.calls = 1
+        call.input_tokens = input_tokens
+        call.output_tokens = output_tokens
+        call.cost = cost
+        self._add_provider(provider, call)
+
+    def merge(self, other: "UsageTotals") -> None:
+        """
+        他の集計の使用量を加算する
+
+        回答に使用したプロバイダは、こちらで記録済みの場合はそのままにする。
+        """
+        answered_by = self._answered_by
+        for provider, totals in other.by_provider.items():
+            self._add_provider(provider, totals)
+        self._answered_by = answered_by or other._answered_by
+
+    def split(self, count: int) -> List["UsageTotals"]:
+        """
+        複数サイトをまとめた呼び出しの使用量を、各サイトに按分する
+
+        トークン数の端数は先頭のサイトから1ずつ割り当て、按分した合計が元の使用量と一致するようにする。
+        プロバイダごとの内訳も同様に按分する。
+
+        Args:
+            count: まとめたサイト数
+
+        Returns:
+            サイトごとの使用量
+        """
+        if not self.by_provider:
+            input_tokens, input_rest = divmod(self.input_tokens, count)
+            output_tokens, output_rest = divmod(self.output_tokens, count)
+            shares = []
+            for index in range(count):
+                share = UsageTotals()
+                share.calls = self.calls
+                share.input_tokens = input_tokens + (1 if index < input_rest else 0)
+                share.output_tokens = output_tokens + (1 if index < output_rest else 0)
+                share.cost = self.cost / count
+                shares.append(share)
+            return shares
+
+        shares = [UsageTotals() for _ in range(count)]
+        for provider, totals in self.by_provider.items():
+            for share, part in zip(shares, totals.split(count)):
+                share._add_provider(provider, part)
+        for share in shares:
+            share._answered_by = self._answered_by
+        return shares
+
+    def _add_provider(self, provider: str, totals: "UsageTotals") -> None:
+        """プロバイダの使用量を合計と内訳に加算する"""
+        if provider not in self.by_provider:
+            self.by_provider[provider] = UsageTotals()
+        for target in (self, self.by_provider[provider]):
+            target.calls += totals.calls
+            target.input_tokens += totals.input_tokens
+            target.output_tokens += totals.output_tokens
+            target.cost += totals.cost
+        self._answered_by = provider
+
+
+# 現在のコンテキストで使用量を集計している UsageTotals（外側から順）
+_active_totals: ContextVar[Tuple[UsageTotals, ...]] = ContextVar(
+    "active_usage_totals", default=()
+)
+
+
+@contextmanager
+def track_usage(totals: Optional[UsageTotals] = None) -> Iterator[UsageTotals]:
+    """
+    ブロック内で行われたAI API呼び出しの使用量を集計する
+
+    入れ子にした場合は、内側の呼び出しの使用量が外側の集計にも加算される。
+    ブロック内で作成したタスクにも引き継がれる。
+
+    Args:
+        totals: 加算先（省略時は新しく作成する）
+
+    Returns:
+        使用量の合計
+    """
+    if totals is None:
+        totals = UsageTotals()
+
+    token = _active_totals.set(_active_totals.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _active_totals.reset(token)
+
+
+def calculate_cost(
+    provider: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> float:
+    """
+    トークン数からコスト（USD）を計算する
+
+    Args:
+        provider: プロバイダ名（gemini または claude）
+        input_tokens: 入力トークン数（キャッシュの読み書き分を含む）
+        output_tokens: 出力トークン数
+        cache_read_tokens: キャッシュから読み込んだ入力トークン数
+        cache_write_tokens: キャッシュに書き込んだ入力トークン数
+
+    Returns:
+        コスト（USD）
+    """
+    input_price, output_price = _get_prices(provider)
+    uncached_tokens = input_tokens - cache_read_tokens - cache_write_tokens
+    input_cost = input_price * (
+        uncached_tokens
+        + cache_read_tokens * CACHE_READ_PRICE_RATIO
+        + cache_write_tokens * CACHE_WRITE_PRICE_RATIO
+    )
+    return (input_cost + output_price * output_tokens) / 1_000_000
+
+
+def record_llm_usage(
+    provider: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0,
+) -> float:
+    """
+    AI API呼び出しの使用量を、現在のコンテキストで集計中の全ての UsageTotals に加算する
+
+    Args:
+        provider: プロバイダ名（gemini または claude）
+        input_tokens: 入力トークン数（キャッシュの読み書き分を含む）
+        output_tokens: 出力トークン数
+        cache_read_tokens: キャッシュから読み込んだ入力トークン数
+        cache_write_tokens: キャッシュに書き込んだ入力トークン数
+
+    Returns:
+        この呼び出しのコスト（USD）
+    """
+    cost = calculate_cost(
+        provider, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens
+    )
+    for totals in _active_totals.get():
+        totals.add(provider, input_tokens, output_tokens, cost)
+    return cost
+
+
+def estimate_call_usage(contents: List[str]) -> Tuple[int, float]:
+    """
+    AI API呼び出し前に、トークン数とコストの見込みを求める（予算の事前確保に使用）
+
+    Args:
+        contents: プロンプトに含めるページ内容のリスト（2件以上はまとめた呼び出し）
+
+    Returns:
+        (推定トークン数, 推定コスト)のタプル
+    """
+    provider = _get_default_provider()
+    if len(contents) > 1:
+        token_budget = settings.LLM_PACK_SITE_TOKEN_BUDGET
+    elif provider == "claude":
+        token_budget = settings.CLAUDE_INPUT_TOKEN_BUDGET
+    else:
+        token_budget = settings.GEMINI_INPUT_TOKEN_BUDGET
+
+    input_tokens = PROMPT_OVERHEAD_TOKENS + sum(
+        min(estimate_tokens(content), token_budget) for content in contents
+    )
+    output_tokens = EXPECTED_OUTPUT_TOKENS * len(contents)
+    return (
+        input_tokens + output_tokens,
+        calculate_cost(provider, input_tokens, output_tokens),
+    )
+
+
+class UsageBudget:
+    """
+    一括解析1回あたりのトークン数・コストの上限
+
+    呼び出し前に見込み分を確保し、実績と確保中の見込みの合計が上限を超える呼び出しは
+    実行中の呼び出しが終わるまで待たせる。実績が上限に達した後は新しい呼び出しを許可しない。
+    """
+
+    def __init__(
+        self, max_tokens: Optional[int] = None, max_cost: Optional[float] = None
+    ):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.totals = UsageTotals()
+        self.exhausted = False
+        self.skipped = 0
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def reserve(self, tokens: int, cost: float) -> bool:
+        """
+        呼び出し1回分の見込みを確保する
+
+        Args:
+            tokens: 推定トークン数
+            cost: 推定コスト
+
+        Returns:
+            呼び出してよい場合はTrue（予算を使い切った場合はFalse）
+        """
+        async with self._condition:
+            while True:
+                if self._is_spent():
+                    self.exhausted = True
+                    return False
+
+                if not self._in_flight or self._fits(tokens, cost):
+                    self._reserved_tokens += tokens
+                    self._reserved_cost += cost
+                    self._in_flight += 1
+                    return True
+
+                # 実行中の呼び出しの実績が確定するまで待つ
+                await self._condition.wait()
+
+    async def release(self, tokens: int, cost: float) -> None:
+        """確保した見込みを解放する（実績は track_usage で集計済み）"""
+        async with self._condition:
+            self._reserved_tokens -= tokens
+            self._reserved_cost -= cost
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _is_spent(self) -> bool:
+        if self.max_tokens is not None and self.totals.total_tokens >= self.max_tokens:
+            return True
+        if self.max_cost is not None and self.totals.cost >= self.max_cost:
+            return True
+        return False
+
+    def _fits(self, tokens: int, cost: float) -> bool:
+        if self.max_tokens is not None:
+            if (
+                self.totals.total_tokens + self._reserved_tokens + tokens
+                > self.max_tokens
+            ):
+                return False
+        if self.max_cost is not None:
+            if self.totals.cost + self._reserved_cost + cost > self.max_cost:
+                return False
+        return True
+
+
+def _get_prices(provider: str) -> Tuple[float, float]:
+    """プロバイダの入力・出力の100万トークンあたりの単価（USD）"""
+    if provider == "claude":
+        return settings.CLAUDE_INPUT_PRICE, settings.CLAUDE_OUTPUT_PRICE
+    return settings.GEMINI_INPUT_PRICE, settings.GEMINI_OUTPUT_PRICE
+
+
+def _get_default_provider() -> str:
+    """見込みの計算に使うプロバイダ（振り分け時は優先プロバイダ）"""
+    provider = settings.AI_MODEL_PROVIDER.lower()
+    if provider in ("routing", "auto"):
+        return settings.ROUTING_PRIMARY_PROVIDER.lower()
+    return provider
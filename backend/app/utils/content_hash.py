@@ -0,0 +1,41 @@
+import hashlib
+import re
+import unicodedata
+
+# 連続する空白文字
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_content(text: str) -> str:
+    """
+    比較用にテキストを正規化する
+
+    以下の処理を行う:
+    1. Unicode正規化（NFKC） -> 全角英数字・半角カナなどの表記ゆれを統一
+    2. 小文字化
+    3. 連続する空白文字を1つの半角スペースにまとめ、前後の空白を削除
+
+    Args:
+        text: 正規化するテキスト
+
+    Returns:
+        正規化されたテキスト
+    """
+    if not text:
+        return ""
+
+    normalized = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+
+
+def compute_content_hash(text: str) -> str:
+    """
+    正規化したテキストのハッシュ値（SHA-256）を計算する
+
+    Args:
+        text: 対象のテキスト
+
+    Returns:
+        16進数表記のハッシュ値
+    """
+    return hashlib.sha256(normalize_content(text).encode("utf-8")).hexdigest()
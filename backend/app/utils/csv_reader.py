@@ -0,0 +1,192 @@
+import asyncio
+import codecs
+import csv
+import io
+import logging
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 文字コードの判定に使用する先頭部分のバイト数
+DETECT_SAMPLE_SIZE = 64 * 1024
+
+
+class CsvFormatError(ValueError):
+    """CSVファイルの形式が不正な場合の例外"""
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    CSVファイルの先頭部分から文字コードを判定する
+
+    BOM付きUTF-8、UTF-8、Shift_JIS（Windowsの拡張文字を含むCP932）のいずれかとする。
+
+    Args:
+        sample: ファイルの先頭部分
+
+    Returns:
+        文字コード名
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+
+    try:
+        # 末尾で途切れたマルチバイト文字は判定の対象外にする
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp932"
+
+
+def clean_url(value: str) -> Optional[str]:
+    """
+    CSVのセルの値をURLとして確認・整形する
+
+    前後の空白を除き、スキームがない場合は https:// を補う。
+
+    Args:
+        value: セルの値
+
+    Returns:
+        整形したURL（http/https のURLとして扱えない場合はNone）
+    """
+    url = value.strip()
+    if not url:
+        return None
+    if "://" not in url:
+        url = f"https://{url}"
+
+    # デコードできなかった文字や空白を含む値はURLとして扱わない
+    if "�" in url or any(char.isspace() for char in url):
+        return None
+
+    parsed = urlparse(url)
+    if parsed.scheme.lower() not in ("http", "https") or not parsed.netloc:
+        return None
+    return url
+
+
+class CsvUrlReader:
+    """
+    CSVファイルからURLの列を少しずつ読み込むクラス
+
+    ファイル全体をメモリに読み込まず、先頭部分で文字コードを判定してから逐次デコードし、
+    行ごとにURLを確認・整形して返す。ファイルの読み込みとデコードはスレッドで行う。
+    CSVとして解釈できない行があった場合は、それ以降を読み飛ばさずに CsvFormatError を送出する。
+    """
+
+    def __init__(self, file: BinaryIO, column_name: str, rows_per_read: int = 1000):
+        self.file = file
+        self.column_name = column_name
+        self.rows_per_read = max(rows_per_read, 1)
+        self.encoding: Optional[str] = None
+        # 読み込んだデータ行の数と、URLとして扱えなかった行の数
+        self.row_count = 0
+        self.invalid_count = 0
+        self._reader = None
+        self._column_index = 0
+        self._buffer: List[str] = []
+        self._exhausted = False
+
+    async def open(self) -> None:
+        """
+        文字コードを判定してヘッダー行を読み込む
+
+        Raises:
+            CsvFormatError: 指定した列がない場合
+        """
+        await asyncio.to_thread(self._open)
+
+    async def has_urls(self) -> bool:
+        """
+        URLが1件以上あるかどうか（最初のURLが見つかるまで読み込む）
+
+        Raises:
+            CsvFormatError: CSVとして解釈できない行があった場合
+        """
+        while not self._buffer and not self._exhausted:
+            self._buffer = await asyncio.to_thread(self._read_urls)
+        return bool(self._buffer)
+
+    async def urls(self) -> AsyncIterator[str]:
+        """
+        URLを行の順に返す
+
+        Returns:
+            整形したURLを返す非同期イテレータ
+
+        Raises:
+            CsvFormatError: CSVとして解釈できない行があった場合
+        """
+        while True:
+            if not self._buffer:
+                if self._exhausted:
+                    return
+                self._buffer = await asyncio.to_thread(self._read_urls)
+                continue
+
+            urls, self._buffer = self._buffer, []
+            for url in urls:
+                yield url
+
+    def _open(self) -> None:
+        sample = self.file.read(DETECT_SAMPLE_SIZE)
+        self.file.seek(0)
+        self.encoding = detect_encoding(sample)
+
+        # 判定後に不正なバイト列があった行は、URLとして扱えない行として読み飛ばす
+        text = io.TextIOWrapper(
+            self.file, encoding=self.encoding, errors="replace", newline=""
+        )
+        self._reader = csv.reader(text)
+
+        header = next(self._reader, None)
+        columns = [column.strip() for column in header or []]
+        if self.column_name not in columns:
+            raise CsvFormatError(
+                f"CSV内に'{self.column_name}'列が見つかりません。列名を確認してください。"
+            )
+        self._column_index = columns.index(self.column_name)
+
+    def _read_urls(self) -> List[str]:
+        """最大 rows_per_read 行を読み込み、URLのリストを返す"""
+        urls = []
+        rows = 0
+        try:
+            for row in islice(self._reader, self.rows_per_read):
+                rows += 1
+                self.row_count += 1
+                value = row[self._column_index] if self._column_index < len(row) else ""
+                if not value.strip():
+                    continue
+
+                url = clean_url(value)
+                if url is None:
+                    self.invalid_count += 1
+                    logger.debug(
+                        f"URLとして扱えない値を読み飛ばしました: {self.row_count + 1}行目"
+                    )
+                    continue
+                urls.append(url)
+
+        except csv.Error as e:
+            self._exhausted = True
+            raise CsvFormatError(
+                f"CSVファイルの{self.row_count + 2}行目を読み込めませんでした: {str(e)}"
+            ) from e
+
+        if rows < self.rows_per_read:
+            self._finish()
+        return urls
+
+    def _finish(self) -> None:
+        self._exhausted = True
+        logger.info(
+            f"CSVファイルを読み込みました: {self.row_count}行, 文字コード={self.encoding}"
+        )
+        if self.invalid_count:
+            logger.warning(
+                f"URLとして扱えない値を含む行を読み飛ばしました: {self.invalid_count}行"
+            )
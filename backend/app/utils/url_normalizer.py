@@ -42,3 +42,60 @@ def normalize_url(url: str) -> str:
     )
 
     return normalized
+
+
+# 2階層のパブリックサフィックス（例: example.co.jp の "co.jp"）
+MULTI_LEVEL_SUFFIXES = {
+    'co.jp',
+    'or.jp',
+    'ne.jp',
+    'ac.jp',
+    'ad.jp',
+    'ed.jp',
+    'go.jp',
+    'gr.jp',
+    'lg.jp',
+    'co.uk',
+    'org.uk',
+    'ac.uk',
+    'com.au',
+    'net.au',
+    'org.au',
+    'co.kr',
+    'com.cn',
+    'com.tw',
+    'com.hk',
+    'com.sg',
+    'co.nz',
+    'com.br',
+}
+
+
+def get_registrable_domain(url: str) -> str:
+    """
+    URLから登録可能ドメインを取得する
+
+    サブドメインを除いたドメイン（例: www.example.co.jp -> example.co.jp）を返す。
+    IPアドレスやlocalhostの場合はホスト名をそのまま返す。
+
+    Args:
+        url: 対象のURL
+
+    Returns:
+        登録可能ドメイン（取得できない場合は空文字）
+    """
+    host = (urlparse(url).hostname or '').lower().rstrip('.')
+    if not host:
+        return ''
+
+    labels = host.split('.')
+
+    # IPアドレスや単一ラベルのホストはそのまま
+    if len(labels) < 3 or all(label.isdigit() for label in labels):
+        return host
+
+    suffix = '.'.join(labels[-2:])
+    if suffix in MULTI_LEVEL_SUFFIXES:
+        return '.'.join(labels[-3:])
+
+    return suffix
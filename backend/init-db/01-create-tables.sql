@@ -12,9 +12,51 @@ CREATE TABLE
       error TEXT,
       analysis JSONB,
       is_batch BOOLEAN DEFAULT FALSE,
-      batch_id TEXT
+      batch_id TEXT,
+      content_hash TEXT,
+      cache_source TEXT,
+      provider TEXT,
+      input_tokens INTEGER,
+      output_tokens INTEGER,
+      cost FLOAT,
+      analyzed_at TIMESTAMP
+    WITH
+      TIME ZONE DEFAULT CURRENT_TIMESTAMP
   );
 
+-- 既存のテーブルに後から追加した列
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS cache_source TEXT;
+
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS provider TEXT;
+
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS input_tokens INTEGER;
+
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS output_tokens INTEGER;
+
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS cost FLOAT;
+
+-- 解析した日時（timestamp はキャッシュの再検証で更新されるため、使用量の集計にはこちらを使う）
+ALTER TABLE analysis_history
+ADD COLUMN IF NOT EXISTS analyzed_at TIMESTAMP WITH TIME ZONE;
+
+UPDATE analysis_history
+SET
+  analyzed_at = timestamp
+WHERE
+  analyzed_at IS NULL;
+
+ALTER TABLE analysis_history
+ALTER COLUMN analyzed_at
+SET DEFAULT CURRENT_TIMESTAMP;
+
 -- インデックスを作成
 CREATE INDEX IF NOT EXISTS analysis_history_url_idx ON analysis_history (url);
 
@@ -28,6 +70,25 @@ CREATE INDEX IF NOT EXISTS analysis_history_batch_id_idx ON analysis_history (ba
 
 CREATE INDEX IF NOT EXISTS analysis_history_is_batch_idx ON analysis_history (is_batch);
 
+CREATE INDEX IF NOT EXISTS analysis_history_content_hash_idx ON analysis_history (content_hash);
+
+CREATE INDEX IF NOT EXISTS analysis_history_provider_idx ON analysis_history (provider);
+
+CREATE INDEX IF NOT EXISTS analysis_history_analyzed_at_idx ON analysis_history (analyzed_at);
+
+-- 解析履歴ごとのプロバイダ別のトークン使用量（複数のプロバイダを呼び出した場合は複数行）
+CREATE TABLE
+  IF NOT EXISTS analysis_usage (
+    analysis_id TEXT REFERENCES analysis_history (id) ON DELETE CASCADE,
+    provider TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cost FLOAT NOT NULL DEFAULT 0,
+    PRIMARY KEY (analysis_id, provider)
+  );
+
+CREATE INDEX IF NOT EXISTS analysis_usage_provider_idx ON analysis_usage (provider);
+
 -- 一括解析履歴用のテーブルを作成
 CREATE TABLE
   IF NOT EXISTS batch_analysis_history (
@@ -37,9 +98,61 @@ CREATE TABLE
       TIME ZONE DEFAULT CURRENT_TIMESTAMP,
       total_urls INTEGER NOT NULL,
       success_count INTEGER NOT NULL,
-      failed_count INTEGER NOT NULL
+      failed_count INTEGER NOT NULL,
+      input_tokens INTEGER,
+      output_tokens INTEGER,
+      cost FLOAT,
+      budget_exhausted BOOLEAN DEFAULT FALSE,
+      status TEXT DEFAULT 'completed',
+      processed_count INTEGER DEFAULT 0,
+      error TEXT,
+      updated_at TIMESTAMP
+      WITH
+        TIME ZONE,
+        completed_at TIMESTAMP
+      WITH
+        TIME ZONE
   );
 
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS input_tokens INTEGER;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS output_tokens INTEGER;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS cost FLOAT;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS budget_exhausted BOOLEAN DEFAULT FALSE;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'completed';
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS processed_count INTEGER DEFAULT 0;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS error TEXT;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS options JSONB;
+
+-- 実行中のプロセスと、そのプロセスが最後に実行中であることを記録した日時
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS owner TEXT;
+
+ALTER TABLE batch_analysis_history
+ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS batch_analysis_history_status_idx ON batch_analysis_history (status);
+
 -- 一括解析とURLの関連付けテーブル
 CREATE TABLE
   IF NOT EXISTS batch_analysis_items (
@@ -48,6 +161,33 @@ CREATE TABLE
     PRIMARY KEY (batch_id, analysis_id)
   );
 
+-- 一括解析の各URLの進捗（再開時は結果が確定していないURLのみ解析する）
+CREATE TABLE
+  IF NOT EXISTS batch_analysis_urls (
+    batch_id TEXT REFERENCES batch_analysis_history (batch_id) ON DELETE CASCADE,
+    position INTEGER,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'success', 'failed')),
+    analysis_id TEXT REFERENCES analysis_history (id) ON DELETE SET NULL,
+    PRIMARY KEY (batch_id, position)
+  );
+
+CREATE INDEX IF NOT EXISTS batch_analysis_urls_status_idx ON batch_analysis_urls (batch_id, status);
+
+-- ページの検証子（ETag/Last-Modified）とコンテンツハッシュ
+CREATE TABLE
+  IF NOT EXISTS page_snapshots (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    content_text TEXT,
+    history_id TEXT REFERENCES analysis_history (id) ON DELETE SET NULL,
+    checked_at TIMESTAMP
+    WITH
+      TIME ZONE DEFAULT CURRENT_TIMESTAMP
+  );
+
 -- カテゴリマスターテーブル
 CREATE TABLE
   IF NOT EXISTS categories (
@@ -61,8 +201,17 @@ CREATE TABLE
 -- コメント
 COMMENT ON TABLE analysis_history IS '単一URL解析の履歴';
 
+COMMENT ON TABLE analysis_usage IS '解析履歴ごとのプロバイダ別のトークン使用量';
+
 COMMENT ON TABLE batch_analysis_history IS '一括解析の履歴';
 
 COMMENT ON TABLE batch_analysis_items IS '一括解析と個別解析の関連付け';
 
+COMMENT ON TABLE batch_analysis_urls IS '一括解析の各URLの進捗（中断後の再開用）';
+
+ALTER TABLE page_snapshots
+ADD COLUMN IF NOT EXISTS content_text TEXT;
+
+COMMENT ON TABLE page_snapshots IS 'ページの再検証用情報（条件付きGET・コンテンツハッシュ）';
+
 COMMENT ON TABLE categories IS 'カテゴリマスター';
\ No newline at end of file
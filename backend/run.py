@@ -7,7 +7,10 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 
 from app.api import api_router
+from app.api.endpoints.jobs import job_manager
 from app.core.config import settings
+from app.services.crawler import close_http_client
+from app.services.html_extractor import shutdown_extraction_executor
 
 # FastAPIアプリケーションの作成
 app = FastAPI(
@@ -52,6 +55,22 @@ app.add_middleware(
 app.include_router(api_router, prefix=settings.API_BASE_PATH)
 
 
+# 起動時に、停止したプロセスで中断された一括解析ジョブを失敗として記録する（JOB_AUTO_RESUME が有効な場合は再開する）
+# 以降はリースを定期的に更新し、他のワーカープロセスの停止で中断されたジョブも同様に扱う
+@app.on_event("startup")
+async def recover_jobs():
+    job_manager.recover_interrupted()
+    job_manager.start_heartbeat()
+
+
+# アプリケーション終了時にリースの更新を止め、共有HTTPクライアントとテキスト抽出用のExecutorを閉じる
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await job_manager.stop_heartbeat()
+    await close_http_client()
+    shutdown_extraction_executor()
+
+
 # ヘルスチェックエンドポイント
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+# 設定はインポート時に読み込まれるため、アプリケーションをインポートする前に
+# テスト用のデータベース（SQLite）と擬似AIクライアントを指定する
+_DATA_DIR = tempfile.mkdtemp(prefix="website-analyzer-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATA_DIR}/test.db"
+os.environ["AI_MODEL_PROVIDER"] = "fake"
+os.environ["FAKE_AI_LATENCY_MEDIAN"] = "0"
+os.environ["FAKE_AI_LATENCY_P95"] = "0"
+os.environ["FAKE_AI_ERROR_RATE"] = "0"
+os.environ["FAKE_AI_RATE_LIMIT_RATE"] = "0"
+os.environ["LOCAL_CLASSIFIER_ENABLED"] = "false"
+os.environ["HTML_EXTRACTOR_EXECUTOR"] = "thread"
+os.environ["CRAWLER_PER_HOST_DELAY"] = "0"
+os.environ["PIPELINE_BATCH_LINGER"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+from app.models.database import Base, engine  # noqa: E402
+from app.services import crawler, host_scheduler, rate_limiter  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """テストごとに空のテーブルを作成する"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def fresh_shared_state(monkeypatch):
+    """
+    イベントループに結び付くプロセス内の共有オブジェクトをテストごとに作り直す
+    （各テストは asyncio.run で新しいイベントループを使うため）
+    """
+    monkeypatch.setattr(host_scheduler, "_host_scheduler", None)
+    monkeypatch.setattr(rate_limiter, "_rate_limiters", {})
+
+
+@pytest.fixture
+def fetched_urls(monkeypatch) -> List[str]:
+    """
+    ネットワークに接続せず、どのURLにもそのURLを本文に含むHTMLを返すようにする
+
+    Returns:
+        取得したURLのリスト（取得した順）
+    """
+    requested: List[str] = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        html = (
+            f"<html><head><title>{request.url.host}</title></head>"
+            f"<body><h1>{request.url.host}</h1><p>{request.url} の本文です。</p></body></html>"
+        )
+        return httpx.Response(
+            200,
+            headers={"Content-Type": "text/html; charset=utf-8"},
+            content=html.encode("utf-8"),
+        )
+
+    monkeypatch.setattr(
+        crawler,
+        "_http_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(respond)),
+    )
+    return requested
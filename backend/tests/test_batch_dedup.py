@@ -0,0 +1,72 @@
+import asyncio
+
+from app.models.database import BatchAnalysisUrl, SessionLocal
+from app.services.analyzer import WebsiteAnalyzer
+
+# 正規化すると a と b が2回ずつ現れる入力
+URLS = [
+    "https://a.example/",
+    "https://b.example/page",
+    "https://a.example",
+    "https://c.example/",
+    "https://b.example/page#top",
+]
+
+
+async def iterate(urls):
+    for url in urls:
+        yield url
+
+
+def test_duplicates_are_analyzed_once_and_fanned_out_in_input_order(fetched_urls):
+    async def main():
+        return await WebsiteAnalyzer().analyze_urls_batch(URLS)
+
+    response = asyncio.run(main())
+
+    assert [result.url for result in response.results] == URLS
+    assert [result.status for result in response.results] == ["success"] * 5
+    assert (response.unique_urls, response.duplicate_urls) == (3, 2)
+    assert response.dedup_ratio == 0.4
+    assert sorted(fetched_urls) == [
+        "https://a.example/",
+        "https://b.example/page",
+        "https://c.example/",
+    ]
+    assert response.results[0].analysis == response.results[2].analysis
+
+    # 重複したURLの各位置は同じ解析履歴に関連付ける
+    db = SessionLocal()
+    try:
+        positions = {
+            row.position: row.analysis_id
+            for row in db.query(BatchAnalysisUrl).filter(
+                BatchAnalysisUrl.batch_id == response.batch_id
+            )
+        }
+    finally:
+        db.close()
+    assert len(positions) == 5
+    assert positions[0] == positions[2]
+    assert positions[1] == positions[4]
+    assert len(set(positions.values())) == 3
+
+
+def test_streamed_input_reports_every_position(fetched_urls):
+    received = []
+
+    async def on_result(result):
+        received.append(result.url)
+
+    async def main():
+        return await WebsiteAnalyzer().analyze_urls_batch(
+            iterate(URLS), on_result=on_result, collect_results=False
+        )
+
+    response = asyncio.run(main())
+
+    assert response.results == []
+    assert response.total == response.success == 5
+    # 完了した順に届くが、重複を含む全ての入力に1回ずつ結果を返す
+    assert sorted(received) == sorted(URLS)
+    assert len(fetched_urls) == 3
@@ -0,0 +1,223 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.models.database import (
+    AnalysisHistory,
+    BatchAnalysisHistory,
+    BatchAnalysisItem,
+    BatchAnalysisUrl,
+    PageSnapshot,
+    SessionLocal,
+    engine,
+)
+from app.models.schema import AnalysisResponse
+from app.services.analyzer import WebsiteAnalyzer
+from app.services.batch_writer import (
+    BATCH_STATUS_COMPLETED,
+    URL_STATUS_PENDING,
+    BatchResultWriter,
+)
+from app.services.crawler import FetchResult
+from app.services.usage_tracker import UsageBudget
+
+ANALYSIS = {
+    "main_category": "IT・通信",
+    "sub_categories": [{"name": "SaaS", "confidence": 0.8}],
+    "confidence": 0.9,
+}
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_WRITE_CHUNK_SIZE", 3)
+    monkeypatch.setattr(settings, "BATCH_PROGRESS_INTERVAL", 3600)
+
+
+@pytest.fixture
+def statements():
+    """実行したSQL文を記録する"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def open_writer(batch_id, urls):
+    BatchResultWriter.register(batch_id, {})
+    BatchResultWriter.register_urls(batch_id, list(enumerate(urls)))
+    writer = BatchResultWriter(batch_id, UsageBudget())
+    writer.start({})
+    return writer
+
+
+def success(url, history_id=None):
+    return AnalysisResponse(
+        url=url, status="success", analysis=ANALYSIS, history_id=history_id
+    )
+
+
+def test_results_are_written_in_chunks(small_chunks, statements):
+    urls = [f"https://site{i}.example/" for i in range(10)]
+    writer = open_writer("batch_chunks", urls)
+
+    statements.clear()
+    for position, url in enumerate(urls[:3]):
+        writer.add(success(url), position)
+
+    db = SessionLocal()
+    try:
+        # チャンクの件数に達した時点で、進捗と共に書き込む
+        batch = db.get(BatchAnalysisHistory, "batch_chunks")
+        assert batch.processed_count == 3
+        assert db.query(AnalysisHistory).count() == 3
+        inserts = [
+            s for s in statements if s.startswith("INSERT INTO analysis_history")
+        ]
+        assert len(inserts) == 1
+
+        for position, url in enumerate(urls[3:], 3):
+            writer.add(success(url), position)
+        writer.finish()
+
+        db.expire_all()
+        batch = db.get(BatchAnalysisHistory, "batch_chunks")
+        assert batch.status == BATCH_STATUS_COMPLETED
+        assert (batch.processed_count, batch.success_count) == (10, 10)
+        assert db.query(AnalysisHistory).count() == 10
+        assert db.query(BatchAnalysisItem).count() == 10
+        assert (
+            db.query(BatchAnalysisUrl)
+            .filter(BatchAnalysisUrl.status == URL_STATUS_PENDING)
+            .count()
+            == 0
+        )
+    finally:
+        db.close()
+
+
+def test_existing_results_are_linked_once():
+    db = SessionLocal()
+    try:
+        cached = AnalysisHistory(
+            id=AnalysisHistory.generate_id(),
+            url="https://cached.example/",
+            status="success",
+            analysis=ANALYSIS,
+        )
+        db.add(cached)
+        db.commit()
+        cached_id = cached.id
+    finally:
+        db.close()
+
+    urls = ["https://cached.example/", "https://cached.example", "https://new.example/"]
+    writer = open_writer("batch_links", urls)
+    writer.add(success(urls[0], cached_id), 0)
+    writer.add(success(urls[1], cached_id), 1)
+    writer.flush()
+
+    # 再開した場合も、関連付け済みの解析履歴は関連付け直さない
+    resumed = BatchResultWriter("batch_links", UsageBudget())
+    resumed.start({})
+    resumed.add(success(urls[0], cached_id), 0)
+    resumed.add(success(urls[2]), 2)
+    resumed.finish()
+
+    db = SessionLocal()
+    try:
+        links = [
+            analysis_id for (analysis_id,) in db.query(BatchAnalysisItem.analysis_id)
+        ]
+        assert len(links) == 2
+        assert links.count(cached_id) == 1
+        # キャッシュの解析履歴は複製しない
+        assert db.query(AnalysisHistory).count() == 2
+        states = {
+            url.position: url.analysis_id
+            for url in db.query(BatchAnalysisUrl).filter(
+                BatchAnalysisUrl.batch_id == "batch_links"
+            )
+        }
+        assert states[0] == states[1] == cached_id
+    finally:
+        db.close()
+
+
+def test_snapshots_are_upserted_keeping_extracted_text():
+    db = SessionLocal()
+    try:
+        db.add(
+            PageSnapshot(
+                url="https://page.example/", etag='"v1"', content_text="保存済みの本文"
+            )
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    analyzer = WebsiteAnalyzer()
+    writer = open_writer("batch_snapshots", ["https://page.example/"])
+    history = analyzer._history_values(
+        "https://page.example/",
+        "success",
+        result=ANALYSIS,
+        is_batch=True,
+        batch_id="batch_snapshots",
+    )
+    # 本文を取得しなかった場合（再検証で変更なし）は、抽出テキストを上書きしない
+    writer.add_analysis(
+        history,
+        analyzer._snapshot_values(
+            "https://page.example/",
+            FetchResult(status_code=304, etag='"v2"'),
+            None,
+            history["id"],
+        ),
+    )
+    writer.add(success("https://page.example/", history["id"]), 0)
+    writer.finish()
+
+    db = SessionLocal()
+    try:
+        snapshots = db.query(PageSnapshot).all()
+        assert len(snapshots) == 1
+        assert snapshots[0].etag == '"v2"'
+        assert snapshots[0].content_text == "保存済みの本文"
+        assert snapshots[0].history_id == history["id"]
+    finally:
+        db.close()
+
+
+def test_batch_links_cached_results_instead_of_duplicating(fetched_urls):
+    urls = [f"https://site{i}.example/" for i in range(6)]
+
+    async def main():
+        analyzer = WebsiteAnalyzer()
+        first = await analyzer.analyze_urls_batch(urls)
+        second = await analyzer.analyze_urls_batch(urls)
+        return first, second
+
+    first, second = asyncio.run(main())
+
+    assert first.success == second.success == 6
+    assert len(fetched_urls) == 6
+    db = SessionLocal()
+    try:
+        # 2回目はキャッシュの解析履歴を関連付けるだけで、解析履歴を作成しない
+        assert db.query(AnalysisHistory).count() == 6
+        for batch_id in (first.batch_id, second.batch_id):
+            assert (
+                db.query(BatchAnalysisItem)
+                .filter(BatchAnalysisItem.batch_id == batch_id)
+                .count()
+                == 6
+            )
+    finally:
+        db.close()
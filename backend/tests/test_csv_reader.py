@@ -0,0 +1,148 @@
+import asyncio
+import codecs
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.endpoints import analysis
+from app.models.database import BatchAnalysisHistory, SessionLocal
+from app.services.analyzer import WebsiteAnalyzer
+from app.services.batch_writer import BATCH_STATUS_FAILED
+from app.services.job_manager import BatchJobManager
+from app.utils import csv_reader
+from app.utils.csv_reader import (
+    CsvFormatError,
+    CsvUrlReader,
+    clean_url,
+    detect_encoding,
+)
+
+# 引用符が閉じられていない行（以降の行が1つのフィールドになり、上限を超える）
+UNTERMINATED_ROWS = '"https://broken.example/\n' + "https://next.example/\n" * 10000
+
+
+def read_all(data: bytes, column_name="url", rows_per_read=2):
+    async def main():
+        reader = CsvUrlReader(io.BytesIO(data), column_name, rows_per_read)
+        await reader.open()
+        return reader, [url async for url in reader.urls()]
+
+    return asyncio.run(main())
+
+
+def test_detect_encoding():
+    assert detect_encoding(codecs.BOM_UTF8 + "url\n".encode()) == "utf-8-sig"
+    assert detect_encoding("url,名前\n".encode("utf-8")) == "utf-8"
+    assert detect_encoding("url,名前\n".encode("cp932")) == "cp932"
+    # 先頭部分の末尾で途切れたマルチバイト文字はUTF-8の判定を妨げない
+    assert detect_encoding("url,名前".encode("utf-8")[:-1]) == "utf-8"
+
+
+def test_clean_url():
+    assert clean_url(" example.com/a ") == "https://example.com/a"
+    assert clean_url("http://example.com") == "http://example.com"
+    assert clean_url("") is None
+    assert clean_url("ftp://example.com") is None
+    assert clean_url("https://exa mple.com") is None
+    assert clean_url("https://例え�.jp") is None
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "cp932"])
+def test_reads_urls_in_each_encoding(encoding):
+    text = "会社名,url\n株式会社イー,https://e.example/\n①社,f.example\n"
+    reader, urls = read_all(text.encode(encoding))
+
+    assert reader.encoding == encoding
+    assert urls == ["https://e.example/", "https://f.example"]
+
+
+def test_rows_with_bad_bytes_or_wrong_column_count_are_skipped(monkeypatch):
+    # 文字コードは先頭部分で判定するため、後ろの行の不正なバイト列は置き換えて読み飛ばす
+    monkeypatch.setattr(csv_reader, "DETECT_SAMPLE_SIZE", 32)
+    data = (
+        "name,url,note\n"
+        "a,https://a.example/,x\n".encode()
+        + b"b,https://b\xff\xfe.example/,x\n"
+        + "c\n"
+        "d,https://d.example/,x,extra\n"
+        ",,\n"
+        "e,https://e.example/\n".encode()
+    )
+
+    reader, urls = read_all(data)
+
+    assert reader.encoding == "utf-8"
+    assert urls == ["https://a.example/", "https://d.example/", "https://e.example/"]
+    assert reader.row_count == 6
+    assert reader.invalid_count == 1
+
+
+def test_missing_column_is_rejected():
+    with pytest.raises(CsvFormatError):
+        read_all("name,website\na,https://a.example/\n".encode())
+
+
+def test_malformed_row_raises_instead_of_truncating():
+    data = ("url\nhttps://a.example/\n" + UNTERMINATED_ROWS).encode()
+
+    async def main():
+        reader = CsvUrlReader(io.BytesIO(data), "url", rows_per_read=1)
+        await reader.open()
+        urls = []
+        with pytest.raises(CsvFormatError) as error:
+            async for url in reader.urls():
+                urls.append(url)
+        return urls, str(error.value)
+
+    urls, message = asyncio.run(main())
+
+    assert urls == ["https://a.example/"]
+    assert "3行目" in message
+
+
+def test_job_from_malformed_csv_is_marked_failed(fetched_urls):
+    data = ("url\nhttps://a.example/\n" + UNTERMINATED_ROWS).encode()
+
+    async def main():
+        reader = CsvUrlReader(io.BytesIO(data), "url", rows_per_read=1)
+        await reader.open()
+        manager = BatchJobManager(WebsiteAnalyzer())
+        with pytest.raises(CsvFormatError):
+            await manager.submit(reader.urls())
+        return manager
+
+    manager = asyncio.run(main())
+
+    assert not manager._tasks
+    db = SessionLocal()
+    try:
+        (batch,) = db.query(BatchAnalysisHistory).all()
+        assert batch.status == BATCH_STATUS_FAILED
+    finally:
+        db.close()
+
+
+def test_analyze_csv_endpoint_rejects_malformed_files(fetched_urls):
+    app = FastAPI()
+    app.include_router(analysis.router)
+    client = TestClient(app)
+
+    def post(data: bytes, column_name="url"):
+        return client.post(
+            "/analyze-csv",
+            files={"file": ("urls.csv", data, "text/csv")},
+            data={"column_name": column_name},
+        )
+
+    response = post("url\nhttps://a.example/\nb.example\n".encode("cp932"))
+    assert response.status_code == 200
+    assert response.json()["success"] == 2
+
+    assert post(b"name\na\n").status_code == 400
+    assert post(b"url\n\n").status_code == 400
+    assert (
+        post(("url\nhttps://a.example/\n" + UNTERMINATED_ROWS).encode()).status_code
+        == 400
+    )
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models.database import BatchAnalysisHistory, BatchAnalysisUrl, SessionLocal
+from app.models.schema import AnalysisResponse
+from app.services.analyzer import WebsiteAnalyzer
+from app.services.batch_writer import (
+    BATCH_STATUS_COMPLETED,
+    BATCH_STATUS_FAILED,
+    BATCH_STATUS_QUEUED,
+    BATCH_STATUS_RUNNING,
+    URL_STATUS_PENDING,
+    BatchResultWriter,
+    process_owner,
+)
+from app.services.job_manager import BatchJobManager
+from app.services.usage_tracker import UsageBudget
+
+URLS = [f"https://site{i}.example/" for i in range(4)]
+
+
+def create_batch(batch_id, status, heartbeat_at, owner="other-host:1:dead", done=0):
+    """
+    一括解析の履歴を作成する（先頭の done 件は解析済みにする）
+    """
+    BatchResultWriter.register(batch_id, {})
+    BatchResultWriter.register_urls(batch_id, list(enumerate(URLS)))
+    if done:
+        writer = BatchResultWriter(batch_id, UsageBudget())
+        writer.start({})
+        for position, url in enumerate(URLS[:done]):
+            writer.add(AnalysisResponse(url=url, status="failed", error="x"), position)
+        writer.flush()
+
+    db = SessionLocal()
+    try:
+        batch = db.get(BatchAnalysisHistory, batch_id)
+        batch.status = status
+        batch.owner = owner
+        batch.heartbeat_at = heartbeat_at
+        db.commit()
+    finally:
+        db.close()
+
+
+def load(batch_id):
+    db = SessionLocal()
+    try:
+        return db.get(BatchAnalysisHistory, batch_id)
+    finally:
+        db.close()
+
+
+def expired():
+    return datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS + 60)
+
+
+async def wait_for_jobs(manager):
+    while manager._tasks:
+        await asyncio.sleep(0.01)
+
+
+def test_submit_returns_at_once_and_runs_in_the_background(fetched_urls):
+    urls = URLS + [URLS[0]]
+
+    async def main():
+        manager = BatchJobManager(WebsiteAnalyzer())
+        submitted = await manager.submit(urls)
+        await wait_for_jobs(manager)
+        db = SessionLocal()
+        try:
+            results = await manager.get_job_results(db, submitted.job_id)
+        finally:
+            db.close()
+        return submitted, results
+
+    submitted, results = asyncio.run(main())
+
+    assert submitted.status == BATCH_STATUS_QUEUED
+    assert submitted.total_urls == 5
+    batch = load(submitted.job_id)
+    assert batch.status == BATCH_STATUS_COMPLETED
+    assert (batch.total_urls, batch.processed_count) == (5, 5)
+    assert batch.owner == process_owner()
+    # 結果は入力の順に、入力したURLと位置で返す（重複は解析を共有する）
+    assert [(item.position, item.url) for item in results.results] == list(
+        enumerate(urls)
+    )
+    assert results.results[0].id == results.results[4].id
+    assert len(fetched_urls) == 4
+
+
+def test_recovery_only_fails_expired_leases():
+    create_batch("batch_expired", BATCH_STATUS_RUNNING, expired())
+    create_batch("batch_live", BATCH_STATUS_RUNNING, datetime.utcnow())
+    create_batch("batch_queued", BATCH_STATUS_QUEUED, None)
+
+    BatchJobManager(WebsiteAnalyzer()).recover_interrupted()
+
+    assert load("batch_expired").status == BATCH_STATUS_FAILED
+    assert load("batch_queued").status == BATCH_STATUS_FAILED
+    # 他のプロセスがリースを更新している一括解析には触れない
+    assert load("batch_live").status == BATCH_STATUS_RUNNING
+
+
+def test_expired_job_is_reclaimed_and_resumes_pending_urls(monkeypatch, fetched_urls):
+    monkeypatch.setattr(settings, "JOB_AUTO_RESUME", True)
+    create_batch("batch_crashed", BATCH_STATUS_RUNNING, expired(), done=2)
+
+    async def main():
+        manager = BatchJobManager(WebsiteAnalyzer())
+        manager.recover_interrupted()
+        assert "batch_crashed" in manager._tasks
+        await wait_for_jobs(manager)
+
+    asyncio.run(main())
+
+    batch = load("batch_crashed")
+    assert batch.status == BATCH_STATUS_COMPLETED
+    assert batch.owner == process_owner()
+    assert (batch.processed_count, batch.success_count, batch.failed_count) == (
+        4,
+        2,
+        2,
+    )
+    # 結果が確定していたURLは解析し直さない
+    assert sorted(fetched_urls) == URLS[2:]
+    db = SessionLocal()
+    try:
+        assert (
+            db.query(BatchAnalysisUrl)
+            .filter(BatchAnalysisUrl.status == URL_STATUS_PENDING)
+            .count()
+            == 0
+        )
+    finally:
+        db.close()
+
+
+def test_resume_claims_a_failed_job_once(fetched_urls):
+    create_batch("batch_failed", BATCH_STATUS_FAILED, expired(), done=1)
+
+    async def main():
+        first = BatchJobManager(WebsiteAnalyzer())
+        second = BatchJobManager(WebsiteAnalyzer())
+        resumed = first.resume("batch_failed")
+        with pytest.raises(ValueError):
+            second.resume("batch_failed")
+        assert not second._tasks
+        await wait_for_jobs(first)
+        return resumed
+
+    resumed = asyncio.run(main())
+
+    assert resumed.pending_urls == 3
+    assert load("batch_failed").status == BATCH_STATUS_COMPLETED
+    assert sorted(fetched_urls) == URLS[1:]
+
+
+def test_resume_rejects_jobs_that_cannot_be_resumed():
+    create_batch("batch_running", BATCH_STATUS_RUNNING, datetime.utcnow())
+    create_batch("batch_done", BATCH_STATUS_FAILED, expired(), done=4)
+    manager = BatchJobManager(WebsiteAnalyzer())
+
+    assert manager.resume("batch_missing") is None
+    with pytest.raises(ValueError):
+        manager.resume("batch_running")
+    with pytest.raises(ValueError):
+        manager.resume("batch_done")
+
+
+def test_heartbeat_renews_only_own_leases():
+    stale = expired()
+    create_batch("batch_own", BATCH_STATUS_RUNNING, stale, owner=process_owner())
+    create_batch("batch_other", BATCH_STATUS_RUNNING, stale)
+
+    BatchJobManager(WebsiteAnalyzer())._renew_leases()
+
+    assert load("batch_own").heartbeat_at > stale
+    assert load("batch_other").heartbeat_at == stale
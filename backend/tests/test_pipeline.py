@@ -0,0 +1,204 @@
+import asyncio
+from collections import defaultdict
+
+from app.services.pipeline import PipelineStage, iter_chunks, run_pipeline
+
+
+def collector():
+    """最後の段で受け取った項目を記録する段"""
+    received = []
+
+    async def collect(item):
+        received.append(item)
+
+    return collect, received
+
+
+def test_items_flow_through_every_stage():
+    async def double(item):
+        return item * 2
+
+    async def add_one(items):
+        return [item + 1 for item in items]
+
+    collect, received = collector()
+    stats = asyncio.run(
+        run_pipeline(
+            range(100),
+            [
+                PipelineStage("double", double, workers=3, queue_size=2),
+                PipelineStage("add", add_one, workers=1, queue_size=2, batch_size=8),
+                PipelineStage("collect", collect, workers=4, queue_size=2),
+            ],
+        )
+    )
+
+    assert sorted(received) == [i * 2 + 1 for i in range(100)]
+    for name in ("double", "add", "collect"):
+        assert stats[name]["processed"] == 100
+        assert stats[name]["errors"] == 0
+        # 段の間のキューは上限を超えない
+        assert stats[name]["max_queue"] <= 2
+    assert stats["add"]["batches"] < 100
+
+
+def test_skipped_items_are_passed_through():
+    async def fail(item):
+        raise AssertionError("呼び出されない")
+
+    collect, received = collector()
+    stats = asyncio.run(
+        run_pipeline(
+            range(10),
+            [
+                PipelineStage(
+                    "skip", fail, workers=2, queue_size=1, skip=lambda _: True
+                ),
+                PipelineStage("collect", collect, workers=1, queue_size=1),
+            ],
+        )
+    )
+
+    assert sorted(received) == list(range(10))
+    assert stats["skip"]["processed"] == 0
+
+
+def test_pipeline_finishes_when_handlers_raise():
+    async def fail_odd(item):
+        if item % 2:
+            raise ValueError("奇数は処理できません")
+        return item
+
+    async def fail_batch(items):
+        if 10 in items:
+            raise ValueError("10を含むバッチは処理できません")
+        return items
+
+    async def fail_key(item):
+        if item == 20:
+            raise ValueError("20は処理できません")
+        return item
+
+    collect, received = collector()
+    stages = [
+        PipelineStage("odd", fail_odd, workers=3, queue_size=1),
+        PipelineStage("batch", fail_batch, workers=2, queue_size=1, batch_size=1),
+        PipelineStage(
+            "keyed", fail_key, workers=2, queue_size=1, key=lambda item: str(item % 3)
+        ),
+        PipelineStage("collect", collect, workers=1, queue_size=1),
+    ]
+    stats = asyncio.run(asyncio.wait_for(run_pipeline(range(30), stages), 5))
+
+    # 失敗した項目は以降の段に渡さず、残りの項目は最後まで処理する
+    assert sorted(received) == [i for i in range(0, 30, 2) if i not in (10, 20)]
+    assert stats["odd"]["errors"] == 15
+    assert stats["batch"]["errors"] == 1
+    assert stats["keyed"]["errors"] == 1
+
+
+def test_cancelling_the_pipeline_stops_every_worker():
+    async def slow(item):
+        await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.ensure_future(
+            run_pipeline(
+                range(10),
+                [
+                    PipelineStage("slow", slow, workers=2, queue_size=1),
+                    PipelineStage("keyed", slow, workers=2, queue_size=1, key=str),
+                ],
+            )
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(main()) == []
+
+
+def test_keyed_stage_limits_each_key_without_blocking_others():
+    active = defaultdict(int)
+    peak = defaultdict(int)
+    finished = []
+
+    async def fetch(item):
+        host, _ = item
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.02)
+        active[host] -= 1
+        finished.append(item)
+
+    # 1つのドメインのURLが先に続いても、他のドメインのURLを待たせない
+    items = [("slow.example", i) for i in range(10)] + [
+        ("fast.example", i) for i in range(3)
+    ]
+    stats = asyncio.run(
+        run_pipeline(
+            items,
+            [
+                PipelineStage(
+                    "fetch",
+                    fetch,
+                    workers=4,
+                    queue_size=1,
+                    key=lambda item: item[0],
+                    per_key=2,
+                    lookahead=20,
+                )
+            ],
+        )
+    )
+
+    assert len(finished) == 13
+    assert peak["slow.example"] == 2
+    assert peak["fast.example"] == 2
+    last_fast = max(
+        index for index, item in enumerate(finished) if item[0] == "fast.example"
+    )
+    assert last_fast < 8
+    assert stats["fetch"]["max_queue"] <= 20
+
+
+def test_keyed_stage_bounds_items_held_back():
+    async def hold(item):
+        await asyncio.sleep(0.001)
+
+    stats = asyncio.run(
+        run_pipeline(
+            range(50),
+            [
+                PipelineStage(
+                    "hold",
+                    hold,
+                    workers=1,
+                    queue_size=1,
+                    key=lambda _: "same.example",
+                    lookahead=3,
+                )
+            ],
+        )
+    )
+
+    assert stats["hold"]["processed"] == 50
+    assert stats["hold"]["max_queue"] <= 3
+
+
+def test_iter_chunks_accepts_async_iterables():
+    async def numbers():
+        for i in range(7):
+            yield i
+
+    async def main():
+        return [chunk async for chunk in iter_chunks(numbers(), 3)], [
+            chunk async for chunk in iter_chunks(range(4), 0)
+        ]
+
+    chunks, single = asyncio.run(main())
+
+    assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
+    assert single == [[0], [1], [2], [3]]
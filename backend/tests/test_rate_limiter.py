@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.fake_client import FakeAPIError
+from app.services.rate_limiter import RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_MAX", 0.01)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 3)
+
+
+def flaky(status_codes):
+    """指定したステータスコードのエラーを順に発生させた後に成功する呼び出し"""
+    attempts = []
+
+    async def operation():
+        attempts.append(len(attempts))
+        if len(attempts) <= len(status_codes):
+            status_code = status_codes[len(attempts) - 1]
+            raise FakeAPIError(status_code, f"擬似エラー ({status_code})")
+        return "ok"
+
+    return operation, attempts
+
+
+def test_token_bucket_waits_until_refilled():
+    bucket = TokenBucket(60)
+    bucket.consume(60)
+
+    assert bucket.wait_time(1, 1.0) == pytest.approx(1.0)
+    # 補充速度を下げている間は待機が長くなる
+    assert bucket.wait_time(1, 0.5) == pytest.approx(2.0)
+
+    bucket.updated_at -= 0.5
+    bucket.refill(1.0)
+    assert bucket.tokens == pytest.approx(0.5, abs=0.05)
+
+
+def test_token_bucket_caps_large_requests_at_capacity():
+    bucket = TokenBucket(10)
+
+    # 上限を超える要求は満杯になれば通す（永久に待たせない）
+    assert bucket.wait_time(100, 1.0) == 0.0
+    bucket.consume(100)
+    # 上限を超えて消費した分は、満杯まで補充されるのを待つ
+    assert bucket.wait_time(100, 1.0) == pytest.approx(100 / (10 / 60))
+
+
+def test_record_usage_settles_the_estimate():
+    limiter = RateLimiter("test", 60, 1000)
+
+    asyncio.run(limiter.acquire(400))
+    assert limiter.stats()["available_tokens"] == 600
+    assert limiter.stats()["available_requests"] == 59
+
+    limiter.record_usage(400, 900)
+    assert limiter.stats()["available_tokens"] == 100
+
+    # 実績が取得できなかった場合は見込みのままにする
+    limiter.record_usage(400, 0)
+    assert limiter.stats()["available_tokens"] == 100
+
+
+def test_call_retries_rate_limits_and_slows_refill(fast_backoff):
+    limiter = RateLimiter("test", 600, 100000)
+    operation, attempts = flaky([429, 429])
+
+    assert asyncio.run(limiter.call(operation, 100)) == "ok"
+
+    assert len(attempts) == 3
+    # 429のたびに半減し、成功すると少し戻す
+    assert limiter.stats()["rate_scale"] == pytest.approx(0.25 + 0.02)
+
+
+def test_call_retries_server_errors_without_slowing_refill(fast_backoff):
+    limiter = RateLimiter("test", 600, 100000)
+    operation, attempts = flaky([500, 503])
+
+    assert asyncio.run(limiter.call(operation, 100)) == "ok"
+
+    assert len(attempts) == 3
+    assert limiter.stats()["rate_scale"] == 1.0
+
+
+def test_call_does_not_retry_client_errors(fast_backoff):
+    limiter = RateLimiter("test", 600, 100000)
+    operation, attempts = flaky([400])
+
+    with pytest.raises(FakeAPIError):
+        asyncio.run(limiter.call(operation, 100))
+    assert len(attempts) == 1
+
+
+def test_call_gives_up_after_max_retries(fast_backoff):
+    limiter = RateLimiter("test", 600, 100000)
+    operation, attempts = flaky([500] * 10)
+
+    with pytest.raises(FakeAPIError):
+        asyncio.run(limiter.call(operation, 100))
+    assert len(attempts) == settings.LLM_MAX_RETRIES + 1
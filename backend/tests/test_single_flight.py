@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def counting(result="done", delay=0.05, error=None):
+    """呼び出し回数を数える処理"""
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+
+    return operation, calls
+
+
+def test_concurrent_callers_share_one_execution():
+    async def main():
+        flight = SingleFlight("test")
+        operation, calls = counting()
+        other, other_calls = counting("other")
+
+        results = await asyncio.gather(
+            *[flight.run("a", operation) for _ in range(5)], flight.run("b", other)
+        )
+        return flight, results, calls, other_calls
+
+    flight, results, calls, other_calls = asyncio.run(main())
+
+    assert results == ["done"] * 5 + ["other"]
+    assert len(calls) == 1
+    assert len(other_calls) == 1
+    assert flight.get("a") is None
+
+
+def test_error_is_shared_and_key_is_released():
+    async def main():
+        flight = SingleFlight("test")
+        operation, calls = counting(error=ValueError("失敗"))
+
+        results = await asyncio.gather(
+            *[flight.run("a", operation) for _ in range(3)], return_exceptions=True
+        )
+
+        # 失敗した後は新たに実行する
+        retry, retry_calls = counting()
+        return results, calls, await flight.run("a", retry), retry_calls
+
+    results, calls, retried, retry_calls = asyncio.run(main())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 1
+    assert retried == "done"
+    assert len(retry_calls) == 1
+
+
+def test_waiter_timeout_does_not_cancel_the_shared_operation():
+    async def main():
+        flight = SingleFlight("test")
+        operation, calls = counting(delay=0.1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.run("a", operation, timeout=0.01)
+
+        # 呼び出し元が離脱しても、処理のタスクは完了まで保持される
+        assert len(flight._tasks) == 1
+        future = flight.get("a")
+        assert future is not None
+        return flight, await flight.wait(future), calls
+
+    flight, result, calls = asyncio.run(main())
+
+    assert result == "done"
+    assert len(calls) == 1
+    assert not flight._tasks
+    assert flight.get("a") is None
+
+
+def test_cancelled_operation_settles_waiters():
+    async def main():
+        flight = SingleFlight("test")
+        operation, _ = counting(delay=10)
+
+        waiters = [asyncio.ensure_future(flight.run("a", operation)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        (task,) = flight._tasks
+        task.cancel()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(main())
+
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert flight.get("a") is None
+
+
+def test_claim_and_resolve():
+    async def main():
+        flight = SingleFlight("test")
+        future = flight.claim("a")
+        assert future is not None
+        # 実行中の処理がある間は担当できない
+        assert flight.claim("a") is None
+
+        waiter = asyncio.ensure_future(flight.wait(flight.get("a")))
+        flight.resolve("a", future, result="done")
+        # 設定済みの Future に再度設定しても無視する
+        flight.resolve("a", future, error=ValueError("失敗"))
+        return flight, await waiter
+
+    flight, result = asyncio.run(main())
+
+    assert result == "done"
+    assert flight.get("a") is None
+
+
+def test_concurrent_analyses_of_the_same_url_fetch_once(fetched_urls):
+    from app.services.analyzer import WebsiteAnalyzer
+
+    async def main():
+        analyzer = WebsiteAnalyzer()
+        return await asyncio.gather(
+            analyzer.analyze_url("https://example.com/"),
+            analyzer.analyze_url("https://example.com"),
+            analyzer.analyze_url("https://example.com/"),
+        )
+
+    responses = asyncio.run(main())
+
+    assert [response.status for response in responses] == ["success"] * 3
+    assert len({response.history_id for response in responses}) == 1
+    # 共有した結果は、呼び出し元が指定したURLで返す
+    assert responses[1].url == "https://example.com"
+    assert fetched_urls == ["https://example.com/"]